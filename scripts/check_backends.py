@@ -0,0 +1,114 @@
+"""
+    Runs each kernel with the numpy and the numba backend on the same random
+    inputs and checks that the results match (see slam.backend). Exits with
+    an error if they don't, or if numba is not installed.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# check the checkout this script is in, whether slam is installed or not
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from slam import backend
+from slam._map import integrate_odometry, splat_values
+from slam.geometry import points_in_polygons, rays_segments_intersection
+
+SEED: int = 0
+N_REPEATS: int = 5
+
+
+def rays_inputs(rng: np.random.Generator) -> tuple:
+    p0 = rng.uniform(0, 50, (64, 2))
+    p1 = p0 + rng.uniform(-20, 20, (64, 2))
+    segments = rng.uniform(0, 50, (40, 4))
+    segments[:5, 3] = segments[:5, 1]  # horizontal
+    segments[5:10, 2] = segments[5:10, 0]  # vertical
+    return p0, p1, segments
+
+
+def polygons_inputs(rng: np.random.Generator) -> tuple:
+    # n random polygons, each given by its closed ring of edges
+    n, n_vertices = 6, 8
+    segments, owners = [], []
+    for polygon in range(n):
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        radii = rng.uniform(2, 10, n_vertices)
+        center = rng.uniform(10, 40, 2)
+        ring = center + np.column_stack(
+            [radii * np.cos(angles), radii * np.sin(angles)]
+        )
+        segments.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+        owners.extend([polygon] * n_vertices)
+    points = rng.uniform(0, 50, (500, 2))
+    return points, np.vstack(segments), np.array(owners), n
+
+
+def splat_inputs(rng: np.random.Generator) -> tuple:
+    # events grouped by cell, as built by Map.get_grid_map
+    n_events, n_cells = 20_000, 2_000
+    inverse = np.sort(rng.integers(0, n_cells, n_events))
+    inverse = np.unique(inverse, return_inverse=True)[1].ravel()
+    initial = rng.normal(0.5, 1, n_events)
+    delta = rng.normal(0.2, 1, n_events)
+    first = np.flatnonzero(np.diff(inverse, prepend=-1))
+    return inverse, initial, delta, first
+
+
+def odometry_inputs(rng: np.random.Generator) -> tuple:
+    n_steps = 10_000
+    speed = rng.uniform(0, 3, n_steps)
+    omega = rng.normal(0, 10, n_steps)
+    return 20.0, 10.0, float(rng.uniform(0, 360)), speed, omega
+
+
+KERNELS = (
+    (rays_segments_intersection, rays_inputs),
+    (points_in_polygons, polygons_inputs),
+    (splat_values, splat_inputs),
+    (integrate_odometry, odometry_inputs),
+)
+
+
+def run(backend_name: str, kernel, inputs: tuple) -> tuple:
+    backend.set_backend(backend_name)
+    try:
+        result = kernel(*inputs)
+    finally:
+        backend.set_backend("numpy")
+    return result if isinstance(result, tuple) else (result,)
+
+
+def matches(expected: tuple, result: tuple) -> bool:
+    return all(
+        np.array_equal(a, b)
+        if a.dtype == bool
+        else np.allclose(a, b, equal_nan=True)
+        for a, b in zip(expected, result)
+    )
+
+
+if __name__ == "__main__":
+    try:
+        backend.set_backend("numba")
+    except ImportError:
+        print("numba is not installed: cannot check the numba backend")
+        sys.exit(1)
+    backend.set_backend("numpy")
+
+    rng = np.random.default_rng(SEED)
+    failed = []
+    for kernel, make_inputs in KERNELS:
+        ok = True
+        for _ in range(N_REPEATS):
+            inputs = make_inputs(rng)
+            ok &= matches(
+                run("numpy", kernel, inputs), run("numba", kernel, inputs)
+            )
+        print(f"{kernel.__name__}: {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failed.append(kernel.__name__)
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,75 @@
+"""
+    Runs the same agent with noisy odometry in a few environments, once
+    trusting the odometry and once localizing it with a particle filter (as
+    in run_localization.py), and checks that the particle filter's mean
+    error from the real trajectory is lower.
+"""
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+# check the checkout this script is in, whether slam is installed or not
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from slam import Environment, Agent, LidarSensor
+from slam.localization import ParticleFilter
+from slam.log import logger
+
+SEEDS = range(8)
+N_STEPS = 600
+
+
+def trajectory_error(seed: int, localize: bool) -> float:
+    env = Environment(seed=seed)
+    rng = env.spawn_rng()  # in both runs, so that the agents move the same
+    agent = Agent(
+        env,
+        x=20,
+        y=10,
+        angle=0,
+        lidar=LidarSensor.sweep(90, max_range=20, noise_std=0.1),
+        odometry_noise=(0.05, 2),
+        localizer=ParticleFilter(2000, speed_std=0.05, omega_std=2, rng=rng)
+        if localize
+        else None,
+    )
+    for _ in range(N_STEPS):
+        agent.update()
+    agent.map.build()
+
+    # the map's frame is centered on the agent's initial pose
+    x = np.array(agent.map.agent_trajectory["x"]) + agent.trajectory["x"][0]
+    y = np.array(agent.map.agent_trajectory["y"]) + agent.trajectory["y"][0]
+    return float(
+        np.hypot(
+            x - np.array(agent.trajectory["x"]),
+            y - np.array(agent.trajectory["y"]),
+        ).mean()
+    )
+
+
+if __name__ == "__main__":
+    logger.remove()
+
+    errors = []
+    for seed in SEEDS:
+        t0 = perf_counter()
+        odometry, particle_filter = (
+            trajectory_error(seed, False),
+            trajectory_error(seed, True),
+        )
+        errors.append((odometry, particle_filter))
+        print(
+            f"seed {seed}: odometry {odometry:.2f}, particle filter "
+            f"{particle_filter:.2f} ({perf_counter() - t0:.1f} s)"
+        )
+
+    odometry, particle_filter = np.mean(errors, axis=0)
+    print(
+        f"mean error: odometry {odometry:.2f}, "
+        f"particle filter {particle_filter:.2f}"
+    )
+    if particle_filter >= odometry:
+        sys.exit(1)
@@ -0,0 +1,47 @@
+"""
+    Measures how long a headless `import slam` takes in a fresh interpreter
+    and checks that it stays within budget and doesn't pull in the
+    drawing/graph dependencies.
+"""
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET: float = 0.25  # seconds
+N_REPEATS: int = 5
+HEAVY_MODULES = (
+    "matplotlib",
+    "pandas",
+    "libpysal",
+    "networkx",
+    "scipy",
+    "loguru",
+    "kino",
+    "rich",
+    "numba",
+    "myterial",
+)
+
+CODE = f"""
+import sys, time
+t0 = time.perf_counter()
+import slam
+print(time.perf_counter() - t0)
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+
+durations = []
+for i in range(N_REPEATS):
+    output = subprocess.run(
+        [sys.executable, "-c", CODE], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    durations.append(float(output[0]))
+    loaded = [m for m in output[1].split(",") if m] if len(output) > 1 else []
+
+duration = min(durations)
+print(f"import slam: {duration * 1000:.1f} ms (budget: {IMPORT_TIME_BUDGET * 1000:.0f} ms)")
+if loaded:
+    print(f"Heavy modules imported: {loaded}")
+
+if duration > IMPORT_TIME_BUDGET or loaded:
+    sys.exit(1)
@@ -0,0 +1,44 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from loguru import logger
+
+from fcutils.progress import track
+
+from slam import Environment, Agent, Recorder, Replayer
+
+
+RUN_PATH = "recorded_run"
+N_STEPS = 500
+
+# create env
+env = Environment()
+
+# create agent and record its run
+with Recorder(RUN_PATH, chunk_size=100) as recorder:
+    agent = Agent(
+        env, x=20, y=10, angle=np.random.uniform(10, 80), recorder=recorder
+    )
+
+    for i in track(range(N_STEPS)):
+        agent.update()
+
+        # check termination conditions
+        if env.out_of_bounds(agent.COM):
+            logger.warning("Agent out of bounds")
+            break
+        elif env.is_point_in_obstacle(agent.COM):
+            logger.warning("Agent is in an obstacle")
+            break
+
+# replay the map at a few time points
+replay = Replayer(RUN_PATH)
+steps = np.linspace(0, len(replay) - 1, 4).astype(int)
+
+f, axes = plt.subplots(figsize=(20, 6), ncols=len(steps))
+for ax, step in zip(axes, steps):
+    replay.map_at(step).draw(ax)
+    ax.axis("equal")
+    ax.set(title=f"map at step {step}")
+
+f.tight_layout()
+plt.show()
@@ -0,0 +1,55 @@
+"""
+    Runs the same agent with noisy odometry twice, once trusting the odometry
+    and once localizing it with a particle filter, and compares the
+    reconstructed trajectories with the real one.
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+
+from fcutils.progress import track
+
+from slam import Environment, Agent, LidarSensor
+from slam.localization import ParticleFilter
+
+N_STEPS = 600
+
+f, axes = plt.subplots(figsize=(20, 10), ncols=2)
+for ax, localize in zip(axes, (False, True)):
+    env = Environment(seed=0)
+    rng = env.spawn_rng()  # in both runs, so that the agents move the same
+    localizer = (
+        ParticleFilter(2000, speed_std=0.05, omega_std=2, rng=rng)
+        if localize
+        else None
+    )
+    agent = Agent(
+        env,
+        x=20,
+        y=10,
+        angle=0,
+        lidar=LidarSensor.sweep(90, max_range=20, noise_std=0.1),
+        odometry_noise=(0.05, 2),
+        localizer=localizer,
+    )
+    for i in track(range(N_STEPS)):
+        agent.update()
+    agent.map.build()
+
+    # the map's frame is centered on the agent's initial pose (which is
+    # moved if (20, 10) is inside an obstacle)
+    x = np.array(agent.map.agent_trajectory["x"]) + agent.trajectory["x"][0]
+    y = np.array(agent.map.agent_trajectory["y"]) + agent.trajectory["y"][0]
+    error = np.hypot(
+        x - np.array(agent.trajectory["x"]), y - np.array(agent.trajectory["y"])
+    )
+
+    env.draw(ax)
+    ax.plot(agent.trajectory["x"], agent.trajectory["y"], color="k", label="real")
+    ax.plot(x, y, color="r", label="reconstructed")
+    ax.set(
+        title=("particle filter" if localizer else "odometry")
+        + f" - mean error: {error.mean():.2f}"
+    )
+    ax.legend()
+
+plt.show()
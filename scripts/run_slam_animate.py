@@ -1,5 +1,4 @@
 import matplotlib.pyplot as plt
-from celluloid import Camera
 import numpy as np
 from loguru import logger
 from rich.prompt import Confirm
@@ -7,6 +6,7 @@ from rich.prompt import Confirm
 from fcutils.progress import track
 
 from slam import Environment, Agent
+from slam.render import Renderer, VideoSink
 
 
 DRAW_EVERY = 1
@@ -28,27 +28,16 @@ print("Is the starting configuration OK?")
 plt.show()
 
 if Confirm.ask("Continue?"):
-    f, axes = plt.subplots(figsize=(20, 10), ncols=2)
-    cam = Camera(f)
-    f.tight_layout()
+    renderer = Renderer(agent)
 
-    # run simulation
-    for i in track(range(N_FRAMES)):
-        # move/update agent
-        agent.update()
+    # run simulation, streaming frames to the video file
+    with VideoSink("animation.mp4", fps=25 // DRAW_EVERY) as video:
+        for i in track(range(N_FRAMES)):
+            # move/update agent
+            agent.update()
 
-        if i % DRAW_EVERY == 0:
-            # draw environment
-            env.draw(axes[0])
-
-            # move and draw agent and amp
-            agent.map.build()
-            agent.draw(axes[0])
-            agent.map.draw(axes[1])
-            agent.planner.draw(axes[1])
-
-            # snap
-            cam.snap()
+            if i % DRAW_EVERY == 0:
+                video.write(renderer.render())
 
             # check termination conditions
             if env.out_of_bounds(agent.COM):
@@ -57,9 +46,3 @@ if Confirm.ask("Continue?"):
             elif env.is_point_in_obstacle(agent.COM):
                 logger.warning("Agent is in an obstacle")
                 break
-
-    axes[0].set(title="world view")
-    axes[1].set(title="agent view")
-
-    animation = cam.animate(interval=40 * DRAW_EVERY)
-    animation.save("animation.mp4")
@@ -0,0 +1,39 @@
+"""
+    Runs the same agent with SLAM done in the control loop and in
+    a background thread, and compares how long each control step takes and
+    how long it takes for an observation to be in the map.
+"""
+from time import perf_counter
+import numpy as np
+
+from fcutils.progress import track
+
+from slam import Environment, Agent
+
+N_STEPS = 1000
+
+for asynchronous in (False, True):
+    env = Environment(seed=0)
+    agent = Agent(env, x=20, y=10, angle=0, asynchronous=asynchronous)
+    worker = agent.worker
+
+    step_times = []
+    for i in track(range(N_STEPS)):
+        start = perf_counter()
+        agent.update()
+        step_times.append(perf_counter() - start)
+    agent.close()
+
+    step_times = np.array(step_times) * 1000
+    print(
+        ("asynchronous" if asynchronous else "synchronous")
+        + f" - step time: median {np.median(step_times):.2f}ms, "
+        f"99th percentile {np.percentile(step_times, 99):.2f}ms, "
+        f"max {step_times.max():.2f}ms"
+    )
+    if asynchronous:
+        latencies = np.array(worker.latencies) * 1000
+        print(
+            f"    observation to map latency: median "
+            f"{np.median(latencies):.1f}ms, max {latencies.max():.1f}ms"
+        )
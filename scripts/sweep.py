@@ -0,0 +1,51 @@
+"""
+    Tunes how often the map is built and how far the lidar sees: random
+    configurations are pruned with successive halving and the Pareto front
+    of coverage against CPU time per step is printed and plotted. Runs are
+    cached, so running the script again only runs what changed.
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+
+from slam.cache import RunCache
+from slam.sweep import Sweep, pareto_front
+
+if __name__ == "__main__":
+    sweep = Sweep(
+        {
+            "Agent.update_map_every": [10, 25, 50, 100, 250, 1000],
+            "Agent.ray_length": (8, 20),
+            "Agent.collision_distance": (4, 8),
+            "Map.confidence_threshold": (0.5, 3.0),
+        },
+        n_steps=2000,
+        seeds=(0, 1),
+        cache=RunCache(max_bytes=2 ** 30),
+    )
+    trials = sweep.run(
+        sweep.random(27, np.random.default_rng(0)), eta=3, min_steps=250
+    )
+
+    final = [t for t in trials if t.n_steps == sweep.n_steps]
+    front = pareto_front(final)
+    print("Pareto front:")
+    for trial in front:
+        print(f"    {trial}")
+
+    f, ax = plt.subplots(figsize=(8, 8))
+    ax.scatter(
+        [t.time_per_step * 1000 for t in final],
+        [t.coverage for t in final],
+        color="k",
+        label="trials",
+    )
+    ax.plot(
+        [t.time_per_step * 1000 for t in front],
+        [t.coverage for t in front],
+        "o-",
+        color="r",
+        label="Pareto front",
+    )
+    ax.set(xlabel="CPU time per step (ms)", ylabel="coverage")
+    ax.legend()
+    plt.show()
@@ -2,15 +2,17 @@ import matplotlib.pyplot as plt
 
 
 from slam import Environment, Agent
-from slam.obstacle import Obstacle
+from slam.obstacle import Obstacle, PolygonObstacle, CircleObstacle
 
-f, axes = plt.subplots(figsize=(12, 9), ncols=2, nrows=2)
+f, axes = plt.subplots(figsize=(12, 9), ncols=3, nrows=2)
 axes = axes.flatten()
 
 # create environment
 env = Environment(n_obstacles=0)
 env.obstacles += [
-    Obstacle((30, 30), angle=20, width=5, height=10, name="test")
+    Obstacle((30, 30), angle=20, width=5, height=10, name="test"),
+    PolygonObstacle([(60, 60), (75, 62), (70, 75), (62, 70)], name="polygon"),
+    CircleObstacle((40, 70), 6, name="circle"),
 ]
 
 # create agents
@@ -19,6 +21,8 @@ agents = [
     Agent(env, x=25, y=25, angle=45),
     Agent(env, x=45, y=40, angle=180),
     Agent(env, x=28, y=50, angle=270),
+    Agent(env, x=55, y=65, angle=0),
+    Agent(env, x=40, y=58, angle=90),
 ]
 for ax, agent in zip(axes, agents):
 
@@ -9,6 +9,7 @@ requirements = [
     "numpy",
     "matplotlib",
     "rich",
+    "scipy",
 ]
 
 setup(
@@ -30,7 +31,7 @@ setup(
         "Intended Audience :: Science/Research",
     ],
     install_requires=requirements,
-    extras_require={},
+    extras_require={"numba": ["numba"]},
     python_requires=">=3.6",
     packages=find_namespace_packages(exclude=("tests, examples")),
     entry_points={"console_scripts": []},
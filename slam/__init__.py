@@ -1,5 +1,9 @@
 from slam.environment import Environment, Wall, Small, BigBox, Torus
+from slam.world import ChunkedWorld
+from slam.floorplan import FloorPlan
 
-from slam.ray import Ray
+from slam.lidar import LidarSensor
 
 from slam.agent import Agent
+
+from slam.recorder import Recorder, Replayer
@@ -1,7 +1,13 @@
-import matplotlib.pyplot as plt
+import numpy as np
 from dataclasses import dataclass
+from typing import Sequence, Tuple, TYPE_CHECKING
 
-from myterial import red_dark, blue_dark
+from slam.colors import red_dark, blue_dark
+
+from slam.backend import kernel
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
 
 
 @dataclass
@@ -17,9 +23,11 @@ class Gaussian:
     distance: float
     angle_delta: int
 
-    def draw(self, ax: plt.Axes):
+    def draw(self, ax: "plt.Axes"):
+        from matplotlib.patches import Circle
+
         ax.add_artist(
-            plt.Circle(
+            Circle(
                 self.point.xy,  # type: ignore
                 1,
                 color=blue_dark if self.mean < 0 else red_dark,
@@ -48,3 +56,111 @@ class GridPoint:
             return 0
         else:
             return 1
+
+
+def rasterize(
+    xy: np.ndarray, values: np.ndarray
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+        Given the (integer) coordinates of N grid points and their values,
+        returns a 2D array (indexed as [y, x], NaN where there's no grid point)
+        with the values and the (x, y) coordinates of the array's first element.
+    """
+    if not len(xy):
+        return np.full((0, 0), np.nan), (0, 0)
+
+    xy = np.asarray(xy).astype(np.int64)
+    origin = xy.min(axis=0)
+    width, height = xy.max(axis=0) - origin + 1
+
+    grid = np.full((height, width), np.nan)
+    grid[xy[:, 1] - origin[1], xy[:, 0] - origin[0]] = values
+    return grid, (int(origin[0]), int(origin[1]))
+
+
+def confidence(
+    values: np.ndarray,
+    confidence_threshold: float = GridPoint.confidence_threshold,
+) -> np.ndarray:
+    """
+        Vectorized GridPoint.confidence: -1 for obstacle, 1 for certainly
+        open otherwise 0 (NaN values stay NaN).
+    """
+    values = np.asarray(values, dtype=float)
+    conf = classify(values, confidence_threshold).astype(float)
+    conf[np.isnan(values)] = np.nan
+    return conf
+
+
+def classify(
+    values: np.ndarray,
+    confidence_threshold: float = GridPoint.confidence_threshold,
+) -> np.ndarray:
+    """
+        GridPoint.confidence of an array of (known) values, as int8
+    """
+    values = np.asarray(values)
+    conf = np.zeros(values.shape, dtype=np.int8)
+    with np.errstate(invalid="ignore"):
+        conf[values < 0] = -1
+        conf[values >= confidence_threshold] = 1
+    return conf
+
+
+@kernel
+def splat_values(
+    inverse: np.ndarray,
+    initial: np.ndarray,
+    delta: np.ndarray,
+    first: np.ndarray,
+) -> np.ndarray:
+    """
+        Value of each cell given the gaussians' events on it, grouped by cell
+        in their order (see Map.get_grid_map): the cell (inverse) of each
+        event, the value it sets the cell to if first (initial) and the
+        one it adds (delta), and the index of each cell's first event.
+        The value after each event is accumulated and the first negative
+        one is kept.
+    """
+    # each cell's total, then the value after each event: accumulated
+    # with a running sum brought back to 0 at each cell's first event, so
+    # that long runs don't lose precision to cancellation
+    totals = np.add.reduceat(delta, first)
+    reset = delta.copy()
+    reset[first[1:]] -= totals[:-1]
+    running = np.cumsum(reset)
+    offset = running[first] - delta[first]
+    values = initial[first][inverse] + running - offset[inverse]
+
+    # the first negative value of each cell, or its total if none
+    n = len(values)
+    first_negative = np.minimum.reduceat(
+        np.where(values < 0, np.arange(n), n), first
+    )
+    has_negative = first_negative < n
+    final = initial[first] + totals
+    final[has_negative] = values[first_negative[has_negative]]
+    return np.where(initial[first] < 0, initial[first], final)
+
+
+@kernel
+def integrate_odometry(
+    x: float,
+    y: float,
+    theta: float,
+    speed: Sequence[float],
+    omega: Sequence[float],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+        Integrates the odometry (speed and omega, in degrees) of N steps from
+        a pose and returns the N poses reached, with theta kept in [0, 360)
+    """
+    speed = np.asarray(speed, dtype=float)
+    omega = np.asarray(omega, dtype=float)
+
+    # heading at the start of each step, then the displacements it moves by
+    headings = theta + np.concatenate([[0.0], np.cumsum(omega)])
+    thet_rad = np.radians(headings[:-1])
+    xs = x + np.cumsum(speed * np.cos(thet_rad))
+    ys = y + np.cumsum(speed * np.sin(thet_rad))
+    return xs, ys, np.mod(headings[1:], 360)
@@ -0,0 +1,78 @@
+"""
+    Numba versions of the kernels run by the numba backend (see
+    slam.backend). Each computes the same as the NumPy function of the same
+    name, with explicit loops: results match to floating point precision
+    (see scripts/check_backends.py).
+"""
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def rays_segments_intersection(p0, p1, segments):
+    t = np.full((p0.shape[0], segments.shape[0]), np.nan)
+    for r in range(p0.shape[0]):
+        dx = p1[r, 0] - p0[r, 0]
+        dy = p1[r, 1] - p0[r, 1]
+        for s in range(segments.shape[0]):
+            ex = segments[s, 2] - segments[s, 0]
+            ey = segments[s, 3] - segments[s, 1]
+            wx = segments[s, 0] - p0[r, 0]
+            wy = segments[s, 1] - p0[r, 1]
+
+            denom = dx * ey - dy * ex
+            if denom == 0:
+                continue
+            ts = (wx * ey - wy * ex) / denom
+            u = (wx * dy - wy * dx) / denom
+            if ts >= 0 and ts <= 1 and u >= 0 and u <= 1:
+                t[r, s] = ts
+    return t
+
+
+@njit(cache=True)
+def points_in_polygons(points, segments, owners, n):
+    inside = np.zeros((points.shape[0], n), dtype=np.bool_)
+    for i in range(points.shape[0]):
+        x, y = points[i, 0], points[i, 1]
+        for s in range(segments.shape[0]):
+            x0, y0 = segments[s, 0], segments[s, 1]
+            x1, y1 = segments[s, 2], segments[s, 3]
+            if (y0 > y) != (y1 > y):
+                if x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+                    inside[i, owners[s]] = not inside[i, owners[s]]
+    return inside
+
+
+@njit(cache=True)
+def splat_values(inverse, initial, delta, first):
+    n, n_cells = delta.shape[0], first.shape[0]
+    values = np.empty(n_cells)
+    for cell in range(n_cells):
+        start = first[cell]
+        stop = first[cell + 1] if cell + 1 < n_cells else n
+        if initial[start] < 0:
+            values[cell] = initial[start]
+            continue
+
+        value = initial[start]
+        for i in range(start, stop):
+            value += delta[i]
+            if value < 0:
+                break  # the first negative value is kept
+        values[cell] = value
+    return values
+
+
+@njit(cache=True)
+def integrate_odometry(x, y, theta, speed, omega):
+    n = speed.shape[0]
+    xs, ys, thetas = np.zeros(n), np.zeros(n), np.zeros(n)
+    heading = theta  # not wrapped, as the cumsum of omega
+    for step in range(n):
+        thet_rad = np.radians(heading)
+        x = x + speed[step] * np.cos(thet_rad)
+        y = y + speed[step] * np.sin(thet_rad)
+        heading = heading + omega[step]
+        xs[step], ys[step], thetas[step] = x, y, heading % 360
+    return xs, ys, thetas
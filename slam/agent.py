@@ -1,16 +1,18 @@
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, Circle
 import numpy as np
-from typing import List, Tuple
-from loguru import logger
+from typing import List, Tuple, Optional, TYPE_CHECKING
 
-from kino.geometry.point import Point
-from kino.geometry import Vector
-from myterial import blue_dark, pink
+from slam.colors import blue_dark, pink
 
+from slam.costmap import Costmap
 from slam.environment import Environment
+from slam.gaussians import GaussianStore
+from slam.geometry import Point, Vector
+from slam.log import logger
+from slam.lidar import LidarSensor
+from slam.localization import ParticleFilter
+from slam.pose_graph import PoseGraph
+from slam.scan_matching import ScanMatcher
 from slam.map import Map
-from slam.ray import Ray
 from slam.behavior import (
     BehavioralRoutine,
     Explore,
@@ -19,6 +21,11 @@ from slam.behavior import (
     NavigateToNode,
 )
 from slam.planner import Planner
+from slam.recorder import Recorder
+from slam.worker import SlamWorker, Snapshot
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
 
 
 class Agent:
@@ -33,21 +40,51 @@ class Agent:
     speed: float = 1
     max_turn: int = 60
 
-    # LIDAR rays
+    # LIDAR (used when no sensor is passed to the agent)
+    ray_angles: Tuple[float, ...] = (-40, -20, 0, 20, 40)
     ray_length: int = 14
     collision_distance: int = 6
+    collision_fov: float = 180  # only beams in front of the agent are checked
+    # the beams (closest to these angles) telling whether an obstacle is on
+    # the left or on the right, whatever the number of beams
+    side_beam_angles: Tuple[float, float] = (-40, 40)
+
+    # with a noiseless lidar, scans are skipped while no beam can reach an
+    # obstacle (see scan) and run advances those exploration steps together.
+    # Obstacles are looked for up to lookahead beyond the lidar's range to
+    # know for how long
+    fast_forward: bool = True
+    fast_forward_lookahead: float = 10
 
     # SLAM
     update_map_every: int = 25  # update map every n timesteps
 
+    # how uncertain nodes are picked to be explored: "gain" for the one
+    # cheapest to reach per information gain, "random" for a random one
+    target_selection: str = "gain"
+
     def __init__(
         self,
         environment: Environment,
         x: float = 0,
         y: float = 0,
         angle: float = 0,
+        recorder: Optional[Recorder] = None,
+        rng: Optional[np.random.Generator] = None,
+        lidar: Optional[LidarSensor] = None,
+        odometry_noise: Tuple[float, float] = (0, 0),
+        localizer: Optional[ParticleFilter] = None,
+        scan_matcher: Optional[ScanMatcher] = None,
+        pose_graph: Optional[PoseGraph] = None,
+        gaussians: Optional[GaussianStore] = None,
+        asynchronous: bool = False,
     ):
         self.environment = environment
+        self.recorder = recorder
+        self.rng = rng if rng is not None else environment.spawn_rng()
+
+        # std of the noise on the measured speed and steering angle
+        self.odometry_noise = odometry_noise
 
         if self.environment.is_point_in_obstacle(Point(x, y)):
             logger.info(
@@ -62,22 +99,34 @@ class Agent:
 
         self.trajectory = dict(x=[x], y=[y])
 
-        # make rays
-        self.rays = [
-            Ray(self, angle, self.ray_length)
-            for angle in (-40, -20, 0, 20, 40)
-        ]
+        # make lidar
+        self.lidar = lidar or LidarSensor(self.ray_angles, self.ray_length)
 
-        # update rays
-        for ray in self.rays:
-            ray.scan(self.environment.obstacles)
+        # update lidar
+        self._clear_area: Optional[Tuple[float, float, float]] = None
+        self.touching_sides: Tuple[bool, bool] = (False, False)
+        self.scan()
 
         # initiliaze map
-        self.map = Map(self)
+        self.map = Map(
+            self,
+            localizer=localizer,
+            scan_matcher=scan_matcher,
+            pose_graph=pose_graph,
+            gaussians=gaussians,
+        )
         self._current_routine: BehavioralRoutine = Explore()
 
         # initialize planner
-        self.planner = Planner()
+        self.planner = Planner(rng=self.rng)
+
+        # with asynchronous SLAM the map is built in a background thread and
+        # the agent reads the latest snapshot of it
+        self.worker: Optional[SlamWorker] = None
+        self._odometry_log: List[Tuple[float, float]] = []
+        if asynchronous:
+            self.worker = SlamWorker(self.map, self.rng)
+            self.worker.start()
 
         self.n_time_steps = 0
 
@@ -85,6 +134,10 @@ class Agent:
             int
         ] = []  # store which routine is done at each timestep
 
+        # the recording starts from the agent's pose before the first step
+        if self.recorder is not None:
+            self.recorder.start(self)
+
     # -------------------------------- kinematics -------------------------------- #
 
     @property
@@ -96,6 +149,46 @@ class Agent:
         head_shift = Vector(self.height / 2, 0).rotate(self.angle)
         return (self.COM + head_shift).as_array()
 
+    def scan(self):
+        """
+            Scans the obstacles near the agent with the lidar.
+            With fast_forward, a scan that detects nothing stores the
+            obstacle-free disc around the lidar and the next scans are
+            skipped (nothing can be detected) while all beams are within it.
+        """
+        head = self.head_position
+        max_range = self.lidar.ranges.max()
+        if self._clear_area is not None:
+            if self._in_clear_area(head):
+                self.lidar.clear()
+                return
+            self._clear_area = None
+
+        # noise and dropout draw random numbers at each scan
+        fast_forward = self.fast_forward and not (
+            self.lidar.noise_std or self.lidar.dropout
+        )
+        lookahead = self.fast_forward_lookahead if fast_forward else 0
+        obstacles = self.environment.packed_obstacles_near(
+            Point(*head), max_range + lookahead
+        )
+        self.lidar.scan(head, self.angle, obstacles, self.rng)
+
+        if fast_forward and np.all(np.isnan(self.lidar.distances)):
+            radius = min(obstacles.distance(head), max_range + lookahead)
+            self._clear_area = (head[0], head[1], radius)
+
+    def _in_clear_area(self, head: np.ndarray) -> bool:
+        """
+            Whether all beams from the lidar at head are within the last
+            obstacle-free disc (see scan)
+        """
+        x, y, radius = self._clear_area  # type: ignore
+        return bool(
+            np.hypot(head[0] - x, head[1] - y) + self.lidar.ranges.max()
+            < radius
+        )
+
     def set(self, **kwargs):
         for k, val in kwargs.items():
             if k in self.__dict__.keys():
@@ -105,52 +198,85 @@ class Agent:
 
     # --------------------------------- behavior --------------------------------- #
 
-    def check_touching(self) -> Tuple[List[bool], float]:
+    def check_touching(self) -> Tuple[np.ndarray, float]:
         """
-            Checks which of the rays are touching an object and returns the 
-            distance of the closest objct
+            Checks which of the lidar beams in front of the agent are touching an
+            object (ordered from the leftmost to the rightmost) and returns the
+            distance of the closest objct. Whether the left and right beams
+            (see side_beam_angles) are touching is stored in touching_sides.
         """
+        angles = self.lidar.angles
+        with np.errstate(invalid="ignore"):
+            # NaN -> False
+            touching_all = self.lidar.distances < self.collision_distance
+        sides = [np.argmin(np.abs(angles - a)) for a in self.side_beam_angles]
+        self.touching_sides = (
+            bool(touching_all[sides[0]]),
+            bool(touching_all[sides[1]]),
+        )
+
+        in_front = np.abs(angles) <= self.collision_fov / 2
+        distances = self.lidar.distances[in_front]
+        touching = touching_all[in_front]
+
         touching_distance: float = self.collision_distance * 2
-        touching = [False for n in range(len(self.rays))]
-        for n, ray in enumerate(self.rays):
-            if ray.contact_point is not None:
-                if ray.contact_point.distance < self.collision_distance:
-                    touching[n] = True
-                    touching_distance = min(
-                        touching_distance, ray.contact_point.distance
-                    )
+        if np.any(touching):
+            touching_distance = min(
+                touching_distance, float(distances[touching].min())
+            )
         return touching, touching_distance
 
-    def select_routine(self, touching: List[bool], touching_distance: float):
+    def select_routine(
+        self, touching: np.ndarray, touching_distance: float
+    ):
         """
             Selects which routine to execute
         """
         if self._current_routine.name == "exploration":
+            event = self._exploration_event(touching, touching_distance)
 
-            if touching_distance < self.speed:
+            if event == "backtrack":
                 # backtrack: avoid collision
-                if touching[0] and touching[-1]:
-                    self._current_routine = Backtrack()
+                self._current_routine = Backtrack(self.rng)
 
-            elif np.random.rand() < 0.005 and np.any(touching):
+            elif event == "spin":
                 # do a spin
                 self._current_routine = SpinScan()
 
-            elif np.random.rand() < 0.012 and self.n_time_steps > 10:
+            elif event == "navigate":
                 # explore an 'uncertain' node in the graph
                 self.slam()
-                node = self.planner.get_uncertain_node()
-                if node is not None:
+                if self.target_selection == "random":
+                    node = self.planner.get_uncertain_node()
+                else:
+                    node = self.planner.get_best_uncertain_node(self)
+                if node is not None and self.planner.reachable(self, node):
                     self._current_routine = NavigateToNode(
                         self, self.planner, node
                     )
-            # elif np.any(touching) and np.random.rand() < .4:
+            # elif np.any(touching) and self.rng.random() < .4:
             # follow object
             # TODO follow object walls
         else:
             if self._current_routine.completed:
                 self._current_routine = Explore()
 
+    def _exploration_event(
+        self, touching: np.ndarray, touching_distance: float
+    ) -> Optional[str]:
+        """
+            While exploring, decides (drawing random numbers) whether to
+            "backtrack", do a "spin" or "navigate" to an uncertain node.
+            None to keep exploring.
+        """
+        if touching_distance < self.speed:
+            return "backtrack" if all(self.touching_sides) else None
+        elif self.rng.random() < 0.005 and np.any(touching):
+            return "spin"
+        elif self.rng.random() < 0.012 and self.n_time_steps > 10:
+            return "navigate"
+        return None
+
     def move(self):
         """
             Moves the agent
@@ -163,10 +289,16 @@ class Agent:
         speed, steer_angle = self._current_routine.get_commands(
             self, touching, touching_distance
         )
+        self._apply_commands(speed, steer_angle)
 
+    def _apply_commands(self, speed: float, steer_angle: float):
+        """
+            Moves the agent with the given motor commands
+        """
         # store variables and move
         self._current_speed = speed
         self._current_omega = steer_angle
+        self.odometry = self.measure_odometry(speed, steer_angle)
 
         self.x += speed * np.cos(np.radians(self.angle))
         self.y += speed * np.sin(np.radians(self.angle))
@@ -175,22 +307,40 @@ class Agent:
         self.trajectory["x"].append(self.x)
         self.trajectory["y"].append(self.y)
 
+    def measure_odometry(
+        self, speed: float, steer_angle: float
+    ) -> Tuple[float, float]:
+        """
+            Returns the speed and steering angle as measured by the agent's
+            (noisy) odometry
+        """
+        speed_std, omega_std = self.odometry_noise
+        if speed_std:
+            speed += self.rng.normal(0, speed_std)
+        if omega_std:
+            steer_angle += self.rng.normal(0, omega_std)
+        return speed, steer_angle
+
     def update(self):
         # move
         self.move()
+        self._sense()
 
-        # update rays
-        for ray in self.rays:
-            ray.scan(self.environment.obstacles)
+    def _sense(self):
+        """
+            The rest of a time step once the agent moved: scans, adds the step
+            to the map (building it every update_map_every steps) and to the
+            recording
+        """
+        # update lidar
+        self.scan()
 
         # update map entries
-        self.map.add(
-            *[
-                ray.contact_point
-                for ray in self.rays
-                if ray.contact_point is not None
-            ]
-        )
+        if self.worker is None:
+            self.map.add(self.lidar.distances)
+        else:
+            self.worker.add(*self.odometry, self.lidar.distances)
+            self._odometry_log.append(self.odometry)
 
         # generate map
         if self.n_time_steps % self.update_map_every == 0:
@@ -199,20 +349,202 @@ class Agent:
         self.n_time_steps += 1
         self.routine_name.append(self._current_routine.ID)
 
+        # stream to disk
+        if self.recorder is not None:
+            self.recorder.add(self)
+
+    def run(self, n_steps: int):
+        """
+            Runs n_steps time steps, with the same result as calling update
+            n_steps times. With fast_forward, stretches of exploration steps
+            whose scans are skipped are advanced together.
+        """
+        stop = self.n_time_steps + n_steps
+        while self.n_time_steps < stop:
+            if not self._fast_forward(stop - self.n_time_steps):
+                self.update()
+
+    def _fast_forward(self, max_steps: int) -> int:
+        """
+            Advances up to max_steps exploration steps (stopping before the
+            next map build) while the lidar stays within the obstacle-free
+            disc of the last scan. Each step only draws its motor commands
+            and moves, the steps are then added to the map (and recording)
+            together. The step leaving the disc ends the stretch and is
+            completed as in update. The step that would start another
+            routine is left to update, with its random numbers put back.
+            Returns the number of steps advanced.
+        """
+        n_steps = min(max_steps, -self.n_time_steps % self.update_map_every)
+        if (
+            not n_steps
+            or self._clear_area is None
+            or not isinstance(self._current_routine, Explore)
+        ):
+            return 0
+
+        # the lidar detects nothing along the whole stretch
+        touching, touching_distance = self.check_touching()
+        bit_generator = self.rng.bit_generator
+        start = self.n_time_steps
+        steps: List[tuple] = []
+        leaving = False  # the last step moved out of the disc
+        for step in range(start, start + n_steps):
+            state = bit_generator.state
+            self.n_time_steps = step
+            event = self._exploration_event(touching, touching_distance)
+            if event is not None:
+                # undo the step, update runs it
+                bit_generator.state = state
+                break
+
+            self._apply_commands(
+                *self._current_routine.get_commands(
+                    self, touching, touching_distance
+                )
+            )
+            if not self._in_clear_area(self.head_position):
+                leaving = True
+                break
+            steps.append(self._step_state())
+        self.n_time_steps = start + len(steps)
+        if not steps:
+            if leaving:
+                self._sense()
+            return int(leaving)
+
+        odometry = [step[-1] for step in steps]
+        if self.worker is None:
+            self.map.add_clear_steps(odometry)
+        else:
+            for speed, omega in odometry:
+                self.worker.add(speed, omega, self.lidar.distances)
+            self._odometry_log.extend(odometry)
+        self.routine_name.extend([self._current_routine.ID] * len(steps))
+
+        if self.recorder is not None:
+            current = self._step_state()
+            for values in steps:
+                self._set_step_state(values)
+                self.recorder.add(self)
+            self._set_step_state(current)
+
+        if leaving:
+            self._sense()
+        return len(steps) + leaving
+
+    def _step_state(self) -> tuple:
+        """
+            The agent's pose and motor commands, as recorded at each step
+        """
+        return (
+            self.x,
+            self.y,
+            self.angle,
+            self._current_speed,
+            self._current_omega,
+            self.odometry,
+        )
+
+    def _set_step_state(self, values: tuple):
+        (
+            self.x,
+            self.y,
+            self.angle,
+            self._current_speed,
+            self._current_omega,
+            self.odometry,
+        ) = values
+
     # ------------------------------- slam/planning ------------------------------ #
     def slam(self):
-        """ Builds a map + agent localization and activates the planner
+        """ Builds a map + agent localization and activates the planner.
+            With asynchronous SLAM it only asks for a new map build and
+            switches to the planner of the latest snapshot.
         """
         logger.debug(f"Agent, SLAM at timestep: {self.n_time_steps}")
+        if self.worker is not None:
+            self.worker.request()
+            if self.snapshot is not None:
+                self.planner = self.snapshot.planner
+            return
+
         self.map.build()
-        self.planner.build(list(self.map.grid_points.values()))
+        self.planner.build(
+            *self.map.grid_cells(),
+            self.map.costmap,
+            self.map.confidence_threshold,
+        )
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        """
+            The latest map snapshot published by the asynchronous SLAM worker
+        """
+        return None if self.worker is None else self.worker.snapshot
+
+    @property
+    def costmap(self) -> Optional[Costmap]:
+        """
+            The map's costmap, or the latest snapshot's with asynchronous SLAM
+        """
+        if self.worker is None:
+            return self.map.costmap
+        snapshot = self.worker.snapshot
+        return None if snapshot is None else snapshot.costmap
+
+    @property
+    def estimated_pose(self) -> Tuple[float, float, float]:
+        """
+            The agent's last pose (x, y, theta) as reconstructed by SLAM.
+            With asynchronous SLAM the pose of the latest snapshot is moved
+            with the odometry of the steps that are not in it yet.
+        """
+        if self.worker is None:
+            trajectory = self.map.agent_trajectory
+            return (
+                trajectory["x"][-1],
+                trajectory["y"][-1],
+                trajectory["theta"][-1],
+            )
+
+        snapshot = self.worker.snapshot
+        x, y, theta = (0.0, 0.0, 0.0) if snapshot is None else snapshot.pose
+        step = 0 if snapshot is None else snapshot.step
+        for speed, omega in self._odometry_log[step:]:
+            x += speed * np.cos(np.radians(theta))
+            y += speed * np.sin(np.radians(theta))
+            theta = (theta + omega) % 360
+        return x, y, theta
+
+    def localize(self) -> Tuple[float, float, float]:
+        """
+            Reconstructs the trajectory up to the current time step (without
+            building the map) and returns the agent's last pose
+        """
+        if self.worker is None:
+            self.map.get_agent_trajectory()
+        return self.estimated_pose
+
+    def close(self):
+        """
+            Stops the asynchronous SLAM worker after a last build including
+            all steps, after which the map and planner can be used directly
+        """
+        if self.worker is not None:
+            self.worker.close()
+            if self.worker.snapshot is not None:
+                self.planner = self.worker.snapshot.planner
+            self.worker = None
 
     # ----------------------------------- draw ----------------------------------- #
 
-    def draw(self, ax: plt.Axes, just_agent: bool = False):
+    def draw(self, ax: "plt.Axes", just_agent: bool = False):
         """
             Draws the agent as a rectangle with a circle for head
         """
+        from matplotlib.patches import Rectangle, Circle
+
         # draw body, get rectangle corner first
         body_shift = Vector(-self.height / 2, -self.width / 2).rotate(
             self.angle
@@ -223,7 +555,7 @@ class Agent:
                 (self.COM + body_shift).as_array(),
                 self.height,
                 self.width,
-                self.angle,
+                angle=self.angle,
                 facecolor=self.color,
                 lw=1,
                 edgecolor="k",
@@ -243,9 +575,8 @@ class Agent:
         )
 
         if not just_agent:
-            # add rays
-            for ray in self.rays:
-                ray.draw(ax)
+            # add lidar beams
+            self.lidar.draw(ax, self.head_position, self.angle)
 
             # draw trace
             ax.plot(
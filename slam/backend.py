@@ -0,0 +1,74 @@
+"""
+    Selects how the numeric kernels (ray casting, point in polygon tests, the
+    grid's gaussian splatting and odometry integration) run: with NumPy (the
+    default) or compiled with Numba, which is optional. The backend is picked
+    with the SLAM_BACKEND environment variable ("numpy" or "numba") or with
+    set_backend. Compiled kernels are cached to disk (in __pycache__, or in
+    NUMBA_CACHE_DIR if set), so that new processes don't compile them again.
+"""
+import os
+from functools import wraps
+from types import ModuleType
+from typing import Callable, Optional
+
+from slam.log import logger
+
+BACKENDS = ("numpy", "numba")
+
+_backend: str = "numpy"
+_compiled: Optional[ModuleType] = None  # slam._numba, once imported
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def set_backend(name: str):
+    """
+        Selects the backend running the kernels. The Numba kernels are
+        compiled (or loaded from the disk cache) the first time each is used
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(
+            f'Unknown backend: "{name}", should be one of {BACKENDS}'
+        )
+    if name == "numba":
+        import numba  # noqa: F401 - fails early without numba
+
+    _backend = name
+
+
+def _compiled_kernels() -> ModuleType:
+    global _compiled
+    if _compiled is None:
+        from slam import _numba
+
+        _compiled = _numba
+    return _compiled
+
+
+def kernel(function: Callable) -> Callable:
+    """
+        Makes a NumPy kernel run its compiled version (the function of the
+        same name in slam._numba) when the numba backend is selected
+    """
+    name = function.__name__
+
+    @wraps(function)
+    def dispatch(*args, **kwargs):
+        if _backend == "numba":
+            return getattr(_compiled_kernels(), name)(*args, **kwargs)
+        return function(*args, **kwargs)
+
+    return dispatch
+
+
+if os.environ.get("SLAM_BACKEND"):
+    try:
+        set_backend(os.environ["SLAM_BACKEND"])
+    except ImportError:
+        logger.warning(
+            "SLAM_BACKEND is numba but numba is not installed, "
+            "using the numpy backend"
+        )
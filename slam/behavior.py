@@ -1,9 +1,8 @@
 import numpy as np
-from loguru import logger
 from typing import List, Tuple, Optional
 
-from kino.geometry import Vector
-
+from slam.geometry import Vector
+from slam.log import logger
 from slam.planner import Planner
 
 
@@ -37,7 +36,7 @@ class BehavioralRoutine:
 
 
 #     def get_commands(
-#         self, agent, touching: List[bool], touching_distance: float
+#         self, agent, touching: np.ndarray, touching_distance: float
 #     ) -> Tuple[float, float]:
 
 
@@ -46,6 +45,11 @@ class NavigateToNode(BehavioralRoutine):
 
     distance_threshold: float = 2  # start scanning when close to target
 
+    # steering away from obstacles: turns around the one along the route
+    # are scored by the costmap at look_ahead units along them
+    look_ahead: float = 3
+    steer_offsets: np.ndarray = np.arange(-45, 46, 15)
+
     scan_turn_angles: List[int] = [
         30,
         30,
@@ -73,10 +77,8 @@ class NavigateToNode(BehavioralRoutine):
         self.reason: str = ""
 
     def agent_position(self) -> Vector:
-        return Vector(
-            self.agent.map.agent_trajectory["x"][-1],
-            self.agent.map.agent_trajectory["y"][-1],
-        )
+        x, y, _ = self.agent.estimated_pose
+        return Vector(x, y)
 
     def check_at_node(self) -> bool:
         """
@@ -110,7 +112,7 @@ class NavigateToNode(BehavioralRoutine):
             return False
 
     def _subroutine_navigate(
-        self, touching: List[bool], touching_distance: float
+        self, touching: np.ndarray, touching_distance: float
     ) -> Tuple[float, float]:
         """
             Selects motor commands to navigate to the next node along a route to the goal
@@ -120,13 +122,12 @@ class NavigateToNode(BehavioralRoutine):
             planned_route: List[dict] = self.planner.plan_route(
                 self.agent, self.target_node
             )
-        except:
+        except ValueError:
             self.reason = "planner could not produce route"
             self.interrupt = True
             return 0, 0
 
-        self.agent.map.get_agent_trajectory()
-        theta = self.agent.map.agent_trajectory["theta"]
+        theta = self.agent.localize()[2]
 
         # get angle between agent orientation and next node
         # by taking the avereage of the next N steps along the route
@@ -145,12 +146,13 @@ class NavigateToNode(BehavioralRoutine):
                 next_node["x"] - current_node["x"],
                 next_node["y"] - current_node["y"],
             )
-            steer_angle -= theta[-1] - vect.angle2
+            steer_angle -= theta - vect.angle2
         steer_angle /= 2
-        steer_angle += np.random.uniform(-5, 5)
+        steer_angle += self.agent.rng.uniform(-5, 5)
 
         if abs(steer_angle) > self.agent.max_turn:
             steer_angle = self.agent.max_turn * np.sign(steer_angle)
+        steer_angle = self._avoid_obstacles(steer_angle)
 
         # get motor commands
         if touching_distance < self.agent.collision_distance / 2:
@@ -161,6 +163,27 @@ class NavigateToNode(BehavioralRoutine):
         else:
             return 1, steer_angle
 
+    def _avoid_obstacles(self, steer_angle: float) -> float:
+        """
+            Picks the turn (around steer_angle) that minimizes the costmap's
+            cost ahead of the agent plus how much it deviates from
+            steer_angle
+        """
+        costmap = self.agent.costmap
+        if costmap is None or costmap.empty:
+            return steer_angle
+
+        max_turn = self.agent.max_turn
+        turns = np.clip(steer_angle + self.steer_offsets, -max_turn, max_turn)
+        x, y, theta = self.agent.estimated_pose
+        heading = np.radians(theta + turns)
+        cost = costmap.cost(
+            x + self.look_ahead * np.cos(heading),
+            y + self.look_ahead * np.sin(heading),
+        )
+        deviation = np.abs(turns - steer_angle) / max_turn
+        return float(turns[np.argmin(cost + deviation)])
+
     def _subroutine_scan(self) -> Tuple[float, float]:
         """
             Makes the agent turn in place to scan an area
@@ -168,7 +191,7 @@ class NavigateToNode(BehavioralRoutine):
         return 0, self.scan_turn_angles[self.scan_frame]
 
     def get_commands(
-        self, agent, touching: List[bool], touching_distance: float
+        self, agent, touching: np.ndarray, touching_distance: float
     ) -> Tuple[float, float]:
         if not self.at_target:
             return self._subroutine_navigate(touching, touching_distance)
@@ -186,27 +209,28 @@ class Explore(BehavioralRoutine):
         super().__init__()
 
     def get_commands(
-        self, agent, touching: List[bool], touching_distance: float
+        self, agent, touching: np.ndarray, touching_distance: float
     ) -> Tuple[float, float]:
         # turn based on which ray is touching
         speed = agent.speed
-        steer_angle = np.random.uniform(-10, 10)
-        if touching[0] and not touching[-1]:
+        steer_angle = agent.rng.uniform(-10, 10)
+        left, right = agent.touching_sides
+        if left and not right:
             # left ray touching -> turn right
-            steer_angle = np.random.uniform(0, 25)
-        elif not touching[0] and touching[-1]:
+            steer_angle = agent.rng.uniform(0, 25)
+        elif not left and right:
             # right ray touching -> turn left
-            steer_angle = np.random.uniform(-25, 0)
+            steer_angle = agent.rng.uniform(-25, 0)
         elif np.any(touching):
             # something else touching, turn more
-            steer_angle = np.random.uniform(-25, 25)
+            steer_angle = agent.rng.uniform(-25, 25)
             speed = agent.speed * (
                 touching_distance / agent.collision_distance
             )
         else:
             # nothing touching, randomly change orientation
-            if np.random.rand() < 0.05:
-                steer_angle = np.random.uniform(
+            if agent.rng.random() < 0.05:
+                steer_angle = agent.rng.uniform(
                     -agent.max_turn, agent.max_turn
                 )
         return speed, steer_angle
@@ -216,12 +240,12 @@ class Backtrack(BehavioralRoutine):
     ID: int = 3
     name = "back track"
 
-    def __init__(self):
+    def __init__(self, rng: np.random.Generator):
         super().__init__(n_steps=5)
-        self._steer_angle = np.random.uniform(120, 240) / 3
+        self._steer_angle = rng.uniform(120, 240) / 3
 
     def get_commands(
-        self, agent, touching: List[bool], touching_distance: float
+        self, agent, touching: np.ndarray, touching_distance: float
     ) -> Tuple[float, float]:
         if self.steps_count < self.n_steps - 4:  # type: ignore
             speed = -agent.speed
@@ -241,7 +265,7 @@ class SpinScan(BehavioralRoutine):
         super().__init__(n_steps=20)
 
     def get_commands(
-        self, agent, touching: List[bool], touching_distance: float
+        self, agent, touching: np.ndarray, touching_distance: float
     ) -> Tuple[float, float]:
         self.steps_count += 1
         return 0, 360 / self.n_steps  # type: ignore
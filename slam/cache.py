@@ -0,0 +1,220 @@
+"""
+    Content-addressed on-disk cache of simulation runs. A run is identified
+    by a hash of everything that determines its outcome: the simulation's
+    class constants (with the parameters changed for the run), the
+    environment, the seed, the number of steps, the agent's start and the
+    source code of slam itself. Each cached run is a folder with the run's
+    metrics, its recording (see Recorder) and the final map (see Map.save).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Type, Union
+import numpy as np
+
+from slam.environment import Environment
+from slam.io import FORMAT_VERSION, save_metadata, load_metadata
+from slam.log import logger
+from slam.sweep import TARGETS, run_trial
+
+_code_version: Optional[str] = None
+
+
+def code_version() -> str:
+    """
+        Hash of the source code of all of slam's modules
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for path in sorted(Path(__file__).parent.glob("*.py")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _constants(cls: type) -> dict:
+    """
+        The public class constants of a class (and of its parents)
+    """
+    constants = {}
+    for parent in reversed(cls.__mro__[:-1]):
+        for name, value in vars(parent).items():
+            if name.startswith("_") or callable(value):
+                continue
+            if isinstance(value, (property, classmethod, staticmethod)):
+                continue
+            constants[name] = value
+    return constants
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+class RunCache:
+    """
+        Runs are stored in `path`, one folder per run named by its key.
+        With max_bytes, the least recently used runs are removed when the
+        cache grows beyond that size.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = Path.home() / ".cache" / "slam" / "runs",
+        max_bytes: Optional[int] = None,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def key(
+        self,
+        params: Dict[str, float],
+        n_steps: int,
+        seed: int,
+        environment: Type[Environment] = Environment,
+        start: Tuple[float, float, float] = (20, 10, 0),
+    ) -> str:
+        """
+            The key of a run: a hash of its configuration and of the code
+        """
+        config = {
+            name: _constants(cls) for name, cls in sorted(TARGETS.items())
+        }
+        for name, value in params.items():
+            cls_name, _, attribute = name.partition(".")
+            config[cls_name][attribute] = value
+
+        spec = dict(
+            config=config,
+            environment=f"{environment.__module__}.{environment.__qualname__}",
+            seed=seed,
+            n_steps=n_steps,
+            start=list(start),
+            code=code_version(),
+            format=FORMAT_VERSION,
+        )
+        encoded = json.dumps(spec, sort_keys=True, default=_jsonable)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+            The folder of a cached run (marked as just used), None if the
+            run isn't cached
+        """
+        path = self.path / key
+        if not (path / "metadata.json").exists():
+            return None
+        os.utime(path)
+        return path
+
+    def metrics(self, key: str) -> Optional[Tuple[float, float]]:
+        """
+            The coverage and time per step of a cached run (see run_trial)
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        metadata = load_metadata(path, "run")
+        return metadata["coverage"], metadata["time_per_step"]
+
+    def run(
+        self,
+        params: Dict[str, float],
+        n_steps: int,
+        seed: int,
+        environment: Type[Environment] = Environment,
+        start: Tuple[float, float, float] = (20, 10, 0),
+    ) -> Tuple[float, float]:
+        """
+            Returns the coverage and time per step of a run (see run_trial),
+            running it and caching it unless it's already cached
+        """
+        key = self.key(params, n_steps, seed, environment, start)
+        metrics = self.metrics(key)
+        if metrics is not None:
+            return metrics
+
+        # run in a temporary folder moved to the cache once complete, so that
+        # a crash (or a concurrent run) never leaves a partial run behind
+        tmp = Path(tempfile.mkdtemp(prefix=f".{key}_", dir=self.path))
+        try:
+            coverage, time_per_step = run_trial(
+                params, n_steps, seed, environment, start, path=tmp
+            )
+            save_metadata(
+                tmp,
+                "run",
+                coverage=coverage,
+                time_per_step=time_per_step,
+                params=params,
+                n_steps=n_steps,
+                seed=seed,
+                environment=environment.__qualname__,
+                start=list(start),
+            )
+            try:
+                os.replace(tmp, self.path / key)
+            except OSError:
+                pass  # cached by another process in the meantime
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+        return coverage, time_per_step
+
+    # --------------------------------- eviction --------------------------------- #
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+    def runs(self) -> Dict[str, Tuple[float, int]]:
+        """
+            The key of each cached run with when it was last used and its
+            size in bytes
+        """
+        runs = {}
+        for path in self.path.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                continue
+            try:
+                runs[path.name] = (path.stat().st_mtime, self._size(path))
+            except FileNotFoundError:
+                continue  # removed by another process
+        return runs
+
+    @property
+    def nbytes(self) -> int:
+        return sum(size for _, size in self.runs().values())
+
+    def evict(self):
+        """
+            Removes the least recently used runs beyond max_bytes
+        """
+        if self.max_bytes is None:
+            return
+        runs = self.runs()
+        total = sum(size for _, size in runs.values())
+        for key in sorted(runs, key=lambda key: runs[key][0]):
+            if total <= self.max_bytes:
+                break
+            logger.debug(f"Run cache: evicting {key}")
+            shutil.rmtree(self.path / key, ignore_errors=True)
+            total -= runs[key][1]
+
+    def clear(self):
+        """
+            Removes all cached runs
+        """
+        for key in self.runs():
+            shutil.rmtree(self.path / key, ignore_errors=True)
@@ -0,0 +1,12 @@
+"""
+    The few colors used to draw, from the myterial palette. Kept here as hex
+    codes so that importing slam doesn't load myterial.
+"""
+
+salmon_dark: str = "#F4511E"
+blue_light: str = "#90CAF9"
+red_dark: str = "#E53935"
+red_light: str = "#EF9A9A"
+blue_dark: str = "#1E88E5"
+blue_darker: str = "#1565C0"
+pink: str = "#EC407A"
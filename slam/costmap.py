@@ -0,0 +1,67 @@
+"""
+    Costmap: the cost of moving through each point of the map given its
+    distance to the closest obstacle, used to keep planned routes and the
+    agent's steering away from obstacles.
+"""
+from copy import deepcopy
+import numpy as np
+
+from slam.scan_matching import DistanceField
+
+
+class Costmap:
+    """
+        Obstacles are inflated by the agent's radius (points closer than that
+        to an obstacle are lethal, with cost max_cost) and the cost then
+        decays quadratically to 0 at inflation_radius from the obstacles.
+        The distances are kept in a DistanceField, so only the blocks
+        around the cells that changed are updated when the map is built
+        again and each point's cost is looked up in constant time.
+    """
+
+    def __init__(
+        self,
+        robot_radius: float = 2.5,
+        inflation_radius: float = 6,
+        max_cost: float = 10,
+    ):
+        self.robot_radius = robot_radius
+        self.inflation_radius = inflation_radius
+        self.max_cost = max_cost
+        self.field = DistanceField(max_distance=inflation_radius)
+
+    @property
+    def empty(self) -> bool:
+        return self.field.empty
+
+    def update(self, x: np.ndarray, y: np.ndarray, occupied: np.ndarray):
+        """
+            Updates the distances given the (x, y) coordinates of the map's
+            cells whose occupancy changed and whether each is now occupied
+        """
+        self.field.update(x, y, occupied)
+
+    def clearance(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+            Distance from each point to the closest obstacle (up to
+            inflation_radius)
+        """
+        return self.field.lookup(x, y)
+
+    def cost(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+            Cost of each point: max_cost within robot_radius of an obstacle,
+            decaying to 0 at inflation_radius
+        """
+        clearance = self.clearance(x, y)
+        decay = (self.inflation_radius - clearance) / (
+            self.inflation_radius - self.robot_radius
+        )
+        return np.where(
+            clearance <= self.robot_radius,
+            self.max_cost,
+            self.max_cost * np.clip(decay, 0, 1) ** 2,
+        )
+
+    def copy(self) -> "Costmap":
+        return deepcopy(self)
@@ -1,23 +1,45 @@
-from typing import Optional, Union
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-from numpy.random import uniform
+from typing import List, Optional, Union, TYPE_CHECKING
 import numpy as np
 
-from kino.geometry import Vector
-from kino.geometry.point import Point
-
-from slam.obstacle import Obstacle
+from slam.geometry import Point, Vector
+from slam.obstacle import BaseObstacle, Obstacle, PackedObstacles
 from slam.plot_utils import BACKGROUND_COLOR
 
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+# an environment's seed: an int, a SeedSequence or None for a random seed
+Seed = Union[None, int, np.random.SeedSequence]
+
 
 class Environment:
+    """
+        A rectangular world with walls and randomly placed obstacles.
+
+        All randomness in a simulation derives from the environment's seed:
+        the environment has its own random numbers generator and agents get
+        independent generators spawned from the same seed sequence.
+        For parallel runs pass each worker one of
+        `np.random.SeedSequence(seed).spawn(n_workers)` as seed.
+    """
+
     def __init__(
-        self, width: int = 100, heigh: int = 100, n_obstacles: int = 6
+        self,
+        width: int = 100,
+        heigh: int = 100,
+        n_obstacles: int = 6,
+        seed: Seed = None,
     ):
         self.width = width
         self.height = heigh
 
+        self.seed_sequence = (
+            seed
+            if isinstance(seed, np.random.SeedSequence)
+            else np.random.SeedSequence(seed)
+        )
+        self.rng = self.spawn_rng()
+
         self.add_obtacles(n_obstacles)
 
         # create north sout east west walls
@@ -68,34 +90,67 @@ class Environment:
             self.obstacles.append(
                 Obstacle(
                     xy=(pt.x, pt.y),
-                    angle=uniform(0, 180),
-                    width=uniform(30, 60),
-                    height=uniform(6, 16),
+                    angle=self.rng.uniform(0, 180),
+                    width=self.rng.uniform(30, 60),
+                    height=self.rng.uniform(6, 16),
                     name=f"Obj {n}",
                 )
             )
 
-    def random_point(self) -> Point:
+    def spawn_rng(self) -> np.random.Generator:
+        """
+            Returns a new random numbers generator, independent from all
+            the others spawned from the environment's seed sequence.
+        """
+        return np.random.default_rng(self.seed_sequence.spawn(1)[0])
+
+    def random_point(self, max_attempts: int = 10000) -> Point:
         """
             Returns a random point that is not in an obstacle
         """
-        while True:
+        for attempt in range(max_attempts):
             point = Point(
-                np.random.uniform(10, self.width - 20),
-                np.random.uniform(10, self.height - 20),
+                self.rng.uniform(10, self.width - 20),
+                self.rng.uniform(10, self.height - 20),
             )
             if not self.is_point_in_obstacle(point):
-                break
-        return point
+                return point
+        raise ValueError(
+            f"Could not find a point outside of obstacles in {max_attempts} attempts"
+        )
+
+    def obstacles_near(
+        self, point: Union[Vector, Point], radius: float
+    ) -> List[BaseObstacle]:
+        """
+            Returns the obstacles that may be within a distance from a point,
+            environments with a spatial index can use it to return fewer of them.
+        """
+        return self.obstacles
+
+    def packed_obstacles_near(
+        self, point: Union[Vector, Point], radius: float
+    ) -> PackedObstacles:
+        """
+            Returns the obstacles near a point packed for vectorized ray casting
+            and containment checks. The last packed obstacles are cached.
+        """
+        obstacles = self.obstacles_near(point, radius)
+        key = tuple(id(obstacle) for obstacle in obstacles)
+        if key != getattr(self, "_packed_key", None):
+            self._packed = PackedObstacles(obstacles)
+            self._packed_key = key
+        return self._packed
 
     def is_point_in_obstacle(self, point: Union[Vector, Point]) -> bool:
         """
             Checks if a point is in any given obstacle
         """
-        for obs in self.obstacles:
-            if obs.contains(point):
-                return True
-        return False
+        return bool(
+            self.packed_obstacles_near(point, 0).contains(
+                np.array([[point.x, point.y]])
+            )[0]
+        )
 
     def out_of_bounds(self, point: Union[Vector, Point]) -> bool:
         """
@@ -106,7 +161,10 @@ class Environment:
         else:
             return True
 
-    def draw(self, ax: Optional[plt.Axes] = None) -> plt.Axes:
+    def draw(self, ax: Optional["plt.Axes"] = None) -> "plt.Axes":
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Rectangle
+
         ax = ax or plt.subplots(figsize=(9, 9))[1]
 
         # set ax lim by plotting transparent boundaries
@@ -142,8 +200,8 @@ class Wall(Environment):
     """ Environment with a few wa;;s
     """
 
-    def __init__(self):
-        super().__init__(100, 60, 1)
+    def __init__(self, seed: Seed = None):
+        super().__init__(100, 60, 1, seed=seed)
         self.obstacles = [
             Obstacle((20, 30), 0, 60, 4, "wall-1"),
             Obstacle((40, 34), 90, 10, 4, "wall-2"),
@@ -152,16 +210,16 @@ class Wall(Environment):
 
 
 class Small(Environment):
-    def __init__(self):
-        super().__init__(30, 30, 0)
+    def __init__(self, seed: Seed = None):
+        super().__init__(30, 30, 0, seed=seed)
 
 
 class BigBox(Environment):
     """ Environment with a big box obstacle
     """
 
-    def __init__(self):
-        super().__init__(60, 60, 1)
+    def __init__(self, seed: Seed = None):
+        super().__init__(60, 60, 1, seed=seed)
         self.obstacles = [Obstacle((20, 20), 0, 40, 40, "box")] + self.walls
 
 
@@ -170,6 +228,6 @@ class Torus(Environment):
         Squared torusn environment
     """
 
-    def __init__(self):
-        super().__init__(100, 100, 0)
+    def __init__(self, seed: Seed = None):
+        super().__init__(100, 100, 0, seed=seed)
         self.obstacles = [Obstacle((15, 15), 0, 70, 70, "center")] + self.walls
@@ -0,0 +1,212 @@
+"""
+    Builds environments from real floor plans: either occupancy images (.png or
+    .npy, occupied cells are merged into as few rectangles as possible) or
+    polygon files (.json or .wkt). The processed obstacles are cached on disk,
+    keyed by the file's content, the loading parameters and the source code
+    of this module (which loads them and writes the cache).
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from slam.environment import Environment, Seed
+from slam.obstacle import BaseObstacle, Obstacle, PolygonObstacle
+
+CACHE_FOLDER: Path = Path.home() / ".cache" / "slam" / "floorplans"
+
+
+# --------------------------------- occupancy -------------------------------- #
+
+
+def load_occupancy(
+    path: Union[str, Path], threshold: float = 0.5, invert: bool = False
+) -> np.ndarray:
+    """
+        Loads a binary occupancy grid from an image (dark pixels are occupied)
+        or a .npy array (non zero values are occupied). Row 0 is the top of
+        the floor plan, as in images.
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        occupied = np.load(path) != 0
+    else:
+        from matplotlib.image import imread
+
+        image = imread(path).astype(float)
+        if image.ndim == 3:
+            image = image[..., :3].mean(axis=-1)
+        if image.max() > 1:
+            image /= 255
+        occupied = image < threshold
+
+    return ~occupied if invert else occupied
+
+
+def rectangles_from_grid(occupied: np.ndarray) -> np.ndarray:
+    """
+        Decomposes the occupied cells of a grid (indexed [row, column] with
+        row 0 at the top) in rectangles, by merging runs of occupied cells
+        along each row with identical runs in the following rows.
+        Returns an (N, 4) array with each rectangle's x, y (bottom left corner,
+        with y pointing up), width and height in cells.
+    """
+    n_rows = occupied.shape[0]
+    padded = np.pad(occupied.astype(np.int8), ((0, 0), (1, 1)))
+
+    rectangles: List[Tuple[int, int, int, int]] = []
+    open_runs: dict = dict()  # (start, end) column -> first row
+    for row in range(n_rows + 1):
+        if row < n_rows:
+            edges = np.diff(padded[row])
+            runs = set(zip(np.where(edges == 1)[0], np.where(edges == -1)[0]))
+        else:
+            runs = set()
+
+        # close the runs which don't continue in this row
+        for run in list(open_runs.keys()):
+            if run not in runs:
+                first_row = open_runs.pop(run)
+                rectangles.append(
+                    (run[0], n_rows - row, run[1] - run[0], row - first_row)
+                )
+
+        # open the new ones
+        for run in runs:
+            if run not in open_runs:
+                open_runs[run] = row
+
+    return np.array(rectangles, dtype=float).reshape(-1, 4)
+
+
+# --------------------------------- polygons --------------------------------- #
+
+
+def load_polygons(path: Union[str, Path]) -> List[np.ndarray]:
+    """
+        Loads polygons from a .json file (a list of polygons, or a dict with
+        a "polygons" list, each polygon a list of [x, y] vertices) or a .wkt
+        file (POLYGON or MULTIPOLYGON geometries, only outer rings are used).
+    """
+    path = Path(path)
+    text = path.read_text()
+
+    if path.suffix == ".json":
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data["polygons"]
+        return [np.array(polygon, dtype=float) for polygon in data]
+
+    polygons: List[np.ndarray] = []
+    for match in re.finditer(r"\(\(([^()]+)\)", text):
+        vertices = np.array(
+            [
+                [float(value) for value in vertex.split()]
+                for vertex in match.group(1).split(",")
+            ]
+        )
+        if np.all(vertices[0] == vertices[-1]):
+            vertices = vertices[:-1]  # WKT rings are closed
+        polygons.append(vertices)
+    return polygons
+
+
+# ----------------------------------- cache ---------------------------------- #
+
+
+def _cache_key(path: Union[str, Path], **params) -> str:
+    digest = hashlib.sha256(Path(path).read_bytes())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(Path(__file__).read_bytes())  # the loaders' version
+    return digest.hexdigest()
+
+
+def _load_cached(
+    path: Union[str, Path],
+    cache_folder: Optional[Path],
+    **params,
+) -> Tuple[np.ndarray, List[np.ndarray], Tuple[float, float]]:
+    """
+        Returns the rectangles, the polygons and the size of a floor plan,
+        processing the file only if it's not in the cache.
+    """
+    cache_path = None
+    if cache_folder is not None:
+        cache_path = Path(cache_folder) / f"{_cache_key(path, **params)}.npz"
+        if cache_path.exists():
+            with np.load(cache_path) as cached:
+                polygons = np.split(cached["vertices"], cached["splits"])
+                return (
+                    cached["rectangles"],
+                    [p for p in polygons if len(p)],
+                    tuple(cached["size"]),
+                )
+
+    path = Path(path)
+    resolution = params["resolution"]
+    if path.suffix in (".json", ".wkt"):
+        rectangles = np.zeros((0, 4))
+        polygons = [p * resolution for p in load_polygons(path)]
+        if not polygons:
+            raise ValueError(f'No polygons found in "{path}"')
+        vertices = np.vstack([np.zeros((0, 2))] + polygons)
+        size = tuple(np.ceil(vertices.max(axis=0)))
+    else:
+        occupied = load_occupancy(
+            path, threshold=params["threshold"], invert=params["invert"]
+        )
+        rectangles = rectangles_from_grid(occupied) * resolution
+        polygons = []
+        size = (
+            occupied.shape[1] * resolution,
+            occupied.shape[0] * resolution,
+        )
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            cache_path,
+            rectangles=rectangles,
+            vertices=np.vstack([np.zeros((0, 2))] + polygons),
+            splits=np.cumsum([len(p) for p in polygons])[:-1].astype(int),
+            size=np.array(size, dtype=float),
+        )
+    return rectangles, polygons, size  # type: ignore
+
+
+class FloorPlan(Environment):
+    """
+        Environment built from an occupancy image/array or a polygons file.
+        Each pixel of an occupancy image is `resolution` units wide.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        resolution: float = 1,
+        threshold: float = 0.5,
+        invert: bool = False,
+        cache_folder: Optional[Path] = CACHE_FOLDER,
+        seed: Seed = None,
+    ):
+        rectangles, polygons, (width, height) = _load_cached(
+            path,
+            cache_folder,
+            resolution=resolution,
+            threshold=threshold,
+            invert=invert,
+        )
+        super().__init__(int(np.ceil(width)), int(np.ceil(height)), 0, seed=seed)
+
+        obstacles: List[BaseObstacle] = [
+            Obstacle((x, y), 0, w, h, name="", txt_size=0)
+            for x, y, w, h in rectangles
+        ]
+        obstacles += [
+            PolygonObstacle(vertices, name="", txt_size=0)
+            for vertices in polygons
+        ]
+        self.obstacles = obstacles + self.walls
@@ -0,0 +1,234 @@
+"""
+    Bounded store for the map's gaussians: observations of the same cell
+    are merged into a single gaussian, whose weight counts them. Old
+    evidence can decay and gaussians are evicted when too old, too weak or
+    when they take more than a given number of rows or bytes.
+"""
+from typing import Optional
+import numpy as np
+
+# one row per gaussian, sorted by key
+DTYPE = np.dtype(
+    [
+        ("key", "i8"),  # cell and kind (free/occupied), see _pack
+        ("x", "f8"),  # (weighted mean) position
+        ("y", "f8"),
+        ("mean", "f4"),
+        ("std", "f4"),
+        ("distance", "f4"),  # of the last observation from the agent
+        ("angle_delta", "f4"),
+        ("weight", "f4"),  # as of time step `seen`
+        ("seen", "i4"),  # time step of the last observation
+        ("owner", "i4"),  # time step the last observation comes from
+        ("order", "i8"),  # order of the first observation
+    ]
+)
+
+_OFFSET: int = 2 ** 29  # cells coordinates must be within +/- _OFFSET
+
+
+def _pack(x: np.ndarray, y: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+    """
+        Packs the integer coordinates of cells and whether they're occupied
+        in a single int64 key
+    """
+    x = np.asarray(x).astype(np.int64) + _OFFSET
+    y = np.asarray(y).astype(np.int64) + _OFFSET
+    return ((x << 31) + y) * 2 + np.asarray(occupied, dtype=np.int64)
+
+
+def gaussian_keys(
+    x: np.ndarray, y: np.ndarray, mean: np.ndarray
+) -> np.ndarray:
+    """
+        The key of the gaussian each observation at (x, y) is merged in
+    """
+    return _pack(np.round(x), np.round(y), np.asarray(mean) < 0)
+
+
+class GaussianStore:
+    """
+        Free and occupied gaussians are merged with those of the same kind
+        whose position rounds to the same cell.
+
+        The weight of each gaussian decays by `decay` at each time step
+        (1: no decay) and is increased by 1 by each observation. Gaussians
+        whose weight falls below min_weight, not observed in the last
+        max_age time steps or, beyond max_gaussians (or the number of rows
+        that fit in max_bytes), the least recently observed (eviction="lru")
+        or the oldest (eviction="age") are evicted.
+    """
+
+    def __init__(
+        self,
+        decay: float = 1,
+        min_weight: float = 0.05,
+        max_age: Optional[int] = None,
+        max_gaussians: Optional[int] = None,
+        eviction: str = "lru",
+        max_bytes: Optional[int] = 256 * 2 ** 20,
+    ):
+        if eviction not in ("lru", "age"):
+            raise ValueError(f'Unknown eviction policy: "{eviction}"')
+
+        self.decay = decay
+        self.min_weight = min_weight
+        self.max_age = max_age
+        self.max_gaussians = max_gaussians
+        self.eviction = eviction
+        self.max_bytes = max_bytes
+
+        self.rows = np.zeros(0, dtype=DTYPE)
+        self.time = 0  # latest time step observed
+        self.n_observed = 0  # number of observations, orders the gaussians
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __bool__(self) -> bool:
+        return len(self.rows) > 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes
+
+    @property
+    def capacity(self) -> Optional[int]:
+        """
+            The number of gaussians kept, given max_gaussians and max_bytes
+        """
+        limits = [
+            limit
+            for limit in (
+                self.max_gaussians,
+                None
+                if self.max_bytes is None
+                else self.max_bytes // DTYPE.itemsize,
+            )
+            if limit is not None
+        ]
+        return min(limits) if limits else None
+
+    def weights(self) -> np.ndarray:
+        """
+            The weight of each gaussian, decayed to the latest time step
+        """
+        weight = self.rows["weight"].astype(float)
+        if self.decay == 1:
+            return weight
+        return weight * self.decay ** (self.time - self.rows["seen"])
+
+    def ordered(self) -> np.ndarray:
+        """
+            Indices of the gaussians sorted by when they were first observed
+        """
+        return np.argsort(self.rows["order"])
+
+    def add(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        mean: np.ndarray,
+        std: np.ndarray,
+        distance: np.ndarray,
+        angle_delta: np.ndarray,
+        steps: np.ndarray,
+        order: Optional[np.ndarray] = None,
+    ):
+        """
+            Adds N observations (in the order in which they were made) with
+            the time step each comes from, merging them with the gaussians
+            in the same cell. Observations are numbered in the order they're
+            added, unless their order is given (e.g. when observations
+            removed from the store are added again).
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if not len(x):
+            return
+        mean, std = np.asarray(mean), np.asarray(std)
+        steps = np.asarray(steps)
+        keys = gaussian_keys(x, y, mean)
+        if order is None:
+            order = self.n_observed + np.arange(len(x))
+        order = np.asarray(order, dtype=np.int64)
+
+        # merge the observations of the same cell
+        unique, first, inverse, counts = np.unique(
+            keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.ravel()
+        last = np.argsort(inverse, kind="stable")[np.cumsum(counts) - 1]
+
+        new = np.zeros(len(unique), dtype=DTYPE)
+        new["key"] = unique
+        for name, values in (("x", x), ("y", y), ("mean", mean), ("std", std)):
+            new[name] = np.bincount(inverse, weights=values) / counts
+        new["distance"] = np.asarray(distance)[last]
+        new["angle_delta"] = np.asarray(angle_delta)[last]
+        new["weight"] = counts
+        new["seen"] = new["owner"] = steps[last]
+        new["order"] = order[first]
+        self.n_observed = max(self.n_observed, int(order.max()) + 1)
+        self.time = max(self.time, int(steps.max()))
+
+        # merge with the stored gaussians of the same cells
+        position = np.searchsorted(self.rows["key"], unique)
+        found = position < len(self.rows)
+        found[found] = self.rows["key"][position[found]] == unique[found]
+
+        rows = self.rows[position[found]]
+        merged = new[found]
+        weight = rows["weight"] * self.decay ** (
+            merged["seen"] - rows["seen"]
+        ).astype(float)
+        total = weight + merged["weight"]
+        for name in ("x", "y", "mean", "std"):
+            rows[name] = (
+                rows[name] * weight + merged[name] * merged["weight"]
+            ) / total
+        for name in ("distance", "angle_delta", "seen", "owner"):
+            rows[name] = merged[name]
+        rows["weight"] = total
+        rows["order"] = np.minimum(rows["order"], merged["order"])
+        self.rows[position[found]] = rows
+
+        self.rows = np.insert(self.rows, position[~found], new[~found])
+        self.evict()
+
+    def remove(self, mask: np.ndarray):
+        """
+            Removes the gaussians selected by a boolean mask
+        """
+        self.rows = self.rows[~mask]
+
+    def remove_keys(self, keys: np.ndarray):
+        """
+            Removes the gaussians with the given keys (see gaussian_keys)
+        """
+        self.remove(np.isin(self.rows["key"], keys))
+
+    def evict(self):
+        """
+            Evicts the gaussians that are too old or weak and, beyond
+            capacity, the least recently observed or oldest ones
+        """
+        evict = np.zeros(len(self.rows), dtype=bool)
+        if self.max_age is not None:
+            evict |= self.time - self.rows["seen"] > self.max_age
+        if self.decay != 1:
+            evict |= self.weights() < self.min_weight
+        self.remove(evict)
+
+        if self.capacity is not None:
+            excess = len(self.rows) - self.capacity
+            if excess > 0:
+                if self.eviction == "lru":
+                    oldest = np.lexsort(
+                        (self.rows["order"], self.rows["seen"])
+                    )
+                else:
+                    oldest = np.argsort(self.rows["order"])
+                oldest = oldest[:excess]
+                evict = np.zeros(len(self.rows), dtype=bool)
+                evict[oldest] = True
+                self.remove(evict)
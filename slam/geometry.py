@@ -1,12 +1,88 @@
 from __future__ import annotations
 
-import matplotlib.pyplot as plt
 import numpy as np
-from typing import Union, Optional
+from dataclasses import dataclass
+from typing import Tuple, Union, Optional, TYPE_CHECKING
 
-from kino.geometry.point import Point
-from kino.geometry import Vector
-from kino.geometry.interpolation import lerp
+from slam.backend import kernel
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+
+@dataclass
+class Point:
+    x: float
+    y: float
+
+    @property
+    def xy(self) -> np.ndarray:
+        return np.array([self.x, self.y])
+
+
+class Vector:
+    """
+        A 2D vector
+    """
+
+    def __init__(self, x: float, y: float):
+        self.x = x
+        self.y = y
+
+    def __repr__(self) -> str:
+        return f"Vector @ ({self.x:.3f}, {self.y:.3f})"
+
+    def __add__(self, other: Vector) -> Vector:
+        return Vector(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other: Vector) -> Vector:
+        return Vector(self.x - other.x, self.y - other.y)
+
+    @property
+    def xy(self) -> np.ndarray:
+        return np.array([self.x, self.y])
+
+    def as_array(self) -> np.ndarray:
+        return np.array([self.x, self.y])
+
+    @property
+    def magnitude(self) -> float:
+        return np.sqrt(self.x ** 2 + self.y ** 2)
+
+    @property
+    def angle(self) -> float:
+        """
+            Returns the angle in degrees in range (-180,180)
+        """
+        return np.degrees(np.arctan2(self.y, self.x))
+
+    @property
+    def angle2(self) -> float:
+        """
+            Returns the angle in degrees in range(0, 360)
+        """
+        angle = self.angle
+        if angle < 0:
+            angle = 360 + angle
+        return angle
+
+    def rotate(self, angle: float) -> Vector:
+        """
+            Rotates the vector by a given angle (in degrees)
+        """
+        theta = np.radians(angle)
+        cos, sin = np.cos(theta), np.sin(theta)
+        return Vector(
+            cos * self.x - sin * self.y, sin * self.x + cos * self.y
+        )
+
+
+def lerp(x0: float, x1: float, p: float) -> float:
+    """
+        Interplates linearly between two values such that when p=0
+        the interpolated value is x0 and at p=1 it's x1
+    """
+    return (1 - p) * x0 + p * x1
 
 
 def distance(p1: Union[Point, Vector], p2: Union[Point, Vector]) -> float:
@@ -35,6 +111,125 @@ def segments_intersection(
     return Point(x, y)
 
 
+@kernel
+def rays_segments_intersection(
+    p0: np.ndarray, p1: np.ndarray, segments: np.ndarray
+) -> np.ndarray:
+    """
+        Intersects R rays (segments from p0 to p1, both (R, 2) arrays) with S
+        segments (an (S, 4) array of x0, y0, x1, y1) and returns an (R, S)
+        array with the fraction of each ray's length at which it crosses
+        each segment (NaN where they don't intersect).
+    """
+    d = (p1 - p0)[:, None, :]  # (R, 1, 2)
+    e = (segments[:, 2:] - segments[:, :2])[None, :, :]  # (1, S, 2)
+    w = segments[None, :, :2] - p0[:, None, :]  # (R, S, 2)
+
+    denom = d[..., 0] * e[..., 1] - d[..., 1] * e[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (w[..., 0] * e[..., 1] - w[..., 1] * e[..., 0]) / denom
+        u = (w[..., 0] * d[..., 1] - w[..., 1] * d[..., 0]) / denom
+
+    valid = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return np.where(valid, t, np.nan)
+
+
+def rays_circles_intersection(
+    p0: np.ndarray, p1: np.ndarray, circles: np.ndarray
+) -> np.ndarray:
+    """
+        Intersects R rays (segments from p0 to p1, both (R, 2) arrays) with C
+        circles (a (C, 3) array of center x, y and radius) and returns an (R, C)
+        array with the fraction of each ray's length at which it first
+        crosses each circle (NaN where they don't intersect).
+    """
+    d = (p1 - p0)[:, None, :]  # (R, 1, 2)
+    f = p0[:, None, :] - circles[None, :, :2]  # (R, C, 2)
+
+    a = np.sum(d ** 2, axis=-1)
+    b = np.sum(d * f, axis=-1)
+    c = np.sum(f ** 2, axis=-1) - circles[None, :, 2] ** 2
+    discriminant = b ** 2 - a * c
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(discriminant)
+        t_in = (-b - root) / a
+        t_out = (-b + root) / a
+
+    # first crossing along the ray, the exit point if the ray starts inside
+    t = np.where(t_in >= 0, t_in, t_out)
+    valid = (discriminant >= 0) & (t >= 0) & (t <= 1)
+    return np.where(valid, t, np.nan)
+
+
+def points_segments_distance(
+    points: np.ndarray, segments: np.ndarray
+) -> np.ndarray:
+    """
+        Distance from each of N points (an (N, 2) array) to each of S segments
+        (an (S, 4) array of x0, y0, x1, y1), as an (N, S) array.
+    """
+    e = (segments[:, 2:] - segments[:, :2])[None, :, :]  # (1, S, 2)
+    w = points[:, None, :] - segments[None, :, :2]  # (N, S, 2)
+
+    length = np.sum(e ** 2, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.sum(w * e, axis=-1) / length
+    t = np.clip(np.nan_to_num(t), 0, 1)  # degenerate segments: their start
+    return np.linalg.norm(w - t[..., None] * e, axis=-1)
+
+
+@kernel
+def points_in_polygons(
+    points: np.ndarray, segments: np.ndarray, owners: np.ndarray, n: int
+) -> np.ndarray:
+    """
+        Even-odd test of N points against polygons given as S edges (an (S, 4)
+        array) with the index of the polygon they belong to (owners, in [0, n)
+        and sorted). Returns an (N, n) boolean array.
+    """
+    x, y = points[:, 0:1], points[:, 1:2]  # (N, 1)
+    x0, y0, x1, y1 = segments.T  # (S,)
+
+    crosses_y = (y0 > y) != (y1 > y)  # (N, S)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    crossings = crosses_y & (x < x_cross)
+
+    inside = np.zeros((len(points), n), dtype=bool)
+    if len(segments):
+        polygons, starts = np.unique(owners, return_index=True)
+        counts = np.add.reduceat(crossings.astype(np.int64), starts, axis=1)
+        inside[:, polygons] = counts % 2 == 1
+    return inside
+
+
+def project_beams(
+    poses: np.ndarray,
+    distances: np.ndarray,
+    angles: np.ndarray,
+    head_offset: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Projects the points at which B beams (distances and angles in degrees,
+        relative to the heading) detected an object from N poses (an (N, 3)
+        array of x, y, theta in degrees) of an agent whose lidar is head_offset
+        in front of its center. Returns the (N, B) x and y coordinates.
+    """
+    # cos(a + b) = cos(a)cos(b) - sin(a)sin(b): only N + B cosines are computed
+    theta = np.radians(poses[:, 2])
+    cos, sin = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    beam_cos = distances * np.cos(np.radians(angles))
+    beam_sin = distances * np.sin(np.radians(angles))
+
+    head_x = poses[:, 0, None] + head_offset * cos
+    head_y = poses[:, 1, None] + head_offset * sin
+    return (
+        head_x + cos * beam_cos - sin * beam_sin,
+        head_y + sin * beam_cos + cos * beam_sin,
+    )
+
+
 class Line:
     def __init__(
         self,
@@ -104,7 +299,7 @@ class Line:
             y = self.slope * x + self.intercept
         return Point(x, y)
 
-    def draw(self, ax: plt.Axes):
+    def draw(self, ax: "plt.Axes"):
         ax.axline(
             (0, self.intercept),
             slope=self.slope,
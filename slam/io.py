@@ -0,0 +1,47 @@
+"""
+    Helpers for the versioned on-disk formats used to persist maps, planners
+    and recorded runs. Each saved object is a folder with a metadata.json
+    file and a set of .npy arrays.
+"""
+import json
+from pathlib import Path
+from typing import Union
+
+# 2: recordings store the lidar beams
+# 3: maps store the gaussians as merged cells with their weights
+FORMAT_VERSION: int = 3
+
+
+def save_metadata(path: Union[str, Path], kind: str, **metadata):
+    """
+        Writes the metadata file for a saved object of a given kind
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    with open(path / "metadata.json", "w") as fout:
+        json.dump(
+            dict(kind=kind, version=FORMAT_VERSION, **metadata),
+            fout,
+            indent=4,
+        )
+
+
+def load_metadata(path: Union[str, Path], kind: str) -> dict:
+    """
+        Loads the metadata of a saved object, checking that it is of the
+        expected kind and that its format version is supported.
+    """
+    path = Path(path)
+    with open(path / "metadata.json", "r") as fin:
+        metadata = json.load(fin)
+
+    if metadata.get("kind") != kind:
+        raise ValueError(
+            f'Expected a saved {kind} at "{path}", found: {metadata.get("kind")}'
+        )
+    if metadata.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f'Unsupported {kind} format version: {metadata.get("version")}'
+        )
+    return metadata
@@ -0,0 +1,147 @@
+from typing import Sequence, Tuple, Union, TYPE_CHECKING
+import numpy as np
+
+from slam.colors import salmon_dark, blue_light
+
+from slam.obstacle import PackedObstacles
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+
+class LidarSensor:
+    """
+        A lidar with B beams, each with an angle (relative to the agent's
+        orientation) and a range. Beams are only stored as arrays and all
+        beams are cast at once against the packed obstacles.
+        Detected distances can be corrupted by gaussian noise and beams can
+        randomly fail to detect an obstacle (dropout).
+    """
+
+    def __init__(
+        self,
+        angles: Sequence[float],
+        ranges: Union[float, Sequence[float]],
+        noise_std: float = 0,
+        dropout: float = 0,
+        n_samples: int = 5,
+    ):
+        self.angles = np.asarray(angles, dtype=float)
+        self.ranges = np.broadcast_to(
+            np.asarray(ranges, dtype=float), self.angles.shape
+        ).copy()
+        self.noise_std = noise_std
+        self.dropout = dropout  # probability that a beam misses a detection
+
+        # distance values from start to end of each beam (B x n_samples)
+        self.sampled_distance = self.ranges[:, None] * np.linspace(
+            0, 1, n_samples
+        )
+
+        # results of the last scan
+        self.distances = np.full(len(self), np.nan)  # NaN for no detection
+        self.contacts = np.full((len(self), 2), np.nan)  # allocentric points
+        self.obstacles = np.full(len(self), -1)  # index of obstacle hit
+
+    @classmethod
+    def sweep(
+        cls,
+        n_beams: int = 360,
+        fov: float = 360,
+        max_range: float = 14,
+        **kwargs,
+    ) -> "LidarSensor":
+        """
+            A lidar with n_beams evenly spaced over a field of view (in degrees)
+            centered on the agent's orientation.
+        """
+        if fov >= 360:
+            angles = np.linspace(-180, 180, n_beams, endpoint=False)
+        else:
+            angles = np.linspace(-fov / 2, fov / 2, n_beams)
+        return cls(angles, max_range, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.angles)
+
+    def endpoints(
+        self, origin: np.ndarray, heading: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the start and end points (both (B, 2) arrays) of each
+            beam for a sensor at origin facing heading (in degrees).
+        """
+        theta = np.radians(heading + self.angles)
+        p0 = np.broadcast_to(np.asarray(origin, dtype=float), (len(self), 2))
+        p1 = p0 + self.ranges[:, None] * np.column_stack(
+            [np.cos(theta), np.sin(theta)]
+        )
+        return p0, p1
+
+    def scan(
+        self,
+        origin: np.ndarray,
+        heading: float,
+        obstacles: PackedObstacles,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """
+            Casts all beams and returns the distance at which each detected
+            an obstacle (NaN if it didn't). The noise and dropout are drawn
+            from rng.
+        """
+        p0, p1 = self.endpoints(origin, heading)
+        fraction, self.obstacles = obstacles.cast(p0, p1)
+
+        self.contacts = p0 + (p1 - p0) * fraction[:, None]
+        distances = fraction * self.ranges
+
+        # corrupt measurements
+        if self.noise_std or self.dropout:
+            if self.noise_std:
+                distances = np.clip(
+                    distances + rng.normal(0, self.noise_std, len(self)),
+                    0,
+                    self.ranges,
+                )
+            if self.dropout:
+                distances[rng.random(len(self)) < self.dropout] = np.nan
+
+        self.distances = distances
+        return distances
+
+    def clear(self):
+        """
+            Sets the sensor's state to no beam having detected anything
+        """
+        self.distances = np.full(len(self), np.nan)
+        self.contacts = np.full((len(self), 2), np.nan)
+        self.obstacles = np.full(len(self), -1)
+
+    def draw(self, ax: "plt.Axes", origin: np.ndarray, heading: float):
+        """
+            Draws the beams and the detected contacts
+        """
+        from matplotlib.collections import LineCollection
+
+        p0, p1 = self.endpoints(origin, heading)
+        ax.add_collection(
+            LineCollection(
+                np.stack([p0, p1], axis=1),
+                lw=2 if len(self) < 50 else 0.5,
+                linestyles=":",
+                color=salmon_dark,
+                zorder=99,
+            )
+        )
+
+        detected = ~np.isnan(self.distances)
+        ax.scatter(
+            self.contacts[detected, 0],
+            self.contacts[detected, 1],
+            s=60 if len(self) < 50 else 10,
+            lw=1,
+            ec="k",
+            color=blue_light,
+            zorder=100,
+        )
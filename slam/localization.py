@@ -0,0 +1,182 @@
+from typing import Optional, Tuple
+import numpy as np
+
+from slam._map import GridPoint, confidence
+from slam.geometry import project_beams
+
+
+class ParticleFilter:
+    """
+        Monte Carlo localization: the agent's pose (x, y, theta in degrees) is
+        tracked by a cloud of particles which are moved with the (noisy) odometry
+        and weighted by how well the lidar detections, projected from each
+        particle's pose, match the occupancy grid of the map built so far.
+        All particles are moved and scored at once as arrays.
+    """
+
+    # the log-likelihood of a detection falls with the square of its distance
+    # from the closest occupied cell, in units of hit_std and up to max_std of
+    # them. Detections in unknown/unexplored cells count as the furthest.
+    hit_std: float = 1
+    max_std: float = 3
+
+    # the beams of a scan aren't independent: each detection's log-likelihood
+    # is down-weighted, so that one scan doesn't collapse the particles on a
+    # single pose the map can't tell apart from its neighbours
+    beam_weight: float = 0.02
+
+    def __init__(
+        self,
+        n_particles: int = 2000,
+        speed_std: float = 0.05,
+        omega_std: float = 1,
+        init_std: Tuple[float, float, float] = (0.1, 0.1, 1),
+        resample_threshold: float = 0.5,
+        *,
+        rng: np.random.Generator,
+    ):
+        self.n_particles = n_particles
+        self.speed_std = speed_std  # motion model noise
+        self.omega_std = omega_std
+        self.init_std = init_std
+        self.resample_threshold = resample_threshold  # fraction of particles
+        self.rng = rng
+
+        self._grid: Optional[np.ndarray] = None
+        self._threshold = np.nan
+        self._table = np.zeros((0, 0))
+        self.reset()
+
+    def reset(self, x: float = 0, y: float = 0, theta: float = 0):
+        """
+            Spreads the particles around a pose
+        """
+        noise = self.rng.normal(0, self.init_std, (self.n_particles, 3))
+        self.particles = np.array([x, y, theta], dtype=float) + noise
+        self.weights = np.full(self.n_particles, 1 / self.n_particles)
+
+    @property
+    def effective_size(self) -> float:
+        return 1 / np.sum(self.weights ** 2)
+
+    def predict(self, speed: float, omega: float):
+        """
+            Moves each particle with the odometry plus noise, with the same
+            kinematics as the agent (move along the heading, then turn)
+        """
+        n = self.n_particles
+        speeds = speed + self.rng.normal(0, self.speed_std, n)
+        theta = np.radians(self.particles[:, 2])
+
+        self.particles[:, 0] += speeds * np.cos(theta)
+        self.particles[:, 1] += speeds * np.sin(theta)
+        self.particles[:, 2] += omega + self.rng.normal(0, self.omega_std, n)
+
+    def score(
+        self,
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+        grid: np.ndarray,
+        origin: Tuple[int, int],
+        confidence_threshold: float = GridPoint.confidence_threshold,
+    ) -> np.ndarray:
+        """
+            Returns the log-likelihood of a scan (the distance at which each beam
+            detected an object, NaN for no detection) for each particle, given
+            the map's grid (indexed [y, x], see Map.grid_array) and the
+            threshold above which its cells are free.
+        """
+        detected = ~np.isnan(distances)
+        if not np.any(detected) or not grid.size:
+            return np.zeros(self.n_particles)
+        distances, angles = distances[detected], angles[detected]
+        table = self._likelihood_table(grid, confidence_threshold)
+
+        # project the detections from each particle (N x B)
+        px, py = project_beams(self.particles, distances, angles, head_offset)
+
+        # look up the cells (the table has a border of unknown cells
+        # for the points outside of the grid)
+        height, width = table.shape
+        ix = np.clip(np.rint(px) - (origin[0] - 1), 0, width - 1)
+        iy = np.clip(np.rint(py) - (origin[1] - 1), 0, height - 1)
+        ix, iy = ix.astype(np.intp), iy.astype(np.intp)
+        return table.ravel()[iy * width + ix].sum(axis=1)
+
+    def _likelihood_table(
+        self, grid: np.ndarray, confidence_threshold: float
+    ) -> np.ndarray:
+        """
+            The (weighted) log-likelihood of a detection in each cell of the
+            grid, padded with unknown cells. Cached as long as the same grid
+            array (and threshold) is given, see Map.grid_array.
+        """
+        if grid is not self._grid or confidence_threshold != self._threshold:
+            from scipy.ndimage import distance_transform_edt
+
+            # NaN for cells not in the grid
+            conf = confidence(grid, confidence_threshold)
+            occupied = conf < 0
+            distance = (
+                distance_transform_edt(~occupied)
+                if occupied.any()
+                else np.full(grid.shape, np.inf)
+            )
+            log_far = -0.5 * self.max_std ** 2
+            log_likelihood = -0.5 * (
+                np.minimum(distance / self.hit_std, self.max_std) ** 2
+            )
+            log_likelihood[np.isnan(conf)] = log_far
+            self._table = self.beam_weight * np.pad(
+                log_likelihood, 1, constant_values=log_far
+            )
+            self._grid, self._threshold = grid, confidence_threshold
+        return self._table
+
+    def update(
+        self,
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+        grid: np.ndarray,
+        origin: Tuple[int, int],
+        confidence_threshold: float = GridPoint.confidence_threshold,
+    ):
+        """
+            Re-weights the particles given a scan and resamples them when
+            the effective number of particles gets too low
+        """
+        log_weights = np.log(self.weights) + self.score(
+            distances, angles, head_offset, grid, origin, confidence_threshold
+        )
+        weights = np.exp(log_weights - log_weights.max())
+        self.weights = weights / weights.sum()
+
+        if self.effective_size < self.resample_threshold * self.n_particles:
+            self.resample()
+
+    def resample(self):
+        """
+            Systematic resampling
+        """
+        n = self.n_particles
+        positions = (self.rng.random() + np.arange(n)) / n
+        idx = np.minimum(
+            np.searchsorted(np.cumsum(self.weights), positions), n - 1
+        )
+        self.particles = self.particles[idx]
+        self.weights = np.full(n, 1 / n)
+
+    def estimate(self) -> Tuple[float, float, float]:
+        """
+            Returns the weighted mean pose of the particles (theta in -180, 180)
+        """
+        x, y = self.weights @ self.particles[:, :2]
+        theta = np.radians(self.particles[:, 2])
+        theta = np.degrees(
+            np.arctan2(
+                self.weights @ np.sin(theta), self.weights @ np.cos(theta)
+            )
+        )
+        return float(x), float(y), float(theta)
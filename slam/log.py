@@ -0,0 +1,14 @@
+"""
+    Logging goes through loguru, which is only imported the first time
+    something is logged so that importing slam stays fast.
+"""
+
+
+class _LazyLogger:
+    def __getattr__(self, name: str):
+        from loguru import logger
+
+        return getattr(logger, name)
+
+
+logger = _LazyLogger()
@@ -1,21 +1,75 @@
-from typing import List, Dict, Tuple, Optional
-import matplotlib.pyplot as plt
+from typing import Dict, Sequence, Tuple, Optional, Union, TYPE_CHECKING
 import numpy as np
-import pandas as pd
 from copy import deepcopy
+from pathlib import Path
+
+from slam.colors import red_dark, blue_darker, red_light
+
+from slam._map import (
+    GridPoint,
+    classify,
+    confidence,
+    integrate_odometry,
+    splat_values,
+)
+from slam.costmap import Costmap
+from slam.gaussians import GaussianStore, gaussian_keys
+from slam.io import save_metadata, load_metadata
+from slam.lidar import LidarSensor
+from slam.localization import ParticleFilter
+from slam.log import logger
+from slam.pose_graph import PoseGraph
+from slam.scan_matching import ScanMatcher
+from slam.tiles import TiledGrid
+from slam.plot_utils import confidence_image
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+# the gaussians as splatted in the grid (see Map.get_grid_map), sorted by key
+SPLATTED = np.dtype(
+    [
+        ("key", "i8"),  # see GaussianStore
+        ("x", "f8"),  # center cell
+        ("y", "f8"),
+        ("mean", "f8"),  # times the weight, when decayed below 1
+        ("std", "f8"),
+        ("order", "i8"),
+    ]
+)
+
+_RING = np.linspace(0, 2 * np.pi, 6)
+_NEIGHBORS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+_OFFSET: int = 2 ** 31
+
+
+def _cell_keys(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+        Packs integer (x, y) coordinates in a single int64 key
+    """
+    x = np.asarray(x).astype(np.int64) + _OFFSET
+    y = np.asarray(y).astype(np.int64) + _OFFSET
+    return (x << 32) + y
 
-from myterial import red_dark, blue_darker, red_light
-from kino.geometry import Vector
-from kino.geometry.point import Point
 
-from slam.ray import Contact
-from slam._map import Gaussian, GridPoint
+def _footprint(gaussians: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        The x and y coordinates (G x 7) of the cell at the center of each
+        splatted gaussian and of the 6 cells on a circle of radius std
+        around it
+    """
+    x, y = gaussians["x"][:, None], gaussians["y"][:, None]
+    std = gaussians["std"][:, None]
+    return (
+        np.hstack([x, np.round(x + std * np.cos(_RING))]),
+        np.hstack([y, np.round(y + std * np.sin(_RING))]),
+    )
 
 
 class Map:
     """ Stores two types of information:
-            events: pd.DataFrame with speed/angular velocity at each frame and the distance of 
-                each ray detected event
+            events: dict with speed/angular velocity at each frame and the distance at which
+                each lidar beam detected an object
             map_gaussians_events: dict. A dictionary storying at each explored location in space a gaussian
                 which represents the belief that the point is either free or occupied.
     """
@@ -26,202 +80,699 @@ class Map:
     free_gaussian_radius: float = 1
     occupied_gaussian_radius: float = 1
 
-    def __init__(self, agent):
+    # cells with a value above this are certainly free
+    confidence_threshold: float = GridPoint.confidence_threshold
+
+    # the grid is stored in tiles, the least recently used beyond max_tiles
+    # are moved to disk
+    tile_size: int = 64
+    max_tiles: Optional[int] = None
+
+    # with a pose graph, the gaussians of the latest steps are kept to project
+    # them again when loops are closed. Older steps are not projected again
+    # and drop out of the cells merged again
+    max_projected_steps: int = 5000
+
+    def __init__(
+        self,
+        agent,
+        localizer: Optional[ParticleFilter] = None,
+        scan_matcher: Optional[ScanMatcher] = None,
+        pose_graph: Optional[PoseGraph] = None,
+        gaussians: Optional[GaussianStore] = None,
+    ):
         self.agent = agent
+        self.localizer = localizer  # if None the odometry is trusted
+        self.scan_matcher = scan_matcher  # refines each step's pose
+        self.pose_graph = pose_graph  # closes loops
+
+        # with a pose graph, the gaussians of the latest steps (and the order
+        # of each step's first one in the store) are kept to project them
+        # again when the step's pose is corrected
+        self.projected_events: Dict[int, np.ndarray] = dict()
+        self.projected_order: Dict[int, int] = dict()
 
         self.events = self.reset()
 
-        self.map_gaussians_events: Dict[int, List[Gaussian]] = dict()
-        self.map_gaussians: Dict[Tuple[int, int], Gaussian] = dict()
+        self.map_gaussians_events: Dict[int, np.ndarray] = dict()
+        self._free_gaussians: Optional[Tuple[LidarSensor, np.ndarray]] = None
+        self.map_gaussians = (
+            gaussians if gaussians is not None else GaussianStore()
+        )
         self.time = 0  # to be incremented everytime the map is updated
 
         self.agent_trajectory = dict(x=[0], y=[0], theta=[0])
 
-    def add(self, *events: Contact):
+        # updated in place by each build (see get_grid_map)
+        self.grid = TiledGrid(self.tile_size, max_tiles=self.max_tiles)
+        self.grid_version = 0  # incremented when the grid changes
+        self._grid_points: Optional[dict] = None  # see grid_points
+        self._grid_array: Optional[tuple] = None  # see grid_array
+
+        # the gaussians splatted in the grid by the last build (for a loaded
+        # grid, the ones loaded with it: taken at the next build)
+        self._splatted = np.zeros(0, dtype=SPLATTED)
+        self._splatted_loaded = True
+
+        # distance of each point from the obstacles, for planning/steering
+        self._costmap = Costmap()
+        self._costmap_loaded = True  # see costmap
+
+    def add(self, distances: Optional[np.ndarray] = None):
         """
-            Given a list of ray-object contact events (in egocentric coordinates)
-            stores the distance each ray picked up an object together witht he robot's
-            kinematics.
+            Given the distance at which each lidar beam detected an object (NaN
+            for no detection, defaults to the agent's last scan) stores it
+            together with the robot's kinematics as measured by its odometry.
 
             It also stores the location of Free vs Occupied gaussians.
         """
+        self.add_step(
+            *self.agent.odometry,
+            self.agent.lidar.distances if distances is None else distances,
+        )
 
-        self.events["speed"].append(self.agent._current_speed)
-        self.events["omega"].append(self.agent._current_omega)
-
-        timestep_gaussians: List[Gaussian] = []
-        for ray in self.agent.rays:
-            ray_events = [ev for ev in events if ev.ray == ray]
-            if not ray_events:
-                # empty event
-                self.events[str(ray.angle_shift)].append(np.nan)
-
-                # store Free gaussians
-                timestep_gaussians.extend(
-                    [
-                        Gaussian(
-                            self.free_gaussian_value,
-                            self.free_gaussian_radius,
-                            point_distance,
-                            ray.angle_shift,
-                        )
-                        for point_distance in ray.sampled_distance
-                    ]
-                )
-            else:
-                # object detection !
-                detection_distance = ray_events[0].distance
-                self.events[str(ray.angle_shift)].append(detection_distance)
-
-                # store Free gaussians
-                free_points = [
-                    point_distance
-                    for point_distance in ray.sampled_distance
-                    if point_distance < detection_distance
-                ]
-                timestep_gaussians.extend(
-                    [
-                        Gaussian(
-                            self.free_gaussian_value,
-                            self.free_gaussian_radius,
-                            point_distance,
-                            ray.angle_shift,
-                        )
-                        for point_distance in free_points
-                    ]
-                )
+    def add_step(
+        self, speed: float, omega: float, distances: Sequence[float]
+    ):
+        """
+            Stores the kinematics of a time step together with the distance
+            at which each beam detected an object (NaN for no detection), e.g.
+            when replaying a recorded run without the agent's environment.
+        """
+        lidar = self.agent.lidar
+        distances = np.asarray(distances, dtype=float)
+        detected = ~np.isnan(distances)
 
-                # store Occupied gaussian
-                timestep_gaussians.append(
-                    Gaussian(
-                        self.occupied_gaussian_value,
-                        self.occupied_gaussian_radius,
-                        detection_distance,
-                        ray.angle_shift,
-                    )
-                )
+        self.events["speed"].append(speed)
+        self.events["omega"].append(omega)
+        self.events["distances"].append(distances)
+
+        if np.any(detected):
+            gaussians = self._step_gaussians(lidar, distances)
+        else:
+            gaussians = self._clear_step_gaussians(lidar)
 
-        self.map_gaussians_events[self.time] = timestep_gaussians
+        self.map_gaussians_events[self.time] = gaussians
         self.time += 1
 
+    def add_clear_steps(self, odometry: Sequence[Tuple[float, float]]):
+        """
+            Stores the kinematics (speed, omega) of consecutive time steps
+            whose scans detected nothing, all at once (see add_step)
+        """
+        lidar = self.agent.lidar
+        n_steps = len(odometry)
+        distances = np.full(len(lidar), np.nan)
+        distances.setflags(write=False)
+        gaussians = self._clear_step_gaussians(lidar)
+
+        for speed, omega in odometry:
+            self.events["speed"].append(speed)
+            self.events["omega"].append(omega)
+        self.events["distances"].extend([distances] * n_steps)
+        self.map_gaussians_events.update(
+            dict.fromkeys(range(self.time, self.time + n_steps), gaussians)
+        )
+        self.time += n_steps
+
+    def _clear_step_gaussians(self, lidar: LidarSensor) -> np.ndarray:
+        """
+            The gaussians of a scan detecting nothing, the same for all steps
+        """
+        cached = self._free_gaussians
+        if cached is None or cached[0] is not lidar:
+            free_gaussians = self._step_gaussians(
+                lidar, np.full(len(lidar), np.nan)
+            )
+            free_gaussians.setflags(write=False)
+            self._free_gaussians = (lidar, free_gaussians)
+        return self._free_gaussians[1]
+
+    def _step_gaussians(
+        self, lidar: LidarSensor, distances: np.ndarray
+    ) -> np.ndarray:
+        """
+            Returns the gaussians of a step's scan, as rows of mean, std,
+            distance and angle_delta (relative to the agent's pose)
+        """
+        detected = ~np.isnan(distances)
+
+        # for each beam: Free gaussians at sampled points before the detection
+        # (all of them if nothing was detected) followed by an Occupied one
+        # at the detection point
+        with np.errstate(invalid="ignore"):
+            free = ~detected[:, None] | (
+                lidar.sampled_distance < distances[:, None]
+            )
+        keep = np.hstack([free, detected[:, None]])
+
+        mean = np.full(keep.shape, float(self.free_gaussian_value))
+        mean[:, -1] = self.occupied_gaussian_value
+        std = np.full(keep.shape, float(self.free_gaussian_radius))
+        std[:, -1] = self.occupied_gaussian_radius
+        distance = np.hstack([lidar.sampled_distance, distances[:, None]])
+        angle = np.broadcast_to(lidar.angles[:, None], keep.shape)
+
+        return np.column_stack(
+            [mean[keep], std[keep], distance[keep], angle[keep]]
+        )
+
     def reset(self) -> dict:
         """
             Returns an empty dictionary
         """
-        events: Dict[str, List[float]] = {
-            **{"speed": [], "omega": []},
-            **{str(ray.angle_shift): [] for ray in self.agent.rays},
-        }
+        events: Dict[str, list] = dict(speed=[], omega=[], distances=[])
         return events
 
     def get_agent_trajectory(self):
         """
-            Reconstructs the agent's trajectory from the first recorded time step
+            Reconstructs the agent's trajectory from the first recorded time
+            step, either integrating the odometry or, with a localizer,
+            correcting it by matching each scan against the grid built so far.
+            With a scan matcher each pose is then aligned to the occupied cells.
         """
-        data = pd.DataFrame(self.events)
+        if (
+            self.localizer is None
+            and self.scan_matcher is None
+            and self.pose_graph is None
+        ):
+            # just the odometry: integrated in a single call
+            trajectory = self.agent_trajectory
+            for name, values in zip(
+                ("x", "y", "theta"),
+                integrate_odometry(
+                    float(trajectory["x"][-1]),
+                    float(trajectory["y"][-1]),
+                    float(trajectory["theta"][-1]),
+                    np.asarray(self.events["speed"], dtype=float),
+                    np.asarray(self.events["omega"], dtype=float),
+                ),
+            ):
+                trajectory[name].extend(values.tolist())
+            self.events = self.reset()
+            return
+
+        if self.localizer is not None:
+            grid, origin = self.grid_array()
+
+        for speed, omega, distances in zip(
+            self.events["speed"],
+            self.events["omega"],
+            self.events["distances"],
+        ):
+            if self.localizer is None:
+                thet_rad = np.radians(self.agent_trajectory["theta"][-1])
+                x = self.agent_trajectory["x"][-1] + speed * np.cos(thet_rad)
+                y = self.agent_trajectory["y"][-1] + speed * np.sin(thet_rad)
+                theta = self.agent_trajectory["theta"][-1] + omega
+            else:
+                self.localizer.predict(speed, omega)
+                self.localizer.update(
+                    distances,
+                    self.agent.lidar.angles,
+                    self.agent.height / 2,
+                    grid,
+                    origin,
+                    self.confidence_threshold,
+                )
+                x, y, theta = self.localizer.estimate()
+
+            if self.scan_matcher is not None:
+                x, y, theta = self.scan_matcher.match(
+                    (x, y, theta),
+                    distances,
+                    self.agent.lidar.angles,
+                    self.agent.height / 2,
+                )
 
-        for i, step in data.iterrows():
-            thet_rad = np.radians(self.agent_trajectory["theta"][-1])
-            self.agent_trajectory["x"].append(
-                self.agent_trajectory["x"][-1] + step.speed * np.cos(thet_rad)
-            )
-            self.agent_trajectory["y"].append(
-                self.agent_trajectory["y"][-1] + step.speed * np.sin(thet_rad)
-            )
-            self.agent_trajectory["theta"].append(
-                self.agent_trajectory["theta"][-1] + step.omega
-            )
+            self.agent_trajectory["x"].append(x)
+            self.agent_trajectory["y"].append(y)
+            self.agent_trajectory["theta"].append(theta)
 
             if self.agent_trajectory["theta"][-1] > 360:
                 self.agent_trajectory["theta"][-1] -= 360
             elif self.agent_trajectory["theta"][-1] < 0:
                 self.agent_trajectory["theta"][-1] += 360
 
+            if self.pose_graph is not None:
+                self.pose_graph.add(
+                    len(self.agent_trajectory["x"]) - 2,
+                    (x, y, self.agent_trajectory["theta"][-1]),
+                    distances,
+                    self.agent.lidar.angles,
+                    self.agent.height / 2,
+                )
+
         self.events = self.reset()
 
+    def close_loops(self):
+        """
+            Optimizes the pose graph, corrects the poses of the steps whose
+            keyframe moved and projects again their gaussians already in
+            the map: the cells they were or are now merged in are merged
+            again from all the steps kept, as if the map was built from
+            scratch with the corrected poses.
+        """
+        steps, poses = self.pose_graph.optimize()  # type: ignore
+        logger.debug(f"Map, loop closure corrected {len(steps)} steps")
+        stale = {
+            step: self.projected_events[step]
+            for step in steps.tolist()
+            if step in self.projected_events
+        }
+        before = self._projected_keys(stale)
+
+        for step, (x, y, theta) in zip(steps.tolist(), poses.tolist()):
+            self.agent_trajectory["x"][step + 1] = x
+            self.agent_trajectory["y"][step + 1] = y
+            self.agent_trajectory["theta"][step + 1] = theta % 360
+
+        # merge again the cells the corrected steps changed
+        if stale:
+            cells = np.union1d(before, self._projected_keys(stale))
+            self.map_gaussians.remove_keys(cells)
+
+            projected = self._projections(self.projected_events)
+            order = np.concatenate(
+                [
+                    self.projected_order[step] + np.arange(len(gaussians))
+                    for step, gaussians in self.projected_events.items()
+                ]
+            )
+            again = np.isin(gaussian_keys(*projected[:3]), cells)
+            self.map_gaussians.add(
+                *(values[again] for values in projected), order[again]
+            )
+
+        # the localizer continues from the corrected pose
+        if self.localizer is not None:
+            self.localizer.reset(
+                self.agent_trajectory["x"][-1],
+                self.agent_trajectory["y"][-1],
+                self.agent_trajectory["theta"][-1],
+            )
+
     def get_map_gaussians(self):
         """
             Reconstructs the location of the gaussian distributions annotations
         """
-        x = self.agent_trajectory["x"]
-        y = self.agent_trajectory["y"]
-        theta = self.agent_trajectory["theta"]
+        if self.pose_graph is not None:
+            # the store numbers the gaussians in the order they're added
+            order = self.map_gaussians.n_observed
+            for step, gaussians in self.map_gaussians_events.items():
+                self.projected_order[step] = order
+                order += len(gaussians)
+            self.projected_events.update(self.map_gaussians_events)
+
+            # forget the oldest steps (the dicts are sorted by step)
+            for step in list(self.projected_events)[
+                : -self.max_projected_steps
+            ]:
+                del self.projected_events[step]
+                del self.projected_order[step]
+        self._project_gaussians(self.map_gaussians_events)
 
-        for time, gaussians in self.map_gaussians_events.items():
-            for gauss in gaussians:
-                # get position of the head
-                head_shift = Vector(self.agent.height / 2, 0).rotate(
-                    theta[time + 1]
-                )
+        # empty dictionary to speed up next time map is build
+        self.map_gaussians_events: Dict[int, np.ndarray] = dict()
 
-                # get position of gaussian
-                _theta = np.radians(theta[time + 1] + gauss.angle_delta)
-                gauss.point = Point(
-                    x[time] + head_shift.x + np.cos(_theta) * gauss.distance,
-                    y[time] + head_shift.y + np.sin(_theta) * gauss.distance,
-                )
+    def _project_gaussians(self, events: Dict[int, np.ndarray]):
+        """
+            Projects the gaussians of some time steps from the step's pose
+            and adds them to the map
+        """
+        if events:
+            self.map_gaussians.add(*self._projections(events))
 
-                if gauss.mean > 0:
-                    gauss.point.x, gauss.point.y = (
-                        int(gauss.point.x),
-                        int(gauss.point.y),
-                    )
-                self.map_gaussians[(gauss.point.x, gauss.point.y)] = gauss
+    def _projected_keys(self, events: Dict[int, np.ndarray]) -> np.ndarray:
+        """
+            The keys of the gaussians the projected gaussians of some time
+            steps are merged in (see gaussian_keys)
+        """
+        if not events:
+            return np.zeros(0, dtype=np.int64)
+        px, py, mean = self._projections(events)[:3]
+        return np.unique(gaussian_keys(px, py, mean))
 
-        # empty dictionary to speed up next time map is build
-        self.map_gaussians_events: Dict[int, List[Gaussian]] = dict()
+    def _projections(self, events: Dict[int, np.ndarray]) -> Tuple:
+        """
+            Projects the gaussians of some time steps from the step's pose.
+            Returns their position, mean, std, distance, angle_delta and the
+            step they come from (see GaussianStore.add)
+        """
+        steps = np.concatenate(
+            [
+                np.full(len(gaussians), time)
+                for time, gaussians in events.items()
+            ]
+        )
+        mean, std, distance, angle_delta = np.vstack(list(events.values())).T
+
+        # each scan is taken at the pose reached at the end of its time step
+        x = np.asarray(self.agent_trajectory["x"])[steps + 1]
+        y = np.asarray(self.agent_trajectory["y"])[steps + 1]
+        theta = np.radians(
+            np.asarray(self.agent_trajectory["theta"])[steps + 1]
+        )
+
+        # position of the head, then of the gaussians
+        head = self.agent.height / 2
+        _theta = theta + np.radians(angle_delta)
+        px = x + head * np.cos(theta) + np.cos(_theta) * distance
+        py = y + head * np.sin(theta) + np.sin(_theta) * distance
+
+        # free gaussians are snapped to the grid
+        free = mean > 0
+        px[free], py[free] = np.trunc(px[free]), np.trunc(py[free])
+        return px, py, mean, std, distance, angle_delta, steps
+
+    def _splatted_gaussians(self) -> np.ndarray:
+        """
+            The gaussians in the map as they're splatted in the grid (see
+            SPLATTED)
+        """
+        rows = self.map_gaussians.rows
+        splatted = np.zeros(len(rows), dtype=SPLATTED)
+        splatted["key"] = rows["key"]
+        splatted["x"], splatted["y"] = np.round(rows["x"]), np.round(rows["y"])
+
+        # gaussians with a weight < 1 (decayed) count less
+        splatted["mean"] = rows["mean"].astype(float) * np.minimum(
+            self.map_gaussians.weights(), 1
+        )
+        splatted["std"] = rows["std"]
+        splatted["order"] = rows["order"]
+        return splatted
 
-    def get_grid_map(self):
+    def _changed_gaussians(self) -> Tuple[np.ndarray, np.ndarray]:
         """
-            Creates a 2D grid storing a value at each point, based on the sum
-            of nearby gaussians: used for planning.
+            Returns the gaussians splatted in the grid by the last build that
+            changed or were removed since (removed) and the current ones that
+            changed or are new (added)
         """
-        self.grid_points: Dict[Tuple[float, float], GridPoint] = dict()
+        old, new = self._splatted, self._splatted_gaussians()
+        self._splatted = new
+
+        position = np.searchsorted(old["key"], new["key"])
+        found = position < len(old)
+        found[found] = old[position[found]] == new[found]
+        kept = np.zeros(len(old), dtype=bool)
+        kept[position[found]] = True
+        return old[~kept], new[~found]
+
+    def get_grid_map(
+        self, removed: np.ndarray, added: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            Updates the 2D grid storing a value at each point, based on the
+            sum of nearby gaussians: used for planning.
+
+            Each gaussian sets the value of the cell at its center (if not set
+            yet) and adds 2 * mean * std to the cells on a circle of radius
+            std around it (setting them to mean * std first if not set yet).
+            Cells whose value is negative (occupied) don't change anymore.
+            As the result depends on the order of the gaussians, each cell's
+            values are accumulated in that order (as arrays).
+
+            Only the cells of the gaussians removed or added since the last
+            build (see _changed_gaussians) are computed again, in place.
+            Returns the (x, y) coordinates of the cells whose occupancy
+            changed and whether each is now occupied.
+        """
+        x, y = _footprint(np.concatenate([removed, added]))
+        dirty, first = np.unique(_cell_keys(x, y), return_index=True)
+        if not len(dirty):
+            return np.zeros(0), np.zeros(0), np.zeros(0, dtype=bool)
+        cells = np.column_stack([x.ravel()[first], y.ravel()[first]])
+
+        # the gaussians that can be on the dirty cells: those centered in
+        # the tiles around them (unless some are larger than the tiles)
+        gaussians = self._splatted
+        size = self.tile_size
+        if gaussians["std"].max(initial=0) < size:
+            tiles = np.unique(cells // size, axis=0)
+            near = (tiles[:, None, :] + _NEIGHBORS[None]).reshape(-1, 2)
+            gaussians = gaussians[
+                np.isin(
+                    _cell_keys(gaussians["x"] // size, gaussians["y"] // size),
+                    _cell_keys(near[:, 0], near[:, 1]),
+                )
+            ]
+        gaussians = gaussians[np.argsort(gaussians["order"])]
+
+        # the value a cell is set to by each event and the one added,
+        # keeping the events on the dirty cells
+        mean, std = gaussians["mean"], gaussians["std"]
+        ring_value = np.repeat((mean * std)[:, None], 6, axis=1)
+        initial = np.hstack([mean[:, None], ring_value]).ravel()
+        delta = np.hstack([np.zeros((len(mean), 1)), 2 * ring_value]).ravel()
+        keys = _cell_keys(*_footprint(gaussians)).ravel()
+        on_dirty = np.isin(keys, dirty)
+        keys = keys[on_dirty]
+        initial, delta = initial[on_dirty], delta[on_dirty]
+
+        # group the events by cell, keeping their order
+        splatted, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        inverse, initial, delta = inverse[order], initial[order], delta[order]
+        first = np.flatnonzero(np.diff(inverse, prepend=-1))
+
+        # dirty cells left without gaussians are cleared
+        values = np.full(len(dirty), np.nan)
+        values[np.searchsorted(dirty, splatted)] = splat_values(
+            inverse, initial, delta, first
+        )
+
+        previous = self.grid.read(cells[:, 0], cells[:, 1])
+        known = ~(np.isnan(previous) & np.isnan(values))
+        if np.any(known):
+            self.grid.write(cells[known, 0], cells[known, 1], values[known])
+            self.grid_version += 1
+            self._grid_points = None
+            self._grid_array = None
+
+        with np.errstate(invalid="ignore"):
+            occupied = values < 0
+            flipped = (previous < 0) != occupied
+        return cells[flipped, 0], cells[flipped, 1], occupied[flipped]
+
+    def _occupied_centers(
+        self, removed: np.ndarray, added: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            The centers of the Occupied gaussians removed or added since the
+            last build (see _changed_gaussians) and whether each is still the
+            center of one: the scan matcher's occupied cells, thinner than
+            in the grid
+        """
+        changed = np.concatenate([removed, added])
+        changed = changed[changed["mean"] < 0]
+        current = self._splatted[self._splatted["mean"] < 0]
+        occupied = np.isin(
+            _cell_keys(changed["x"], changed["y"]),
+            _cell_keys(current["x"], current["y"]),
+        )
+        return changed["x"], changed["y"], occupied
 
-        for gauss in self.map_gaussians.values():
-            x, y = round(gauss.point.x, 0), round(gauss.point.y, 0)
-            if (x, y) not in self.grid_points.keys():
-                self.grid_points[(x, y)] = GridPoint(x, y, value=gauss.mean)
+    def grid_cells(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            The (x, y) coordinates (sorted by x, then y) and the values of
+            the grid's cells, read from its tiles
+        """
+        xy, values = self.grid.known()
+        order = np.lexsort((xy[:, 1], xy[:, 0]))
+        return xy[order].astype(float), values[order]
 
-            # get sets of points around the center of the gaussian
-            Xs = x + gauss.std * np.cos(np.linspace(0, 2 * np.pi, 6))
-            Ys = y + gauss.std * np.sin(np.linspace(0, 2 * np.pi, 6))
+    @property
+    def grid_xy(self) -> np.ndarray:
+        return self.grid_cells()[0]
 
-            for x, y in zip(Xs, Ys):
-                x, y = round(x, 0), round(y, 0)
-                if (x, y) not in self.grid_points.keys():
-                    self.grid_points[(x, y)] = GridPoint(
-                        x, y, value=gauss.mean * gauss.std
-                    )
+    @property
+    def grid_values(self) -> np.ndarray:
+        return self.grid_cells()[1]
 
-                if self.grid_points[(x, y)].value >= 0:
-                    self.grid_points[(x, y)].value += (
-                        2 * gauss.mean * gauss.std
-                    )
+    @property
+    def grid_confidence(self) -> np.ndarray:
+        """
+            GridPoint.confidence of each of the grid's cells
+        """
+        return classify(self.grid_values, self.confidence_threshold)
+
+    @property
+    def costmap(self) -> Costmap:
+        """
+            The distance of each point from the obstacles: for a loaded map
+            it's computed from the grid the first time it's used
+        """
+        if not self._costmap_loaded:
+            self._costmap_loaded = True
+            xy, values = self.grid_cells()
+            occupied = values < 0
+            self._costmap.update(xy[occupied, 0], xy[occupied, 1], True)
+        return self._costmap
+
+    @property
+    def grid_points(self) -> Dict[Tuple[float, float], GridPoint]:
+        """
+            The grid's cells as GridPoints by (x, y) coordinates, created when
+            first needed after each build
+        """
+        if self._grid_points is None:
+            xy, values = self.grid_cells()
+            self._grid_points = {
+                (x, y): GridPoint(
+                    x,
+                    y,
+                    value=value,
+                    confidence_threshold=self.confidence_threshold,
+                )
+                for (x, y), value in zip(xy.tolist(), values.tolist())
+            }
+        return self._grid_points
 
     def build(self):
         """
             Integrates the stored robot motion to reconstruct the position of the dots,
             if a map was already built, it just adds to it.
         """
+        if not self._splatted_loaded:
+            self._splatted = self._splatted_gaussians()
+            self._splatted_loaded = True
+
         # reconstruct agent position at each time step
         self.get_agent_trajectory()
 
+        # optimize the trajectory when loops were closed
+        if self.pose_graph is not None and self.pose_graph.pending_loops:
+            self.close_loops()
+
         # reconstruct the map gaussians
         self.get_map_gaussians()
 
-        # reconstruct grid
-        self.get_grid_map()
+        # update the grid where the gaussians changed, then the costmap and
+        # the scan matcher's lookup tables where the occupied cells changed
+        removed, added = self._changed_gaussians()
+        self.costmap.update(*self.get_grid_map(removed, added))
+        if self.scan_matcher is not None:
+            self.scan_matcher.update(*self._occupied_centers(removed, added))
+
+    def grid_array(self) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+            Returns the grid points values as a 2D array (indexed as [y, x],
+            NaN where there's no grid point) and the (x, y) coordinates
+            of the array's first element. The array is read only and the same
+            one is returned until the grid changes, so that the localizer's
+            lookup table is only computed again then (see ParticleFilter).
+        """
+        if self._grid_array is None:
+            grid, origin = self.grid.to_array()
+            grid.flags.writeable = False
+            self._grid_array = (grid, origin)
+        return self._grid_array
 
-    def draw(self, ax: plt.Axes, ax2: Optional[plt.Axes] = None):
-        # plot localized agent
-        map_agent = deepcopy(self.agent)
-        map_agent.set(
-            x=self.agent_trajectory["x"][-1],
-            y=self.agent_trajectory["y"][-1],
-            angle=self.agent_trajectory["theta"][-1],
+    # ----------------------------------- I/O ------------------------------------ #
+
+    def save(self, path: Union[str, Path]):
+        """
+            Saves the map's grid, gaussians and agent trajectory to a folder.
+            Any event not yet integrated in the map is integrated first.
+        """
+        path = Path(path)
+        if self.map_gaussians_events:
+            self.build()
+
+        grid, origin = self.grid_array()
+        save_metadata(
+            path,
+            "map",
+            time=self.time,
+            origin=origin,
+            gaussians_time=self.map_gaussians.time,
+            gaussians_observed=self.map_gaussians.n_observed,
+            free_gaussian_value=self.free_gaussian_value,
+            occupied_gaussian_value=self.occupied_gaussian_value,
+            free_gaussian_radius=self.free_gaussian_radius,
+            occupied_gaussian_radius=self.occupied_gaussian_radius,
+        )
+        np.save(path / "grid.npy", grid)
+        np.save(path / "gaussians.npy", self.map_gaussians.rows)
+
+        np.save(
+            path / "trajectory.npy",
+            np.array(
+                [
+                    self.agent_trajectory["x"],
+                    self.agent_trajectory["y"],
+                    self.agent_trajectory["theta"],
+                ]
+            ),
         )
-        map_agent.draw(ax=ax, just_agent=True)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], agent) -> "Map":
+        """
+            Loads a map saved with Map.save, for an agent. The grid is memory mapped
+            and its tiles are only read when used, the costmap is computed when
+            first used. The agent is assumed to be where the saved trajectory
+            ends.
+        """
+        path = Path(path)
+        metadata = load_metadata(path, "map")
+
+        _map = cls(agent)
+        for name in (
+            "free_gaussian_value",
+            "occupied_gaussian_value",
+            "free_gaussian_radius",
+            "occupied_gaussian_radius",
+        ):
+            setattr(_map, name, metadata[name])
+        _map.time = metadata["time"]
+
+        # trajectory
+        x, y, theta = np.load(path / "trajectory.npy")
+        _map.agent_trajectory = dict(
+            x=list(x), y=list(y), theta=list(theta)
+        )
+
+        # gaussians
+        _map.map_gaussians.rows = np.load(path / "gaussians.npy")
+        _map.map_gaussians.time = metadata["gaussians_time"]
+        _map.map_gaussians.n_observed = metadata["gaussians_observed"]
+
+        # grid: backed by the memory mapped array, consistent with the
+        # gaussians (see build)
+        _map.grid = TiledGrid.from_array(
+            np.load(path / "grid.npy", mmap_mode="r"),
+            tuple(metadata["origin"]),
+            _map.tile_size,
+            max_tiles=_map.max_tiles,
+        )
+        _map._splatted_loaded = False
+        _map._costmap_loaded = False
+        return _map
+
+    def draw(
+        self,
+        ax: "plt.Axes",
+        ax2: Optional["plt.Axes"] = None,
+        raster: bool = False,
+    ):
+        """
+            Draws the localized agent and the map. With raster=True the whole
+            grid (with each point's confidence) is painted as a single image,
+            otherwise only inaccessible points are drawn as a scatter.
+        """
+        # plot localized agent (maps replayed from a recording have no agent
+        # to draw, see Replayer)
+        if hasattr(self.agent, "draw"):
+            map_agent = deepcopy(self.agent)
+            map_agent.set(
+                x=self.agent_trajectory["x"][-1],
+                y=self.agent_trajectory["y"][-1],
+                angle=self.agent_trajectory["theta"][-1],
+            )
+            map_agent.draw(ax=ax, just_agent=True)
         ax.plot(
             self.agent_trajectory["x"],
             self.agent_trajectory["y"],
@@ -233,11 +784,19 @@ class Map:
         )
 
         # plot points grid
-        x = [k[0] for k, v in self.grid_points.items() if v.confidence < 0]
-        y = [k[1] for k, v in self.grid_points.items() if v.confidence < 0]
-        ax.scatter(
-            x, y, color=blue_darker, lw=0.5, ec="k", s=20, alpha=1,
-        )
+        if raster:
+            grid, origin = self.grid_array()
+            confidence_image(
+                ax,
+                confidence(grid, self.confidence_threshold),
+                origin,
+                zorder=-50,
+            )
+        else:
+            x, y = self.grid_xy[self.grid_confidence < 0].T
+            ax.scatter(
+                x, y, color=blue_darker, lw=0.5, ec="k", s=20, alpha=1,
+            )
 
         # plot points for legend
         ax.scatter(0, 0, color=red_dark, s=20, zorder=-100, label="accesible")
@@ -1,15 +1,148 @@
-from typing import Tuple
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-
-from kino.geometry import Vector
-from kino.geometry.point import Point
+from typing import List, Sequence, Tuple, Union, TYPE_CHECKING
+import numpy as np
 
 from slam.plot_utils import outline
-from slam.geometry import Line
+from slam.geometry import (
+    Line,
+    Point,
+    Vector,
+    points_in_polygons,
+    points_segments_distance,
+    rays_circles_intersection,
+    rays_segments_intersection,
+)
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+
+class BaseObstacle:
+    """
+        Obstacles are described by their edges (an (N, 4) array of x0, y0, x1, y1
+        segments, for polygons) and circles (an (M, 3) array of center x, y and
+        radius). These are packed together across obstacles for vectorized
+        ray casting and containment checks (see PackedObstacles).
+    """
+
+    name: str
+    txt_size: int
+    COM: Point
+    size: float  # max size, used to skip obstacles too far to be detected
+
+    edges: np.ndarray = np.zeros((0, 4))
+    circles: np.ndarray = np.zeros((0, 3))
+
+    def __repr__(self) -> str:
+        return f"({self.__class__.__name__}: {self.name})"
+
+    def contains(self, point: Union[Point, Vector]) -> bool:
+        """
+            Checks if a point is within the obstacle
+        """
+        return bool(
+            PackedObstacles([self]).contains(
+                np.array([[point.x, point.y]])
+            )[0]
+        )
+
+    def _draw_name(self, ax: "plt.Axes"):
+        outline(
+            ax.text(
+                self.COM.x,
+                self.COM.y,
+                self.name,
+                ha="center",
+                size=self.txt_size,
+            ),
+            color="white",
+            lw=8,
+        )
+
 
+class PolygonObstacle(BaseObstacle):
+    """
+        An obstacle with the shape of a simple polygon
+    """
+
+    def __init__(
+        self,
+        vertices: Sequence[Tuple[float, float]],
+        name: str,
+        txt_size: int = 8,
+    ):
+        self.vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        self.name = name
+        self.txt_size = txt_size
+
+        # each edge goes from a vertex to the next one
+        self.edges = np.hstack(
+            [self.vertices, np.roll(self.vertices, -1, axis=0)]
+        )
+
+        self.COM = Point(*self.vertices.mean(axis=0))
+        self.size = 2 * np.max(
+            np.linalg.norm(self.vertices - self.COM.xy, axis=1)
+        )
+
+    def draw(self, ax: "plt.Axes"):
+        from matplotlib.patches import Polygon
+
+        ax.add_artist(
+            Polygon(
+                self.vertices,
+                closed=True,
+                color=[0.2, 0.2, 0.2],
+                hatch=r"////",
+                fill=False,
+                lw=2,
+            )
+        )
+        self._draw_name(ax)
+
+
+class CircleObstacle(BaseObstacle):
+    """
+        A circular obstacle
+    """
+
+    def __init__(
+        self,
+        center: Tuple[float, float],
+        radius: float,
+        name: str,
+        txt_size: int = 8,
+    ):
+        self.center = center
+        self.radius = radius
+        self.name = name
+        self.txt_size = txt_size
+
+        self.circles = np.array([[center[0], center[1], radius]], dtype=float)
+
+        self.COM = Point(*center)
+        self.size = 2 * radius
+
+    def draw(self, ax: "plt.Axes"):
+        from matplotlib.patches import Circle
+
+        ax.add_artist(
+            Circle(
+                self.center,
+                self.radius,
+                color=[0.2, 0.2, 0.2],
+                hatch=r"////",
+                fill=False,
+                lw=2,
+            )
+        )
+        self._draw_name(ax)
+
+
+class Obstacle(PolygonObstacle):
+    """
+        A rectangular obstacle, with a corner at xy and rotated by angle
+    """
 
-class Obstacle:
     def __init__(
         self,
         xy: Tuple[float, float],
@@ -23,8 +156,6 @@ class Obstacle:
         self.angle = angle
         self.width = width
         self.height = height
-        self.name = name
-        self.txt_size = txt_size
 
         # compute the position of vertices
         self.com = Vector(*xy)
@@ -43,6 +174,9 @@ class Obstacle:
             name: pt
             for name, pt in zip("ABCD", (self.A, self.B, self.C, self.D))
         }
+        super().__init__(
+            [pt.xy for pt in self.points.values()], name, txt_size=txt_size
+        )
 
         # compute lines connecting vertices
         self.lines = dict(
@@ -63,63 +197,22 @@ class Obstacle:
     def __repr__(self) -> str:
         return f"(Obstacle: {self.name}) - {self.points}"
 
-    def contains(self, point: Point) -> bool:
-        """
-            Checks if a point is within the rectangle
-            from: https://martin-thoma.com/how-to-check-if-a-point-is-inside-a-rectangle/
-        """
+    def draw(self, ax: "plt.Axes"):
+        from matplotlib.patches import Rectangle
 
-        area_rectangle = 0.5 * abs(
-            (self.A.y - self.C.y) * (self.D.x - self.B.x)
-            + (self.B.y - self.D.y) * (self.A.x - self.C.x)
-        )
-
-        ABP = 0.5 * (
-            self.A.x * (self.B.y - self.C.y)
-            + self.B.x * (self.C.y - self.A.y)
-            + self.C.x * (self.A.y - self.B.y)
-        )
-        BCP = 0.5 * (
-            self.B.x * (self.C.y - self.D.y)
-            + self.C.x * (self.D.y - self.B.y)
-            + self.D.x * (self.B.y - self.C.y)
-        )
-        CDP = 0.5 * (
-            self.C.x * (self.D.y - self.A.y)
-            + self.D.x * (self.A.y - self.C.y)
-            + self.A.x * (self.C.y - self.D.y)
-        )
-        DAP = 0.5 * (
-            self.D.x * (self.A.y - self.B.y)
-            + self.A.x * (self.B.y - self.D.y)
-            + self.B.x * (self.D.y - self.A.y)
-        )
-        return area_rectangle == (ABP + BCP + CDP + DAP)
-
-    def draw(self, ax: plt.Axes):
         ax.add_artist(
             Rectangle(
                 self.xy,
                 self.width,
                 self.height,
-                self.angle,
+                angle=self.angle,
                 color=[0.2, 0.2, 0.2],
                 hatch=r"////",
                 fill=False,
                 lw=2,
             )
         )
-        outline(
-            ax.text(
-                self.COM.x,
-                self.COM.y,
-                self.name,
-                ha="center",
-                size=self.txt_size,
-            ),
-            color="white",
-            lw=8,
-        )
+        self._draw_name(ax)
 
         # add vertices names
         # for name, point in self.points.items():
@@ -128,3 +221,83 @@ class Obstacle:
         # # draw lines
         # for line in self.lines.values():
         #     line.draw(ax)
+
+
+class PackedObstacles:
+    """
+        The edges and circles of a list of obstacles packed in arrays, together
+        with the index of the obstacle each belongs to.
+    """
+
+    def __init__(self, obstacles: List[BaseObstacle]):
+        self.obstacles = obstacles
+
+        self.segments = np.vstack(
+            [np.zeros((0, 4))] + [obs.edges for obs in obstacles]
+        )
+        self.segments_owner = np.repeat(
+            np.arange(len(obstacles)), [len(obs.edges) for obs in obstacles]
+        )
+
+        self.circles = np.vstack(
+            [np.zeros((0, 3))] + [obs.circles for obs in obstacles]
+        )
+        self.circles_owner = np.repeat(
+            np.arange(len(obstacles)), [len(obs.circles) for obs in obstacles]
+        )
+
+    def cast(
+        self, p0: np.ndarray, p1: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Casts R rays going from p0 to p1 (both (R, 2) arrays) and returns
+            for each the fraction of its length at which it first hits an obstacle
+            (NaN if it doesn't) and the index of the obstacle hit (-1 if none).
+        """
+        t = np.hstack(
+            [
+                rays_segments_intersection(p0, p1, self.segments),
+                rays_circles_intersection(p0, p1, self.circles),
+            ]
+        )
+        owners = np.concatenate([self.segments_owner, self.circles_owner])
+
+        hit = np.any(~np.isnan(t), axis=1)
+        closest = np.argmin(np.where(np.isnan(t), np.inf, t), axis=1)
+
+        fraction = np.where(hit, t[np.arange(len(t)), closest], np.nan)
+        obstacle = np.where(hit, owners[closest] if len(owners) else -1, -1)
+        return fraction, obstacle
+
+    def distance(self, point: np.ndarray) -> float:
+        """
+            Distance from a point (outside of the obstacles) to the closest
+            obstacle's edge or circle (inf if there are no obstacles)
+        """
+        point = np.asarray(point, dtype=float).reshape(1, 2)
+        to_segments = points_segments_distance(point, self.segments)
+        to_circles = (
+            np.linalg.norm(point - self.circles[:, :2], axis=-1)
+            - self.circles[:, 2]
+        )
+        return float(
+            np.min(np.concatenate([to_segments.ravel(), to_circles, [np.inf]]))
+        )
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """
+            For each point in an (N, 2) array returns True if it's within
+            any of the obstacles
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        in_polygons = points_in_polygons(
+            points, self.segments, self.segments_owner, len(self.obstacles)
+        ).any(axis=1)
+
+        in_circles = (
+            np.linalg.norm(
+                points[:, None, :] - self.circles[None, :, :2], axis=-1
+            )
+            <= self.circles[None, :, 2]
+        ).any(axis=1)
+        return in_polygons | in_circles
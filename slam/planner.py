@@ -1,31 +1,55 @@
-import warnings
+import numpy as np
+from typing import List, Optional, Tuple, Union, TYPE_CHECKING
+from pathlib import Path
 
-warnings.filterwarnings(action="ignore", module="libpysal")
+from slam._map import GridPoint, classify, rasterize
+from slam.costmap import Costmap
+from slam.geometry import Point
+from slam.plot_utils import confidence_image
+from slam.io import save_metadata, load_metadata
 
-import matplotlib.pyplot as plt
-from libpysal import weights
-import networkx as nx
-import numpy as np
-from typing import List, Optional
-from random import choice
-from networkx.algorithms.shortest_paths.generic import shortest_path
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+    import networkx as nx
+    from scipy.sparse import csr_matrix
+
+# the graph is stored as a scipy.sparse adjacency matrix. A networkx view of
+# it is only created when needed (e.g. for drawing): both are only imported
+# when they're first needed to keep importing slam fast
 
-from kino.geometry.point import Point
+_OFFSET: int = 2 ** 31  # lattice coordinates must be within +/- _OFFSET
 
-from slam._map import GridPoint
+
+def _lattice_keys(xy: np.ndarray) -> np.ndarray:
+    """
+        Packs integer (x, y) coordinates in a single int64 key
+    """
+    xy = np.asarray(xy, dtype=np.int64) + _OFFSET
+    return (xy[:, 0] << 32) + xy[:, 1]
 
 
 class Planner:
     distance_threshold: float = 1.5  # points within this distance are connected
 
+    # ranking of the uncertain nodes as targets (see rank_uncertain_nodes)
+    gain_radius: int = 5  # uncertain cells within this distance are gained
+    min_target_distance: float = 5  # closer nodes aren't worth a trip
+
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng  # picks random uncertain nodes
+        self._graph: Optional["nx.Graph"] = None
+        self._gain: Optional[np.ndarray] = None
+
+        # source node, distances and predecessors of the last shortest paths
+        self._paths: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+
     @property
     def accessible(self) -> List[dict]:
         """
             Returns a list of nodes (dicts) for nodes representing 
             accessible locations
         """
-        idxs = list(nx.get_node_attributes(self.graph, "accessible").keys())
-        return [self.graph.nodes[idx] for idx in idxs]
+        return [self.node(n) for n in self.accessible_nodes.tolist()]
 
     @property
     def uncertain(self) -> List[dict]:
@@ -33,91 +57,409 @@ class Planner:
             Returns a list of nodes (dicts) for nodes representing 
             uncertain locations
         """
-        idxs = list(nx.get_node_attributes(self.graph, "uncertain").keys())
-        return [self.graph.nodes[idx] for idx in idxs]
+        return [self.node(n) for n in self.uncertain_nodes.tolist()]
 
-    def build(self, grid_points: List[GridPoint]):
+    @property
+    def graph(self) -> "nx.Graph":
+        """
+            A networkx view of the graph (with the nodes' attributes and the
+            edges' weights), created the first time it's used after a build
+        """
+        if self._graph is None:
+            import networkx as nx
+
+            graph = nx.Graph()
+            graph.add_nodes_from(
+                (n, self.node(n)) for n in range(len(self.coordinates))
+            )
+            edges = self.edges_array()
+            graph.add_weighted_edges_from(
+                zip(
+                    edges[:, 0].tolist(),
+                    edges[:, 1].tolist(),
+                    self.adjacency[edges[:, 0], edges[:, 1]].A1.tolist(),
+                )
+            )
+            self._graph = graph
+        return self._graph
+
+    def build(
+        self,
+        xy: np.ndarray,
+        values: np.ndarray,
+        costmap: Optional[Costmap] = None,
+        confidence_threshold: float = GridPoint.confidence_threshold,
+    ):
         """
             Creates a network with physically close points being connected, including only nodes with reasonable confidence 
-            of them being open.
+            of them being open, given the coordinates and values of the
+            map's grid cells (see Map.grid_xy and Map.grid_values).
+            With a costmap, edges close to obstacles are more expensive.
+        """
+        self._set_cells(xy, values, confidence_threshold)
+        edges = self._lattice_edges()
+        self._set_adjacency(edges, self._edges_weights(edges, costmap))
+
+    def _set_cells(
+        self,
+        xy: np.ndarray,
+        values: np.ndarray,
+        confidence_threshold: float = GridPoint.confidence_threshold,
+    ):
+        """
+            Stores the grid cells with their confidence (as int8, see
+            GridPoint.confidence) and the coordinates of the accessible ones
+            (confidence >= 0), which are the graph's nodes, with the index
+            of the accessible (confidence 1) and uncertain (0) nodes.
         """
-        self.grid_points = grid_points
-        accessible_points = [
-            pt for pt in self.grid_points if pt.confidence >= 0
+        self.cells = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.values = np.asarray(values, dtype=float)
+        self.confidence_threshold = confidence_threshold
+        self.cells_confidence = classify(self.values, confidence_threshold)
+
+        nodes = np.flatnonzero(self.cells_confidence >= 0)
+        self.coordinates = self.cells[nodes]
+        self.confidence = self.cells_confidence[nodes]
+        self.accessible_nodes = np.flatnonzero(self.confidence == 1)
+        self.uncertain_nodes = np.flatnonzero(self.confidence == 0)
+        self._gain = None
+
+    def _lattice_edges(self) -> np.ndarray:
+        """
+            Returns the edges (as an (E, 2) array of node indices) between
+            the nodes within distance_threshold of each other. The nodes are
+            on an integer lattice, so each node's neighbours are found by
+            looking up its coordinates shifted by each offset within the
+            threshold (e.g. the 8 neighbours for a threshold of 1.5).
+        """
+        xy = np.round(self.coordinates).astype(np.int64).reshape(-1, 2)
+        if not len(xy):
+            return np.zeros((0, 2), dtype=np.int64)
+        keys = _lattice_keys(xy)
+        order = np.argsort(keys)
+        keys = keys[order]
+
+        # offsets to half of the neighbours, so that each edge is found once
+        radius = int(np.floor(self.distance_threshold))
+        offsets = [
+            (dx, dy)
+            for dx in range(0, radius + 1)
+            for dy in range(-radius, radius + 1)
+            if (dx > 0 or dy > 0)
+            and dx ** 2 + dy ** 2 <= self.distance_threshold ** 2
         ]
-        self.coordinates = np.array(
-            [
-                [pt.x for pt in accessible_points],
-                [pt.y for pt in accessible_points],
-            ]
-        ).T
-        self.graph = weights.DistanceBand.from_array(
-            self.coordinates,
-            threshold=self.distance_threshold,
-            silence_warnings=True,
-        ).to_networkx()
-
-        # add confidence value to nodes and other attributes
-        for node_n, confidence in enumerate(
-            [pt.confidence for pt in accessible_points]
-        ):
-            self.graph.nodes[node_n]["confidence"] = confidence
-            self.graph.nodes[node_n]["x"] = accessible_points[node_n].x
-            self.graph.nodes[node_n]["y"] = accessible_points[node_n].y
-            self.graph.nodes[node_n]["node_n"] = node_n
 
-            if confidence:
-                self.graph.nodes[node_n]["accessible"] = True
-            else:
-                self.graph.nodes[node_n]["uncertain"] = True
+        edges = [np.zeros((0, 2), dtype=np.int64)]
+        nodes = np.arange(len(xy))
+        for offset in offsets:
+            neighbour = _lattice_keys(xy + offset)
+            position = np.minimum(
+                np.searchsorted(keys, neighbour), len(keys) - 1
+            )
+            found = keys[position] == neighbour
+            edges.append(
+                np.column_stack([nodes[found], order[position[found]]])
+            )
+        edges = np.vstack(edges)
+        return np.sort(edges, axis=1)
+
+    def _edges_weights(
+        self, edges: np.ndarray, costmap: Optional[Costmap] = None
+    ) -> np.ndarray:
+        """
+            Weighs each edge by its length, increased by the cost of its
+            nodes in the costmap (if any)
+        """
+        coordinates = self.coordinates.reshape(-1, 2)
+        weights = np.linalg.norm(
+            coordinates[edges[:, 0]] - coordinates[edges[:, 1]], axis=1
+        )
+        if len(edges) and costmap is not None and not costmap.empty:
+            cost = costmap.cost(coordinates[:, 0], coordinates[:, 1])
+            weights *= 1 + (cost[edges[:, 0]] + cost[edges[:, 1]]) / 2
+        return weights
+
+    def _set_adjacency(self, edges: np.ndarray, weights: np.ndarray):
+        """
+            Stores the graph as a symmetric CSR adjacency matrix with the
+            edges' weights and labels its connected components
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        n = len(self.coordinates)
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.adjacency: "csr_matrix" = csr_matrix(
+            (
+                np.concatenate([weights, weights]),
+                (
+                    np.concatenate([edges[:, 0], edges[:, 1]]),
+                    np.concatenate([edges[:, 1], edges[:, 0]]),
+                ),
+            ),
+            shape=(n, n),
+        )
+        self.n_components, self.components = connected_components(
+            self.adjacency, directed=False
+        )
+        self._graph = None
+        self._paths = None
+
+    def node(self, node_n: int) -> dict:
+        """
+            Returns a node as a dict with its coordinates and confidence
+            (and whether it's accessible or uncertain)
+        """
+        x, y = self.coordinates[node_n].tolist()
+        confidence = int(self.confidence[node_n])
+        node = dict(confidence=confidence, x=x, y=y, node_n=int(node_n))
+        node["accessible" if confidence else "uncertain"] = True
+        return node
 
     def get_uncertain_node(self) -> Optional[dict]:
         """
             Returns a random uncertain node
         """
-        if not self.uncertain:
+        uncertain = getattr(self, "uncertain_nodes", ())
+        if not len(uncertain):
             return None
-        return choice(self.uncertain)
+        return self.node(uncertain[self.rng.integers(len(uncertain))])
 
     def get_closest_node(self, point: Point) -> dict:
         """
             Returns the graph node closest to a point
         """
-        dist = np.apply_along_axis(
-            np.linalg.norm, 1, self.coordinates - point.xy
+        dist = np.sum((self.coordinates - point.xy) ** 2, axis=1)
+        return self.node(int(np.argmin(dist)))
+
+    def get_best_uncertain_node(self, agent) -> Optional[dict]:
+        """
+            Returns the uncertain node that is cheapest to reach from the
+            agent's current location per unit of information gain
+        """
+        if not len(getattr(self, "uncertain_nodes", ())):
+            return None
+        ranked = self.rank_uncertain_nodes(self._start_node(agent))
+        return self.node(ranked[0]) if len(ranked) else None
+
+    def rank_uncertain_nodes(self, start: int) -> np.ndarray:
+        """
+            Returns the uncertain nodes reachable from a node (and at least
+            min_target_distance away from it), sorted by the cost of the
+            route to them divided by their information gain
+        """
+        distances, _ = self.shortest_paths(start)
+        nodes = self.uncertain_nodes[
+            np.isfinite(distances[self.uncertain_nodes])
+            & (distances[self.uncertain_nodes] >= self.min_target_distance)
+        ]
+        cost = distances[nodes] / self.information_gain()[nodes]
+        return nodes[np.argsort(cost, kind="stable")]
+
+    def information_gain(self) -> np.ndarray:
+        """
+            The number of uncertain cells within gain_radius (along x and y)
+            of each node, summed over all nodes at once with an integral
+            image of the uncertain cells
+        """
+        if self._gain is not None:
+            return self._gain
+
+        grid, (x0, y0) = rasterize(
+            np.round(self.cells), self.cells_confidence == 0
+        )
+        height, width = grid.shape
+        integral = np.zeros((height + 1, width + 1))
+        integral[1:, 1:] = np.nan_to_num(grid).cumsum(axis=0).cumsum(axis=1)
+
+        xy = np.round(self.coordinates).astype(np.int64).reshape(-1, 2)
+        r = self.gain_radius
+        c0 = np.clip(xy[:, 0] - x0 - r, 0, width)
+        c1 = np.clip(xy[:, 0] - x0 + r + 1, 0, width)
+        r0 = np.clip(xy[:, 1] - y0 - r, 0, height)
+        r1 = np.clip(xy[:, 1] - y0 + r + 1, 0, height)
+        self._gain = (
+            integral[r1, c1]
+            - integral[r0, c1]
+            - integral[r1, c0]
+            + integral[r0, c0]
         )
-        return self.graph.nodes[np.argmin(dist)]
+        return self._gain
+
+    def shortest_paths(self, source: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the length of the shortest route from a node to every
+            node (inf where there's none) and each node's predecessor along
+            it (negative for none), from a single Dijkstra search. The
+            result is cached until the graph or the source node change.
+        """
+        if self._paths is None or self._paths[0] != source:
+            from scipy.sparse.csgraph import dijkstra
+
+            distances, predecessors = dijkstra(
+                self.adjacency, indices=source, return_predecessors=True
+            )
+            distances.setflags(write=False)
+            predecessors.setflags(write=False)
+            self._paths = (source, distances, predecessors)
+        return self._paths[1], self._paths[2]
+
+    def _start_node(self, agent) -> int:
+        """
+            The node closest to the agent's (estimated) location
+        """
+        x, y, _ = agent.estimated_pose
+        return self.get_closest_node(Point(x, y))["node_n"]
+
+    def _node_n(self, node: dict) -> int:
+        """
+            The index of a node in the current graph. The graph's nodes change
+            when it's built again: older nodes are replaced by the closest one
+        """
+        node_n = node["node_n"]
+        if node_n < len(self.coordinates) and np.array_equal(
+            self.coordinates[node_n], (node["x"], node["y"])
+        ):
+            return node_n
+        return self.get_closest_node(Point(node["x"], node["y"]))["node_n"]
+
+    def reachable(self, agent, target_node: dict) -> bool:
+        """
+            Whether there's a route along the graph from the agent's current
+            location to a node: they're in the same connected component
+        """
+        start = self._start_node(agent)
+        target = self._node_n(target_node)
+        return bool(self.components[start] == self.components[target])
 
     def plan_route(self, agent, target_node: dict) -> List[dict]:
         """
             Plans the shourtest route along the graph from the agent's current
-            location to the selected node.
+            location to the selected node. Raises a ValueError if there's
+            no route, without searching for it.
         """
-        # get agent's start node
-        start_node = self.get_closest_node(
-            Point(
-                agent.map.agent_trajectory["x"][-1],
-                agent.map.agent_trajectory["y"][-1],
-            )
+        start = self._start_node(agent)
+        target = self._node_n(target_node)
+        if self.components[start] != self.components[target]:
+            raise ValueError(f"No route from node {start} to node {target}")
+
+        # the graph is undirected: the shortest paths from the target lead
+        # back to it from any node. They're searched once per target while
+        # the start node moves along the route
+        _, predecessors = self.shortest_paths(target)
+
+        path_idx: List[int] = [start]
+        while path_idx[-1] != target:
+            path_idx.append(int(predecessors[path_idx[-1]]))
+        return [self.node(idx) for idx in path_idx]
+
+    # ----------------------------------- I/O ------------------------------------ #
+
+    def save(self, path: Union[str, Path]):
+        """
+            Saves the grid points and the graph's edges to a folder
+        """
+        path = Path(path)
+        save_metadata(
+            path,
+            "planner",
+            distance_threshold=self.distance_threshold,
+            confidence_threshold=self.confidence_threshold,
+        )
+        np.save(
+            path / "grid_points.npy",
+            np.column_stack([self.cells, self.values]),
+        )
+        edges = self.edges_array()
+        np.save(path / "edges.npy", edges)
+        np.save(
+            path / "weights.npy",
+            self.adjacency[edges[:, 0], edges[:, 1]].A1,
         )
 
-        # get the shortest path
-        path_idx: List[int] = shortest_path(
-            self.graph, start_node["node_n"], target_node["node_n"]
+    @classmethod
+    def load(
+        cls, path: Union[str, Path], rng: np.random.Generator
+    ) -> "Planner":
+        """
+            Loads a planner saved with Planner.save, without re-computing the
+            graph's edges.
+        """
+        path = Path(path)
+        metadata = load_metadata(path, "planner")
+
+        planner = cls(rng)
+        planner.distance_threshold = metadata["distance_threshold"]
+        cells = np.load(path / "grid_points.npy").reshape(-1, 3)
+        planner._set_cells(
+            cells[:, :2],
+            cells[:, 2],
+            metadata.get(
+                "confidence_threshold", GridPoint.confidence_threshold
+            ),
         )
-        path: List[dict] = [self.graph.nodes[idx] for idx in path_idx]
 
-        return path
+        edges = np.load(path / "edges.npy").reshape(-1, 2)
+        if (path / "weights.npy").exists():
+            weights = np.load(path / "weights.npy")
+        else:
+            weights = np.ones(len(edges))
+        planner._set_adjacency(edges, weights)
+        return planner
+
+    def edges_array(self, max_edges: Optional[int] = None) -> np.ndarray:
+        """
+            Returns the graph's edges as an (E, 2) array of node indices,
+            optionally decimated to have at most max_edges edges.
+        """
+        from scipy.sparse import triu
+
+        upper = triu(self.adjacency, format="coo")
+        edges = np.column_stack([upper.row, upper.col]).astype(np.int64)
+        if max_edges is not None and len(edges) > max_edges:
+            if max_edges <= 0:
+                return edges[:0]
+            edges = edges[:: int(np.ceil(len(edges) / max_edges))]
+        return edges
+
+    def draw(
+        self,
+        ax: "plt.Axes",
+        raster: bool = False,
+        max_edges: Optional[int] = None,
+    ):
+        """
+            Draws the planning graph. With raster=True the nodes' confidence
+            is painted as a single image and the (optionally decimated) edges
+            are drawn as a single collection of lines.
+        """
+        if raster:
+            from matplotlib.collections import LineCollection
+
+            grid, origin = rasterize(
+                self.coordinates.reshape(-1, 2), self.confidence
+            )
+            confidence_image(ax, grid, origin, zorder=-50)
+
+            ax.add_collection(
+                LineCollection(
+                    self.coordinates.reshape(-1, 2)[self.edges_array(max_edges)],
+                    lw=0.5,
+                    color="k",
+                    zorder=-40,
+                )
+            )
+            return
+
+        import networkx as nx
 
-    def draw(self, ax: plt.Axes):
-        positions = dict(zip(self.graph.nodes, self.coordinates))
+        positions = dict(enumerate(self.coordinates))
 
         nx.draw(
             self.graph,
             positions,
-            node_color=[
-                node["confidence"] for node in self.graph.nodes.values()
-            ],
+            edgelist=[tuple(edge) for edge in self.edges_array(max_edges)],
+            node_color=self.confidence,
             cmap="Reds",
             vmin=-0.5,
             vmax=2,
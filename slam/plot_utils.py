@@ -1,10 +1,58 @@
-import matplotlib.patheffects as path_effects
-from matplotlib.artist import Artist
+import numpy as np
+from typing import Tuple, TYPE_CHECKING
+
+from slam.colors import red_dark, blue_darker, red_light
+
+if TYPE_CHECKING:
+    from matplotlib.artist import Artist
+    from matplotlib.image import AxesImage
 
 BACKGROUND_COLOR: str = "#fff9ed"
 
+# colors for grid points of confidence -1 (inaccessible), 0 (uncertain) and 1 (accessible)
+CONFIDENCE_COLORS = (blue_darker, red_light, red_dark)
+
+
+def outline(artist: "Artist", lw: float = 1, color: str = BACKGROUND_COLOR):
+    import matplotlib.patheffects as path_effects
 
-def outline(artist: Artist, lw: float = 1, color: str = BACKGROUND_COLOR):
     artist.set_path_effects(
         [path_effects.withStroke(linewidth=lw, foreground=color,)]
     )
+
+
+def grid_extent(
+    grid: np.ndarray, origin: Tuple[int, int]
+) -> Tuple[float, float, float, float]:
+    """
+        Extent (left, right, bottom, top) of a grid image whose first
+        element is at `origin`, with each pixel centered on a grid point.
+    """
+    height, width = grid.shape
+    return (
+        origin[0] - 0.5,
+        origin[0] + width - 0.5,
+        origin[1] - 0.5,
+        origin[1] + height - 0.5,
+    )
+
+
+def confidence_image(
+    ax, confidence: np.ndarray, origin: Tuple[int, int], **kwargs
+) -> "AxesImage":
+    """
+        Paints a grid of confidence values (-1, 0, 1 or NaN for no grid
+        point) as a single image
+    """
+    from matplotlib.colors import ListedColormap
+
+    return ax.imshow(
+        confidence,
+        origin="lower",
+        extent=grid_extent(confidence, origin),
+        cmap=ListedColormap(CONFIDENCE_COLORS),
+        vmin=-1,
+        vmax=1,
+        interpolation="nearest",
+        **kwargs,
+    )
@@ -0,0 +1,435 @@
+"""
+    Pose graph back end: the trajectory is split in keyframes, consecutive
+    keyframes are connected by odometry edges and keyframes that see the
+    same place again are connected by loop closure edges (found aligning
+    their scans with ICP). The keyframes' poses are then optimized with
+    sparse Gauss-Newton and the poses of the steps of the keyframes that
+    moved are corrected.
+
+    Poses are (x, y, theta) arrays with theta in radians internally and in
+    degrees in the public interface, as in the rest of the package.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from slam.geometry import project_beams
+
+
+# ---------------------------------- poses ----------------------------------- #
+
+
+def _wrap(theta: np.ndarray) -> np.ndarray:
+    return (theta + np.pi) % (2 * np.pi) - np.pi
+
+
+def compose(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+        Composes poses (..., 3): b expressed in a's frame -> global frame
+    """
+    c, s = np.cos(a[..., 2]), np.sin(a[..., 2])
+    return np.stack(
+        [
+            a[..., 0] + c * b[..., 0] - s * b[..., 1],
+            a[..., 1] + s * b[..., 0] + c * b[..., 1],
+            a[..., 2] + b[..., 2],
+        ],
+        axis=-1,
+    )
+
+
+def relative(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+        Returns pose b expressed in a's frame
+    """
+    c, s = np.cos(a[..., 2]), np.sin(a[..., 2])
+    dx, dy = b[..., 0] - a[..., 0], b[..., 1] - a[..., 1]
+    return np.stack(
+        [c * dx + s * dy, -s * dx + c * dy, _wrap(b[..., 2] - a[..., 2])],
+        axis=-1,
+    )
+
+
+def transform(points: np.ndarray, pose: np.ndarray) -> np.ndarray:
+    """
+        Moves (N, 2) points from a pose's frame to the global frame
+    """
+    c, s = np.cos(pose[2]), np.sin(pose[2])
+    return points @ np.array([[c, s], [-s, c]]) + pose[:2]
+
+
+def icp(
+    source: np.ndarray,
+    target: np.ndarray,
+    initial: np.ndarray,
+    max_correspondence: float = 2,
+    iterations: int = 30,
+) -> Tuple[np.ndarray, float, float]:
+    """
+        Point to point ICP: finds the pose of the source points' frame in the
+        target points' frame, starting from an initial guess. Returns the
+        pose, the RMSE of the matched points and the fraction of source
+        points matched (closer than max_correspondence to a target point).
+    """
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(target)
+    pose = np.array(initial, dtype=float)
+    for iteration in range(iterations):
+        moved = transform(source, pose)
+        distance, idx = tree.query(
+            moved, distance_upper_bound=max_correspondence
+        )
+        matched = np.isfinite(distance)
+        if matched.sum() < 3:
+            return pose, np.inf, 0
+
+        # best rigid alignment of the matched pairs (Kabsch)
+        src, dst = moved[matched], target[idx[matched]]
+        src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+        H = (src - src_mean).T @ (dst - dst_mean)
+        theta = np.arctan2(H[0, 1] - H[1, 0], H[0, 0] + H[1, 1])
+        c, s = np.cos(theta), np.sin(theta)
+        t = dst_mean - np.array([[c, -s], [s, c]]) @ src_mean
+
+        pose = compose(np.array([t[0], t[1], theta]), pose)
+        if abs(theta) < 1e-6 and np.hypot(*t) < 1e-6:
+            break
+
+    distance, _ = tree.query(
+        transform(source, pose), distance_upper_bound=max_correspondence
+    )
+    matched = np.isfinite(distance)
+    if not matched.any():
+        return pose, np.inf, 0
+    return (
+        pose,
+        float(np.sqrt(np.mean(distance[matched] ** 2))),
+        float(matched.mean()),
+    )
+
+
+# ---------------------------------- graph ----------------------------------- #
+
+
+@dataclass
+class Keyframe:
+    """
+        A pose and the steps recorded since it (with their pose and
+        detections expressed in the keyframe's frame)
+    """
+
+    pose: np.ndarray
+    steps: List[int] = field(default_factory=list)
+    step_poses: List[np.ndarray] = field(default_factory=list)
+    points: List[np.ndarray] = field(default_factory=list)
+
+    @property
+    def cloud(self) -> np.ndarray:
+        return np.vstack([np.zeros((0, 2))] + self.points)
+
+
+@dataclass
+class Edge:
+    """
+        A measurement of keyframe j's pose in keyframe i's frame
+    """
+
+    i: int
+    j: int
+    measurement: np.ndarray
+    information: np.ndarray  # diagonal of the information matrix
+    loop: bool = False
+
+
+class PoseGraph:
+    """
+        Keyframes are created every keyframe_distance units or keyframe_angle
+        degrees. When a keyframe is complete its scan is matched against those
+        of keyframes at least min_separation keyframes older within loop_radius
+        (found with a grid index of the keyframes' positions), matches with a
+        low ICP error become loop closure edges.
+    """
+
+    def __init__(
+        self,
+        keyframe_distance: float = 5,
+        keyframe_angle: float = 30,
+        loop_radius: float = 10,
+        min_separation: int = 10,
+        max_rmse: float = 0.5,
+        min_overlap: float = 0.6,
+        odometry_std: Tuple[float, float] = (0.5, 5),
+        loop_std: Tuple[float, float] = (0.2, 2),
+        min_correction: float = 1e-3,
+    ):
+        self.keyframe_distance = keyframe_distance
+        self.keyframe_angle = np.radians(keyframe_angle)
+        self.loop_radius = loop_radius
+        self.min_separation = min_separation
+        self.max_rmse = max_rmse
+        self.min_overlap = min_overlap  # fraction of matched points
+        self.min_correction = min_correction  # smaller corrections are skipped
+
+        # information of the edges from the std of position and angle
+        self._odometry_information = 1 / np.array(
+            [odometry_std[0], odometry_std[0], np.radians(odometry_std[1])]
+        ) ** 2
+        self._loop_information = 1 / np.array(
+            [loop_std[0], loop_std[0], np.radians(loop_std[1])]
+        ) ** 2
+
+        self.keyframes: List[Keyframe] = []
+        self.edges: List[Edge] = []
+        self.index: Dict[Tuple[int, int], List[int]] = dict()
+        self.pending_loops = 0  # loop closures not optimized yet
+
+    @property
+    def poses(self) -> np.ndarray:
+        return np.array([kf.pose for kf in self.keyframes]).reshape(-1, 3)
+
+    def _cell(self, pose: np.ndarray) -> Tuple[int, int]:
+        return (
+            int(np.floor(pose[0] / self.loop_radius)),
+            int(np.floor(pose[1] / self.loop_radius)),
+        )
+
+    def _neighbours(self, pose: np.ndarray) -> List[int]:
+        """
+            Keyframes indexed in the cells around a pose
+        """
+        i, j = self._cell(pose)
+        return [
+            kf
+            for di in (-1, 0, 1)
+            for dj in (-1, 0, 1)
+            for kf in self.index.get((i + di, j + dj), [])
+        ]
+
+    # --------------------------------- building --------------------------------- #
+
+    def add(
+        self,
+        step: int,
+        pose: Tuple[float, float, float],
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+    ):
+        """
+            Adds a step's pose (theta in degrees) and its scan to the graph,
+            creating a new keyframe when the agent moved enough
+        """
+        pose = np.array([pose[0], pose[1], np.radians(pose[2])])
+
+        if self.keyframes:
+            delta = relative(self.keyframes[-1].pose, pose)
+            new_keyframe = (
+                np.hypot(delta[0], delta[1]) > self.keyframe_distance
+                or abs(delta[2]) > self.keyframe_angle
+            )
+        else:
+            new_keyframe = True
+
+        if new_keyframe:
+            self.keyframes.append(Keyframe(pose))
+            k = len(self.keyframes) - 1
+            self.index.setdefault(self._cell(pose), []).append(k)
+
+            if k > 0:
+                previous = self.keyframes[k - 1].pose
+                self.edges.append(
+                    Edge(
+                        k - 1,
+                        k,
+                        relative(previous, pose),
+                        self._odometry_information,
+                    )
+                )
+                self.detect_loop(k - 1)
+
+        keyframe = self.keyframes[-1]
+        step_pose = relative(keyframe.pose, pose)
+        keyframe.steps.append(step)
+        keyframe.step_poses.append(step_pose)
+
+        detected = ~np.isnan(distances)
+        if np.any(detected):
+            x, y = project_beams(
+                np.zeros((1, 3)),
+                distances[detected],
+                angles[detected],
+                head_offset,
+            )
+            keyframe.points.append(
+                transform(np.column_stack([x[0], y[0]]), step_pose)
+            )
+
+    def detect_loop(self, k: int) -> bool:
+        """
+            Matches keyframe k's scan against those of older keyframes nearby,
+            adding a loop closure edge for the best match
+        """
+        keyframe = self.keyframes[k]
+        source = keyframe.cloud
+        if len(source) < 3:
+            return False
+
+        best: Optional[Tuple[float, int, np.ndarray]] = None
+        for j in self._neighbours(keyframe.pose):
+            if k - j < self.min_separation:
+                continue
+            candidate = self.keyframes[j]
+            initial = relative(candidate.pose, keyframe.pose)
+            if np.hypot(initial[0], initial[1]) > self.loop_radius:
+                continue
+
+            target = candidate.cloud
+            if len(target) < 3:
+                continue
+            measurement, rmse, overlap = icp(source, target, initial)
+            if rmse <= self.max_rmse and overlap >= self.min_overlap:
+                if best is None or rmse < best[0]:
+                    best = (rmse, j, measurement)
+
+        if best is None:
+            return False
+
+        self.edges.append(
+            Edge(best[1], k, best[2], self._loop_information, loop=True)
+        )
+        self.pending_loops += 1
+        return True
+
+    # ------------------------------- optimization ------------------------------- #
+
+    def _linearize(
+        self, poses: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+            Returns the error of each edge and its jacobians with respect to
+            the two poses it connects
+        """
+        i = np.array([edge.i for edge in self.edges])
+        j = np.array([edge.j for edge in self.edges])
+        z = np.array([edge.measurement for edge in self.edges])
+
+        xi, xj = poses[i], poses[j]
+        ci, si = np.cos(xi[:, 2]), np.sin(xi[:, 2])
+        cz, sz = np.cos(z[:, 2]), np.sin(z[:, 2])
+        cm, sm = np.cos(xi[:, 2] + z[:, 2]), np.sin(xi[:, 2] + z[:, 2])
+
+        # error: Z^-1 (Xi^-1 Xj)
+        dx, dy = xj[:, 0] - xi[:, 0], xj[:, 1] - xi[:, 1]
+        a, b = ci * dx + si * dy, -si * dx + ci * dy  # Ri^T (tj - ti)
+        error = np.column_stack(
+            [
+                cz * (a - z[:, 0]) + sz * (b - z[:, 1]),
+                -sz * (a - z[:, 0]) + cz * (b - z[:, 1]),
+                _wrap(xj[:, 2] - xi[:, 2] - z[:, 2]),
+            ]
+        )
+
+        n = len(self.edges)
+        A, B = np.zeros((n, 3, 3)), np.zeros((n, 3, 3))
+        A[:, 0, 0], A[:, 0, 1] = -cm, -sm
+        A[:, 1, 0], A[:, 1, 1] = sm, -cm
+        A[:, 0, 2] = cz * b - sz * a
+        A[:, 1, 2] = -sz * b - cz * a
+        A[:, 2, 2] = -1
+
+        B[:, 0, 0], B[:, 0, 1] = cm, sm
+        B[:, 1, 0], B[:, 1, 1] = -sm, cm
+        B[:, 2, 2] = 1
+        return i, j, error, A, B
+
+    def optimize(self, iterations: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Optimizes the keyframes' poses with sparse Gauss-Newton (the first
+            keyframe is fixed). Returns the steps of the keyframes that moved
+            and their corrected poses (theta in degrees).
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.linalg import spsolve
+
+        self.pending_loops = 0
+        if not self.edges:
+            return np.zeros(0, dtype=int), np.zeros((0, 3))
+
+        before = self.poses
+        poses = before.copy()
+        information = np.array([edge.information for edge in self.edges])
+        n = 3 * len(poses)
+
+        # block (r, c) of each edge's 3x3 blocks
+        r, c = np.meshgrid(np.arange(3), np.arange(3), indexing="ij")
+        for iteration in range(iterations):
+            i, j, error, A, B = self._linearize(poses)
+            At = np.transpose(A, (0, 2, 1)) * information[:, None, :]
+            Bt = np.transpose(B, (0, 2, 1)) * information[:, None, :]
+
+            rows, cols, data = [], [], []
+            for (p, q, block) in (
+                (i, i, At @ A),
+                (i, j, At @ B),
+                (j, i, Bt @ A),
+                (j, j, Bt @ B),
+            ):
+                rows.append((3 * p[:, None, None] + r).ravel())
+                cols.append((3 * q[:, None, None] + c).ravel())
+                data.append(block.ravel())
+
+            # fix the first keyframe
+            rows.append(np.arange(3))
+            cols.append(np.arange(3))
+            data.append(np.full(3, 1e9))
+
+            H = coo_matrix(
+                (
+                    np.concatenate(data),
+                    (np.concatenate(rows), np.concatenate(cols)),
+                ),
+                shape=(n, n),
+            ).tocsc()
+
+            b = np.zeros(n)
+            np.add.at(
+                b,
+                (3 * i[:, None] + np.arange(3)).ravel(),
+                np.einsum("eab,eb->ea", At, error).ravel(),
+            )
+            np.add.at(
+                b,
+                (3 * j[:, None] + np.arange(3)).ravel(),
+                np.einsum("eab,eb->ea", Bt, error).ravel(),
+            )
+
+            update = spsolve(H, -b).reshape(-1, 3)
+            poses += update
+            poses[:, 2] = _wrap(poses[:, 2])
+            if np.max(np.abs(update)) < 1e-6:
+                break
+
+        self.index = dict()
+        for k, (keyframe, pose) in enumerate(zip(self.keyframes, poses)):
+            keyframe.pose = pose
+            self.index.setdefault(self._cell(pose), []).append(k)
+
+        # correct the steps of the keyframes that moved
+        correction = np.max(np.abs(relative(before, poses)), axis=1)
+        moved = np.where(correction > self.min_correction)[0]
+        steps = [
+            np.array(self.keyframes[k].steps, dtype=int) for k in moved
+        ]
+        step_poses = [
+            compose(
+                self.keyframes[k].pose, np.array(self.keyframes[k].step_poses)
+            )
+            for k in moved
+        ]
+        if not len(moved):
+            return np.zeros(0, dtype=int), np.zeros((0, 3))
+
+        step_poses = np.vstack(step_poses)
+        step_poses[:, 2] = np.degrees(step_poses[:, 2])
+        return np.concatenate(steps), step_poses
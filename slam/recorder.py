@@ -0,0 +1,284 @@
+import atexit
+import os
+from pathlib import Path
+from time import monotonic, process_time
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+
+from slam.gaussians import GaussianStore
+from slam.io import save_metadata, load_metadata
+from slam.lidar import LidarSensor
+from slam.map import Map
+from slam.planner import Planner
+
+
+# the map's components that change how it's built from the same steps:
+# runs using them can't be replayed, the gaussians' settings are recorded
+SLAM_COMPONENTS = ("localizer", "scan_matcher", "pose_graph")
+GAUSSIANS_SETTINGS = (
+    "decay",
+    "min_weight",
+    "max_age",
+    "max_gaussians",
+    "eviction",
+    "max_bytes",
+)
+
+
+def _class_name(component) -> Optional[str]:
+    return None if component is None else type(component).__name__
+
+
+class Recorder:
+    """
+        Streams the state of an agent at each time step (pose, motor commands,
+        odometry, lidar detection distances and behavioral routine ID) to an
+        append-only folder of .npy chunks. Only the current chunk is kept in memory,
+        it's written to disk once it's full or flush_interval seconds after the
+        last write, whichever comes first, so that a crash loses few steps. The
+        recording is also flushed when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        chunk_size: int = 1000,
+        flush_interval: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        if list(self.path.glob("chunk_*.npy")):
+            raise ValueError(f'A run was already recorded at "{self.path}"')
+
+        self.dtype: Optional[np.dtype] = None
+        self._buffer: Optional[np.ndarray] = None
+        self._n_buffered = 0
+        self.n_chunks = 0
+        self.n_steps = 0
+        self.cpu_time = 0.0  # seconds spent recording, see add
+        self._last_flush = monotonic()
+        atexit.register(self.close)
+
+    def start(self, agent):
+        """
+            Stores the agent's settings needed to replay the run and its
+            pose before the first step (the agent calls it when created)
+        """
+        n_beams = len(agent.lidar)
+        self.dtype = np.dtype(
+            [
+                ("step", "i8"),
+                ("x", "f8"),
+                ("y", "f8"),
+                ("angle", "f8"),
+                ("speed", "f8"),
+                ("omega", "f8"),
+                ("odometry", "f8", (2,)),
+                ("routine", "i2"),
+                ("contacts", "f8", (n_beams,)),
+            ]
+        )
+        self._buffer = np.zeros(self.chunk_size, dtype=self.dtype)
+
+        save_metadata(
+            self.path,
+            "recording",
+            chunk_size=self.chunk_size,
+            start=dict(x=agent.x, y=agent.y, angle=agent.angle),
+            lidar_angles=agent.lidar.angles.tolist(),
+            lidar_ranges=agent.lidar.ranges.tolist(),
+            lidar_samples=agent.lidar.sampled_distance.shape[1],
+            agent_height=agent.height,
+            slam={
+                name: _class_name(getattr(agent.map, name))
+                for name in SLAM_COMPONENTS
+            },
+            gaussians={
+                name: getattr(agent.map.map_gaussians, name)
+                for name in GAUSSIANS_SETTINGS
+            },
+        )
+
+    def add(self, agent):
+        """
+            Appends the agent's current state to the recording. The CPU time
+            spent doing so (writing chunks included) is added to cpu_time, so
+            that timing a run can leave the recording out.
+        """
+        t0 = process_time()
+        if self._buffer is None:
+            self.start(agent)
+
+        row = self._buffer[self._n_buffered]  # type: ignore
+        row["step"] = self.n_steps
+        row["x"], row["y"], row["angle"] = agent.x, agent.y, agent.angle
+        row["speed"] = agent._current_speed
+        row["omega"] = agent._current_omega
+        row["odometry"] = agent.odometry
+        row["routine"] = agent._current_routine.ID
+        row["contacts"] = agent.lidar.distances
+
+        self._n_buffered += 1
+        self.n_steps += 1
+        if (
+            self._n_buffered == self.chunk_size
+            or monotonic() - self._last_flush > self.flush_interval
+        ):
+            self.flush()
+        self.cpu_time += process_time() - t0
+
+    def flush(self):
+        """
+            Writes the buffered steps to a new chunk file
+        """
+        self._last_flush = monotonic()
+        if not self._n_buffered:
+            return
+
+        # write to a temporary file first so that a crash never leaves
+        # a partially written chunk behind
+        chunk_path = self.path / f"chunk_{self.n_chunks:06d}.npy"
+        tmp_path = self.path / f"chunk_{self.n_chunks:06d}.tmp"
+        with open(tmp_path, "wb") as fout:
+            np.save(fout, self._buffer[: self._n_buffered])  # type: ignore
+        os.replace(tmp_path, chunk_path)
+
+        self.n_chunks += 1
+        self._n_buffered = 0
+
+    def close(self):
+        """
+            Writes the steps left in the buffer, can be called more than once
+        """
+        atexit.unregister(self.close)
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _ReplayAgent:
+    """
+        Stands in for an Agent when rebuilding a Map from a recording:
+        it only carries what the Map needs to know about the agent.
+    """
+
+    def __init__(self, metadata: dict):
+        self.height = metadata["agent_height"]
+        self.x = metadata["start"]["x"]
+        self.y = metadata["start"]["y"]
+        self.angle = metadata["start"]["angle"]
+        self.lidar = LidarSensor(
+            metadata["lidar_angles"],
+            metadata["lidar_ranges"],
+            n_samples=metadata["lidar_samples"],
+        )
+
+
+class Replayer:
+    """
+        Reads a run saved by a Recorder. Chunks are memory mapped, so
+        the recording is never loaded in memory as a whole.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+        self.metadata = load_metadata(self.path, "recording")
+
+        self.chunks: List[np.ndarray] = [
+            np.load(chunk_path, mmap_mode="r")
+            for chunk_path in sorted(self.path.glob("chunk_*.npy"))
+        ]
+        self._chunk_starts = np.cumsum(
+            [0] + [len(chunk) for chunk in self.chunks]
+        )
+
+    def __len__(self) -> int:
+        return int(self._chunk_starts[-1])
+
+    def __getitem__(self, step: int) -> np.void:
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError(f"Step {step} not in recording")
+        chunk = np.searchsorted(self._chunk_starts, step, side="right") - 1
+        return self.chunks[chunk][step - self._chunk_starts[chunk]]
+
+    def iter_chunks(
+        self, stop: Optional[int] = None
+    ) -> Iterator[np.ndarray]:
+        """
+            Iterates over the recorded chunks, up to (excluded) step `stop`
+        """
+        stop = len(self) if stop is None else stop
+        for start, chunk in zip(self._chunk_starts, self.chunks):
+            if start >= stop:
+                break
+            yield chunk[: stop - start]
+
+    def column(self, name: str, stop: Optional[int] = None) -> np.ndarray:
+        """
+            Returns the values of one of the recorded fields at each step
+        """
+        return np.concatenate(
+            [chunk[name] for chunk in self.iter_chunks(stop)]
+        )
+
+    @property
+    def trajectory(self) -> dict:
+        """
+            The agent's trajectory, including its starting position
+        """
+        return dict(
+            x=[self.metadata["start"]["x"]] + list(self.column("x")),
+            y=[self.metadata["start"]["y"]] + list(self.column("y")),
+        )
+
+    def map_at(self, step: int) -> Map:
+        """
+            Rebuilds the agent's map using all the steps up to (included)
+            `step`, without re-running the simulation. Runs recorded with
+            a localizer, scan matcher or pose graph can't be replayed: their
+            poses depend on when the map was built and on random numbers
+            that are not recorded.
+        """
+        recorded = self.metadata.get("slam", {})
+        used = [name for name in SLAM_COMPONENTS if recorded.get(name)]
+        if used:
+            raise ValueError(
+                f"Cannot replay a run recorded with: {', '.join(used)}"
+            )
+
+        _map = Map(
+            _ReplayAgent(self.metadata),
+            gaussians=GaussianStore(**self.metadata.get("gaussians", {})),
+        )
+        for chunk in self.iter_chunks(step + 1):
+            for (speed, omega), contacts in zip(
+                chunk["odometry"], chunk["contacts"]
+            ):
+                _map.add_step(speed, omega, contacts)
+        _map.build()
+        return _map
+
+    def planner_at(self, step: int, rng: np.random.Generator) -> Planner:
+        """
+            Rebuilds the agent's planner using all the steps up to (included)
+            `step`, picking random nodes with rng.
+        """
+        _map = self.map_at(step)
+        planner = Planner(rng)
+        planner.build(
+            *_map.grid_cells(),
+            _map.costmap,
+            _map.confidence_threshold,
+        )
+        return planner
@@ -0,0 +1,309 @@
+"""
+    Offscreen rendering of a running simulation. Artists are created once
+    and at each frame only their data is updated (the map is painted as a
+    single image), frames are rendered with
+    the Agg backend and streamed to a video file or to a folder of images.
+"""
+import subprocess
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle, Rectangle
+from matplotlib.image import imsave
+
+from slam.colors import salmon_dark, blue_light
+
+from slam._map import confidence
+from slam.geometry import Vector
+from slam.plot_utils import confidence_image, grid_extent
+
+
+def _agent_pose(agent, x: float, y: float, angle: float) -> Tuple:
+    """
+        Returns the position of the agent's body corner and head
+        for a given pose
+    """
+    com = Vector(x, y)
+    body_corner = com + Vector(-agent.height / 2, -agent.width / 2).rotate(
+        angle
+    )
+    head = com + Vector(agent.height / 2, 0).rotate(angle)
+    return body_corner.as_array(), head.as_array()
+
+
+class _AgentArtists:
+    """
+        Body and head of an agent
+    """
+
+    def __init__(self, ax, agent):
+        self.agent = agent
+        self.body = ax.add_patch(
+            Rectangle(
+                (0, 0),
+                agent.height,
+                agent.width,
+                facecolor=agent.color,
+                lw=1,
+                edgecolor="k",
+                zorder=100,
+            )
+        )
+        self.head = ax.add_patch(
+            Circle(
+                (0, 0),
+                agent.head_width,
+                facecolor=agent.head_color,
+                lw=1,
+                edgecolor="k",
+                zorder=100,
+            )
+        )
+
+    def update(self, x: float, y: float, angle: float):
+        body_corner, head = _agent_pose(self.agent, x, y, angle)
+        self.body.set_xy(body_corner)
+        self.body.set_angle(angle)
+        self.head.set_center(head)
+
+
+class Renderer:
+    """
+        Renders the world view (environment + agent) and the agent's
+        view (map + planner) of a simulation.
+    """
+
+    def __init__(
+        self,
+        agent,
+        figsize: Tuple[float, float] = (20, 10),
+        dpi: int = 50,
+        max_edges: int = 2000,
+    ):
+        self.agent = agent
+        self.max_edges = max_edges  # max number of graph edges drawn
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.world_ax, self.map_ax = self.figure.subplots(ncols=2)
+
+        # static elements
+        agent.environment.draw(self.world_ax)
+        self.world_ax.set(title="world view")
+        self.map_ax.set(title="agent view")
+        self.map_ax.axis("off")
+        for ax in (self.world_ax, self.map_ax):
+            ax.set_aspect("equal")
+        self.figure.tight_layout()
+
+        # world view artists
+        self.world_agent = _AgentArtists(self.world_ax, agent)
+        dense = len(agent.lidar) >= 50
+        self.rays = self.world_ax.add_collection(
+            LineCollection(
+                [],
+                lw=0.5 if dense else 2,
+                linestyles=":",
+                color=salmon_dark,
+                zorder=99,
+            )
+        )
+        self.contacts = self.world_ax.scatter(
+            [],
+            [],
+            s=10 if dense else 60,
+            lw=1,
+            ec="k",
+            color=blue_light,
+            zorder=100,
+        )
+        (self.trajectory,) = self.world_ax.plot(
+            [], [], lw=0.5, color="k", zorder=-1, alpha=0.5
+        )
+
+        # agent view artists
+        self.map_agent = _AgentArtists(self.map_ax, agent)
+        (self.map_trajectory,) = self.map_ax.plot(
+            [], [], lw=0.75, color=[0.2, 0.2, 0.2], zorder=100
+        )
+        self.grid = confidence_image(
+            self.map_ax, np.full((1, 1), np.nan), (0, 0), zorder=-50
+        )
+        self.edges = self.map_ax.add_collection(
+            LineCollection([], lw=0.5, color="k", alpha=0.5, zorder=-40)
+        )
+
+        # keep track of what the agent view shows to only update it when needed
+        self._grid_version: Optional[tuple] = None
+        self._adjacency = None
+
+    # ---------------------------------- update ---------------------------------- #
+
+    def _update_world(self):
+        agent = self.agent
+        self.world_agent.update(agent.x, agent.y, agent.angle)
+
+        lidar = agent.lidar
+        p0, p1 = lidar.endpoints(agent.head_position, agent.angle)
+        self.rays.set_segments(np.stack([p0, p1], axis=1))
+        self.contacts.set_offsets(
+            lidar.contacts[~np.isnan(lidar.distances)]
+        )
+        self.trajectory.set_data(
+            agent.trajectory["x"], agent.trajectory["y"]
+        )
+
+    def _update_map(self):
+        # with asynchronous SLAM the map is only read through its snapshots
+        snapshot = self.agent.snapshot
+        if snapshot is not None:
+            trajectory = dict(
+                x=snapshot.trajectory[:, 0],
+                y=snapshot.trajectory[:, 1],
+                theta=snapshot.trajectory[:, 2],
+            )
+            grid_version = ("snapshot", snapshot.step)
+            planner = snapshot.planner
+        elif self.agent.worker is None:
+            trajectory = self.agent.map.agent_trajectory
+            grid_version = ("map", self.agent.map.grid_version)
+            planner = self.agent.planner
+        else:
+            return  # no map yet
+
+        self.map_agent.update(
+            trajectory["x"][-1], trajectory["y"][-1], trajectory["theta"][-1]
+        )
+        self.map_trajectory.set_data(trajectory["x"], trajectory["y"])
+
+        # each map build changes the grid
+        if grid_version != self._grid_version:
+            self._grid_version = grid_version
+            if snapshot is not None:
+                grid, origin = snapshot.grid, snapshot.origin
+            else:
+                grid, origin = self.agent.map.grid_array()
+            if grid.size:
+                self.grid.set_data(
+                    confidence(grid, self.agent.map.confidence_threshold)
+                )
+                self.grid.set_extent(grid_extent(grid, origin))
+
+        adjacency = getattr(planner, "adjacency", None)
+        if adjacency is not None and adjacency is not self._adjacency:
+            self._adjacency = adjacency
+            self.edges.set_segments(
+                planner.coordinates.reshape(-1, 2)[
+                    planner.edges_array(self.max_edges)
+                ]
+            )
+
+        # fit axes limits to the data
+        x0, x1, y0, y1 = self.grid.get_extent()
+        x0 = min(x0, np.min(trajectory["x"])) - 5
+        x1 = max(x1, np.max(trajectory["x"])) + 5
+        y0 = min(y0, np.min(trajectory["y"])) - 5
+        y1 = max(y1, np.max(trajectory["y"])) + 5
+        self.map_ax.set(xlim=(x0, x1), ylim=(y0, y1))
+
+    def render(self) -> np.ndarray:
+        """
+            Updates the artists to the simulation's current state and
+            returns the rendered frame as an RGB array.
+        """
+        self._update_world()
+        self._update_map()
+
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[..., :3]
+
+
+# ----------------------------------- sinks ---------------------------------- #
+
+
+class VideoSink:
+    """
+        Streams frames to an ffmpeg process to encode them in a video
+    """
+
+    def __init__(
+        self, path: Union[str, Path], fps: int = 25, ffmpeg: str = "ffmpeg"
+    ):
+        self.path = Path(path)
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self, frame: np.ndarray):
+        height, width = frame.shape[:2]
+        self._process = subprocess.Popen(
+            [
+                self.ffmpeg,
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(self.fps),
+                "-i",
+                "-",
+                "-vf",
+                "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt",
+                "yuv420p",
+                str(self.path),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray):
+        if self._process is None:
+            self._start(frame)
+        self._process.stdin.write(  # type: ignore
+            np.ascontiguousarray(frame).tobytes()
+        )
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()  # type: ignore
+            self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ImagesSink:
+    """
+        Saves each frame as a .png image in a folder
+    """
+
+    def __init__(self, folder: Union[str, Path]):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.n_frames = 0
+
+    def write(self, frame: np.ndarray):
+        imsave(self.folder / f"frame_{self.n_frames:06d}.png", frame)
+        self.n_frames += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,290 @@
+"""
+    Scan matching: corrects the pose of each step by aligning the points at
+    which the lidar detected objects to the occupied cells of the map built
+    so far.
+"""
+from typing import Tuple
+import numpy as np
+
+from slam.geometry import project_beams
+
+Pose = Tuple[float, float, float]
+
+
+class DistanceField:
+    """
+        Distance (truncated at max_distance) from each cell of a grid to the
+        closest occupied cell. The field is updated with the cells whose
+        occupancy changed: only the blocks (block_size x block_size cells)
+        within max_distance of a changed cell are computed again.
+    """
+
+    def __init__(
+        self, max_distance: float = 3, margin: int = 32, block_size: int = 32
+    ):
+        self.max_distance = max_distance
+
+        # the arrays extend at least max_distance past any occupied cell, so
+        # that cells added when growing them are at max_distance from all
+        self.margin = max(margin, int(np.ceil(max_distance)) + 1)
+
+        # a changed cell only changes the blocks it's within max_distance of
+        self.block_size = max(block_size, int(np.ceil(max_distance)) + 1)
+
+        self.occupied = np.zeros((0, 0), dtype=bool)  # indexed [y, x]
+        self.distance = np.zeros((0, 0))
+        self.origin = (0, 0)  # x, y coordinates of the [0, 0] element
+
+    @property
+    def empty(self) -> bool:
+        return not self.occupied.any()
+
+    def _fit(self, origin: Tuple[int, int], shape: Tuple[int, int]):
+        """
+            Grows the arrays (if needed) to cover a grid with a given origin
+            and shape.
+        """
+        height, width = self.occupied.shape
+        x0, y0 = origin[0] - self.margin, origin[1] - self.margin
+        x1 = origin[0] + shape[1] + self.margin
+        y1 = origin[1] + shape[0] + self.margin
+        if self.occupied.size:
+            x0, y0 = min(x0, self.origin[0]), min(y0, self.origin[1])
+            x1 = max(x1, self.origin[0] + width)
+            y1 = max(y1, self.origin[1] + height)
+
+        if self.occupied.size and (x0, y0, x1, y1) == (
+            self.origin[0],
+            self.origin[1],
+            self.origin[0] + width,
+            self.origin[1] + height,
+        ):
+            return
+
+        occupied = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        distance = np.full(occupied.shape, float(self.max_distance))
+        if self.occupied.size:
+            ox, oy = self.origin[0] - x0, self.origin[1] - y0
+            occupied[oy : oy + height, ox : ox + width] = self.occupied
+            distance[oy : oy + height, ox : ox + width] = self.distance
+
+        self.occupied, self.distance = occupied, distance
+        self.origin = (x0, y0)
+
+    def update(self, x: np.ndarray, y: np.ndarray, occupied: np.ndarray):
+        """
+            Updates the field given the integer (x, y) coordinates of cells
+            and whether each is occupied (e.g. the cells whose occupancy
+            changed since the last update)
+        """
+        x = np.asarray(x, dtype=np.int64).ravel()
+        y = np.asarray(y, dtype=np.int64).ravel()
+        if not len(x):
+            return
+        x0, y0 = int(x.min()), int(y.min())
+        self._fit((x0, y0), (int(y.max()) - y0 + 1, int(x.max()) - x0 + 1))
+
+        ix, iy = x - self.origin[0], y - self.origin[1]
+        occupied = np.broadcast_to(np.asarray(occupied, dtype=bool), x.shape)
+        changed = self.occupied[iy, ix] != occupied
+        if not np.any(changed):
+            return
+        self.occupied[iy, ix] = occupied
+        ix, iy = ix[changed], iy[changed]
+
+        # the distances can change up to max_distance away from changed cells
+        # (in at most 2 x 2 blocks around each, as blocks are larger)
+        pad = int(np.ceil(self.max_distance))
+        size = self.block_size
+        blocks = np.unique(
+            np.vstack(
+                [
+                    np.column_stack([(ix + dx) // size, (iy + dy) // size])
+                    for dx in (-pad, pad)
+                    for dy in (-pad, pad)
+                ]
+            ),
+            axis=0,
+        )
+        for bx, by in blocks.tolist():
+            self._update_block(bx, by, pad)
+
+    def _update_block(self, bx: int, by: int, pad: int):
+        """
+            Computes again the distances in a block, given the occupied cells
+            within pad of it
+        """
+        from scipy.ndimage import distance_transform_edt
+
+        height, width = self.occupied.shape
+        size = self.block_size
+        y0, y1 = max(by * size, 0), min((by + 1) * size, height)
+        x0, x1 = max(bx * size, 0), min((bx + 1) * size, width)
+        if y0 >= y1 or x0 >= x1:
+            return
+
+        wy0, wy1 = max(y0 - pad, 0), min(y1 + pad, height)
+        wx0, wx1 = max(x0 - pad, 0), min(x1 + pad, width)
+        window = self.occupied[wy0:wy1, wx0:wx1]
+        if not window.any():
+            self.distance[y0:y1, x0:x1] = self.max_distance
+            return
+
+        distance = distance_transform_edt(~window)
+        self.distance[y0:y1, x0:x1] = np.minimum(
+            distance[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0],
+            self.max_distance,
+        )
+
+    def lookup(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+            Returns the distance at each point, interpolated bilinearly
+            between the cells around it (max_distance outside of the field)
+        """
+        x = np.asarray(x, dtype=float) - self.origin[0]
+        y = np.asarray(y, dtype=float) - self.origin[1]
+        height, width = self.distance.shape
+        inside = (x >= 0) & (x < width - 1) & (y >= 0) & (y < height - 1)
+
+        distance = np.full(x.shape, float(self.max_distance))
+        x, y = x[inside], y[inside]
+        ix, iy = x.astype(np.intp), y.astype(np.intp)
+        fx, fy = x - ix, y - iy
+
+        d = self.distance
+        distance[inside] = (1 - fy) * (
+            (1 - fx) * d[iy, ix] + fx * d[iy, ix + 1]
+        ) + fy * ((1 - fx) * d[iy + 1, ix] + fx * d[iy + 1, ix + 1])
+        return distance
+
+
+class ScanMatcher:
+    """
+        Correlative scan matcher: poses around the predicted one (within
+        linear_window units and angular_window degrees) are scored by how close
+        the projected detections are to the closest occupied cell, plus
+        a penalty for moving away from the predicted pose.
+        The search is done coarse to fine: first with steps
+        `coarse` times larger than linear_step and angular_step, then with
+        the fine steps around the best coarse pose.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = 3,
+        sigma: float = 0.5,
+        linear_window: float = 1,
+        angular_window: float = 4,
+        linear_step: float = 0.25,
+        angular_step: float = 1,
+        coarse: int = 4,
+        min_points: int = 3,
+        prior_weight: float = 0.1,
+    ):
+        self.field = DistanceField(max_distance)
+        self.sigma = sigma  # tolerance on the detections' distance
+        self.linear_window = linear_window
+        self.angular_window = angular_window
+        self.linear_step = linear_step
+        self.angular_step = angular_step
+        self.coarse = coarse
+        self.min_points = min_points  # min detections to attempt a match
+
+        # weight of the motion prior: the cost of a pose at the edge of the
+        # search window from the predicted one
+        self.prior_weight = prior_weight
+        self._prior_scale = np.array(
+            [linear_window, linear_window, angular_window]
+        )
+
+    def update(self, x: np.ndarray, y: np.ndarray, occupied: np.ndarray):
+        """
+            Updates the distance field given the cells whose occupancy changed
+            (see DistanceField.update)
+        """
+        self.field.update(x, y, occupied)
+
+    def cost(
+        self,
+        poses: np.ndarray,
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+    ) -> np.ndarray:
+        """
+            Cost of each of N poses: the detections projected from the pose
+            are scored with a gaussian of their distance from the closest
+            occupied cell, so that detections of objects not yet in the map
+            (far from all occupied cells) don't pull the pose.
+        """
+        x, y = project_beams(poses, distances, angles, head_offset)
+        distance = self.field.lookup(x, y)
+        score = np.exp(-(distance ** 2) / (2 * self.sigma ** 2))
+        return np.mean(1 - score, axis=1)
+
+    def _search(
+        self,
+        pose: np.ndarray,
+        prior: np.ndarray,
+        linear: Tuple[float, float],
+        angular: Tuple[float, float],
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+    ) -> np.ndarray:
+        """
+            Returns the pose with the lowest cost in a grid of poses around
+            pose, given the (window, step) of the linear and angular offsets
+            and the predicted pose (prior)
+        """
+        shifts = np.arange(-linear[0], linear[0] + 1e-9, linear[1])
+        turns = np.arange(-angular[0], angular[0] + 1e-9, angular[1])
+        offsets = np.stack(np.meshgrid(shifts, shifts, turns), -1).reshape(
+            -1, 3
+        )
+
+        cost = self.cost(pose + offsets, distances, angles, head_offset)
+
+        # penalize moving away from the predicted pose
+        offsets_to_prior = pose + offsets - prior
+        cost += self.prior_weight * np.sum(
+            (offsets_to_prior / self._prior_scale) ** 2, axis=1
+        )
+        return pose + offsets[np.argmin(cost)]
+
+    def match(
+        self,
+        pose: Pose,
+        distances: np.ndarray,
+        angles: np.ndarray,
+        head_offset: float,
+    ) -> Pose:
+        """
+            Returns the corrected pose given the distance at which each beam
+            detected an object (NaN for no detection)
+        """
+        detected = ~np.isnan(distances)
+        if detected.sum() < self.min_points or self.field.empty:
+            return pose
+        distances, angles = distances[detected], angles[detected]
+
+        prior = np.array(pose, dtype=float)
+        best = self._search(
+            prior,
+            prior,
+            (self.linear_window, self.linear_step * self.coarse),
+            (self.angular_window, self.angular_step * self.coarse),
+            distances,
+            angles,
+            head_offset,
+        )
+        best = self._search(
+            best,
+            prior,
+            (self.linear_step * self.coarse / 2, self.linear_step),
+            (self.angular_step * self.coarse / 2, self.angular_step),
+            distances,
+            angles,
+            head_offset,
+        )
+        return float(best[0]), float(best[1]), float(best[2])
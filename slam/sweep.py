@@ -0,0 +1,316 @@
+"""
+    Parameter sweeps over the class constants that tune the simulation
+    (e.g. Agent.update_map_every or Map.free_gaussian_radius). Headless
+    simulations run in parallel processes, each trial scored by how much
+    of the environment was mapped (coverage) and by the CPU time spent
+    per step. Configurations are drawn from a grid or at random and pruned
+    with successive halving: all of them run for a few steps and only the
+    best ones are run again for longer.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import product
+from pathlib import Path
+from time import process_time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    TYPE_CHECKING,
+)
+import numpy as np
+
+from slam._map import GridPoint
+from slam.agent import Agent
+from slam.behavior import NavigateToNode
+from slam.costmap import Costmap
+from slam.environment import Environment
+from slam.log import logger
+from slam.map import Map
+from slam.planner import Planner
+from slam.recorder import Recorder
+
+if TYPE_CHECKING:
+    from slam.cache import RunCache
+
+# classes whose constants can be swept, as "Class.attribute"
+TARGETS: Dict[str, type] = {
+    cls.__name__: cls
+    for cls in (Agent, Map, Planner, GridPoint, NavigateToNode, Costmap)
+}
+
+# a parameter's values: a list to choose from or a (low, high) range to
+# draw from uniformly (integers if both bounds are)
+Values = Union[Sequence, Tuple[float, float]]
+
+
+def _target(name: str) -> Tuple[type, str]:
+    """
+        The class and the attribute of a parameter named "Class.attribute"
+    """
+    cls_name, _, attribute = name.partition(".")
+    if cls_name not in TARGETS or not hasattr(TARGETS[cls_name], attribute):
+        raise ValueError(f'Cannot sweep unknown parameter: "{name}"')
+    return TARGETS[cls_name], attribute
+
+
+def apply(params: Dict[str, float]):
+    """
+        Sets the class constants named as "Class.attribute"
+    """
+    for name, value in params.items():
+        setattr(*_target(name), value)
+
+
+def _init_worker():
+    """
+        Silences the simulations' logs and imports the modules they import
+        lazily, so that importing them isn't timed as part of a trial
+    """
+    import scipy.ndimage  # noqa: F401
+    import scipy.sparse.csgraph  # noqa: F401
+    import scipy.spatial  # noqa: F401
+
+    logger.disable("slam")
+
+
+def run_trial(
+    params: Dict[str, float],
+    n_steps: int,
+    seed: int,
+    environment: Type[Environment] = Environment,
+    start: Tuple[float, float, float] = (20, 10, 0),
+    path: Optional[Union[str, Path]] = None,
+) -> Tuple[float, float]:
+    """
+        Runs a headless simulation with the given constants and returns the
+        fraction of the environment that was mapped and the CPU time per
+        step (in seconds). Meant to run in its own process: the constants
+        are changed for the whole process.
+        With a path, the run is recorded and its final map saved there (the
+        time spent recording is not counted in the time per step).
+    """
+    apply(params)
+    env = environment(seed=seed)
+    x, y, angle = start
+    recorder = None if path is None else Recorder(Path(path) / "recording")
+    agent = Agent(env, x=x, y=y, angle=angle, recorder=recorder)
+
+    t0 = process_time()
+    agent.run(n_steps)
+    agent.map.build()
+    elapsed = process_time() - t0
+    if recorder is not None:
+        elapsed -= recorder.cpu_time
+    time_per_step = elapsed / n_steps
+    agent.close()
+    if path is not None:
+        recorder.close()  # type: ignore
+        agent.map.save(Path(path) / "map")
+
+    # the map's frame is centered on the agent's initial position, which
+    # isn't `start` when that's inside an obstacle (see Agent)
+    x0, y0 = agent.trajectory["x"][0], agent.trajectory["y"][0]
+    xy = np.round(agent.map.grid_xy + (x0, y0))
+    inside = (
+        (xy[:, 0] >= 0)
+        & (xy[:, 0] < env.width)
+        & (xy[:, 1] >= 0)
+        & (xy[:, 1] < env.height)
+    )
+    coverage = len(np.unique(xy[inside], axis=0)) / (env.width * env.height)
+    return coverage, time_per_step
+
+
+@dataclass
+class Trial:
+    """
+        A configuration's scores averaged over the sweep's seeds
+    """
+
+    params: Dict[str, float]
+    n_steps: int = 0
+    coverage: float = np.nan
+    time_per_step: float = np.nan  # seconds
+    history: List[Tuple[int, float, float]] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        return (
+            f"{params}: coverage {self.coverage:.3f}, "
+            f"{self.time_per_step * 1000:.2f}ms/step ({self.n_steps} steps)"
+        )
+
+
+def pareto_front(trials: Sequence[Trial]) -> List[Trial]:
+    """
+        The trials not dominated by any other (no other trial has higher or
+        equal coverage with lower or equal time per step, and is better in
+        at least one), sorted by time per step
+    """
+    scores = np.array([(-t.coverage, t.time_per_step) for t in trials])
+    if not len(scores):
+        return []
+    dominated = np.any(
+        np.all(scores[None, :] <= scores[:, None], axis=2)
+        & np.any(scores[None, :] < scores[:, None], axis=2),
+        axis=1,
+    )
+    front = [t for t, d in zip(trials, dominated) if not d]
+    return sorted(front, key=lambda t: t.time_per_step)
+
+
+def _pareto_ranks(trials: Sequence[Trial]) -> np.ndarray:
+    """
+        Rank of each trial's Pareto front: 0 for the trials in the front,
+        1 for those in the front of the remaining ones and so on
+    """
+    ranks = np.full(len(trials), -1)
+    rank = 0
+    while np.any(ranks < 0):
+        left = [i for i in range(len(trials)) if ranks[i] < 0]
+        front = {id(t) for t in pareto_front([trials[i] for i in left])}
+        for i in left:
+            if id(trials[i]) in front:
+                ranks[i] = rank
+        rank += 1
+    return ranks
+
+
+class Sweep:
+    """
+        Sweeps the parameters in `space` ("Class.attribute": values), running
+        each configuration with each of `seeds` (the scores are averaged)
+        in n_workers processes (all CPUs by default). With a cache, runs
+        already made are not made again.
+    """
+
+    def __init__(
+        self,
+        space: Dict[str, Values],
+        n_steps: int = 2000,
+        seeds: Sequence[int] = (0,),
+        n_workers: Optional[int] = None,
+        environment: Type[Environment] = Environment,
+        cache: Optional["RunCache"] = None,
+    ):
+        for name in space:
+            _target(name)
+
+        self.space = space
+        self.n_steps = n_steps
+        self.seeds = tuple(seeds)
+        self.n_workers = n_workers
+        self.environment = environment
+        self.cache = cache
+
+    # ------------------------------ configurations ------------------------------ #
+
+    def grid(self) -> List[Dict[str, float]]:
+        """
+            All the combinations of the parameters' values. A (low, high)
+            range is iterated like a list: only its two bounds are used
+        """
+        names = list(self.space)
+        return [
+            dict(zip(names, values))
+            for values in product(*(self.space[name] for name in names))
+        ]
+
+    def random(
+        self, n: int, rng: np.random.Generator
+    ) -> List[Dict[str, float]]:
+        """
+            n configurations drawn at random: a value from each list and
+            a uniform sample from each (low, high) range
+        """
+        configs = []
+        for _ in range(n):
+            params = {}
+            for name, values in self.space.items():
+                if isinstance(values, tuple):
+                    low, high = values
+                    if isinstance(low, int) and isinstance(high, int):
+                        params[name] = int(rng.integers(low, high + 1))
+                    else:
+                        params[name] = float(rng.uniform(low, high))
+                else:
+                    params[name] = values[rng.integers(len(values))]
+            configs.append(params)
+        return configs
+
+    # ----------------------------------- run ------------------------------------ #
+
+    def evaluate(
+        self, configs: Sequence[Dict[str, float]], n_steps: int
+    ) -> List[Trial]:
+        """
+            Runs each configuration for n_steps with each seed, in parallel
+        """
+        jobs = [(params, seed) for params in configs for seed in self.seeds]
+        with ProcessPoolExecutor(
+            self.n_workers, initializer=_init_worker
+        ) as pool:
+            run = run_trial if self.cache is None else self.cache.run
+            futures = [
+                pool.submit(run, params, n_steps, seed, self.environment)
+                for params, seed in jobs
+            ]
+            scores = np.array([future.result() for future in futures])
+
+        scores = scores.reshape(len(configs), len(self.seeds), 2).mean(axis=1)
+        return [
+            Trial(dict(params), n_steps, float(coverage), float(time))
+            for params, (coverage, time) in zip(configs, scores)
+        ]
+
+    def run(
+        self,
+        configs: Sequence[Dict[str, float]],
+        eta: int = 3,
+        min_steps: Optional[int] = None,
+    ) -> List[Trial]:
+        """
+            Evaluates the configurations with successive halving: all of them
+            run for min_steps, then the best 1/eta (by Pareto rank, then by
+            coverage) run again for eta times as many steps, until the
+            survivors run for n_steps. Returns the trials of all the
+            configurations with their last (longest) evaluation.
+            Without min_steps (or with eta=1) all configurations run for
+            n_steps.
+        """
+        min_steps = min_steps if min_steps is not None else self.n_steps
+        if eta < 1 or min_steps < 1:
+            raise ValueError("eta and min_steps must be at least 1")
+
+        trials: Dict[int, Trial] = {}
+        survivors = list(range(len(configs)))
+        n_steps = min(min_steps, self.n_steps)
+        while survivors:
+            logger.info(
+                f"Sweep: {len(survivors)} configurations, {n_steps} steps"
+            )
+            evaluated = self.evaluate([configs[i] for i in survivors], n_steps)
+            for i, trial in zip(survivors, evaluated):
+                if i in trials:
+                    trial.history = trials[i].history
+                trial.history.append(
+                    (n_steps, trial.coverage, trial.time_per_step)
+                )
+                trials[i] = trial
+
+            if n_steps >= self.n_steps or eta == 1:
+                break
+
+            # keep the best configurations for the next, longer, round
+            ranks = _pareto_ranks(evaluated)
+            order = np.lexsort(([-t.coverage for t in evaluated], ranks))
+            n_kept = max(1, len(survivors) // eta)
+            survivors = [survivors[i] for i in order[:n_kept]]
+            n_steps = min(n_steps * eta, self.n_steps)
+
+        return [trials[i] for i in range(len(configs))]
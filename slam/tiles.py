@@ -0,0 +1,277 @@
+"""
+    Sparse grid of unbounded extent, stored as square tiles allocated the
+    first time one of their cells is written. Memory is proportional to the
+    explored area and cells are read and written as arrays.
+"""
+from collections import OrderedDict
+from itertools import product
+from pathlib import Path
+from typing import Iterator, Optional, Set, Tuple, Union
+import numpy as np
+
+TileIndex = Tuple[int, int]
+
+
+class TiledGrid:
+    """
+        Integer (x, y) cells are stored in tile_size x tile_size arrays
+        (indexed [y, x]) kept in a dict by tile index. Cells never written
+        hold `fill`. With max_tiles, the least recently used tiles beyond
+        that number are saved in cache_dir (a temporary folder by default)
+        and loaded back the next time they're used. A grid can also be backed
+        by a dense array (see from_array), whose tiles are only copied when
+        first used.
+    """
+
+    def __init__(
+        self,
+        tile_size: int = 64,
+        fill: float = np.nan,
+        dtype: np.dtype = np.float64,
+        max_tiles: Optional[int] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+    ):
+        if max_tiles is not None and max_tiles < 1:
+            raise ValueError(f"max_tiles must be at least 1, got {max_tiles}")
+        self.tile_size = tile_size
+        self.fill = fill
+        self.dtype = np.dtype(dtype)
+        self.max_tiles = max_tiles
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+
+        # loaded tiles, from the least to the most recently used
+        self.tiles: "OrderedDict[TileIndex, np.ndarray]" = OrderedDict()
+        self.evicted: Set[TileIndex] = set()  # tiles saved to disk
+
+        # tiles not yet copied from the backing array (see from_array)
+        self.backed: Set[TileIndex] = set()
+        self._backing: Optional[Tuple[np.ndarray, Tuple[int, int]]] = None
+
+    @classmethod
+    def from_array(
+        cls,
+        array: np.ndarray,
+        origin: Tuple[int, int],
+        tile_size: int = 64,
+        fill: float = np.nan,
+        max_tiles: Optional[int] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+    ) -> "TiledGrid":
+        """
+            A grid backed by a 2D array (indexed as [y, x], e.g. memory
+            mapped) given the (x, y) coordinates of its first element: each
+            tile is copied from the array the first time it's used, the
+            array is never read as a whole.
+        """
+        grid = cls(tile_size, fill, array.dtype, max_tiles, cache_dir)
+        if array.size:
+            (x0, y0), (height, width) = origin, array.shape
+            grid.backed = set(
+                product(
+                    range(x0 // tile_size, (x0 + width - 1) // tile_size + 1),
+                    range(y0 // tile_size, (y0 + height - 1) // tile_size + 1),
+                )
+            )
+            grid._backing = (array, (int(x0), int(y0)))
+        return grid
+
+    def __len__(self) -> int:
+        return len(self.tiles) + len(self.evicted) + len(self.backed)
+
+    def __contains__(self, idx: TileIndex) -> bool:
+        return idx in self.tiles or idx in self.evicted or idx in self.backed
+
+    @property
+    def indices(self) -> Iterator[TileIndex]:
+        yield from list(self.tiles.keys())
+        yield from list(self.evicted)
+        yield from list(self.backed)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    # ---------------------------------- tiles ----------------------------------- #
+
+    def _split(
+        self, x: np.ndarray, y: np.ndarray
+    ) -> Iterator[Tuple[TileIndex, np.ndarray, np.ndarray]]:
+        """
+            Groups cells by tile: yields the index of each tile, the position
+            of its cells in x and y (in their order) and their flat index
+            in the tile
+        """
+        x = np.asarray(x).astype(np.int64).ravel()
+        y = np.asarray(y).astype(np.int64).ravel()
+        size = self.tile_size
+        tiles, inverse = np.unique(
+            np.column_stack([x // size, y // size]),
+            axis=0,
+            return_inverse=True,
+        )
+        flat = (y % size) * size + x % size
+
+        order = np.argsort(inverse.ravel(), kind="stable")
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(tiles)))
+        for idx, cells in zip(
+            map(tuple, tiles.tolist()), np.split(order, bounds[:-1])
+        ):
+            yield idx, cells, flat[cells]
+
+    def _path(self, idx: TileIndex) -> Path:
+        if self.cache_dir is None:
+            import tempfile
+
+            self.cache_dir = Path(tempfile.mkdtemp(prefix="slam_tiles_"))
+        return self.cache_dir / f"tile_{idx[0]}_{idx[1]}.npy"
+
+    def tile(
+        self, idx: TileIndex, create: bool = False
+    ) -> Optional[np.ndarray]:
+        """
+            Returns a tile (loading it from disk if it was evicted), None if
+            it doesn't exist unless create is True
+        """
+        if idx in self.tiles:
+            self.tiles.move_to_end(idx)
+            return self.tiles[idx]
+
+        if idx in self.evicted:
+            path = self._path(idx)
+            tile = np.load(path)
+            path.unlink()
+            self.evicted.remove(idx)
+        elif idx in self.backed:
+            tile = self._copy_backed(idx)
+            self.backed.remove(idx)
+        elif create:
+            tile = np.full(
+                (self.tile_size, self.tile_size), self.fill, dtype=self.dtype
+            )
+        else:
+            return None
+
+        # make room first, so that the tile returned is never the evicted one
+        if self.max_tiles is not None:
+            self.evict(self.max_tiles - 1)
+        self.tiles[idx] = tile
+        return tile
+
+    def _copy_backed(self, idx: TileIndex) -> np.ndarray:
+        """
+            Copies a tile from the backing array
+        """
+        array, (x0, y0) = self._backing  # type: ignore
+        size = self.tile_size
+        tile = np.full((size, size), self.fill, dtype=self.dtype)
+
+        # the tile's part covered by the array, in the array's coordinates
+        ax0, ay0 = idx[0] * size - x0, idx[1] * size - y0
+        ax1 = min(ax0 + size, array.shape[1])
+        ay1 = min(ay0 + size, array.shape[0])
+        tx0, ty0 = max(-ax0, 0), max(-ay0, 0)
+        tile[ty0 : ty0 + ay1 - max(ay0, 0), tx0 : tx0 + ax1 - max(ax0, 0)] = (
+            array[max(ay0, 0) : ay1, max(ax0, 0) : ax1]
+        )
+        return tile
+
+    def evict(self, max_tiles: Optional[int] = None):
+        """
+            Saves to disk the least recently used tiles beyond max_tiles
+            (the grid's own by default)
+        """
+        max_tiles = self.max_tiles if max_tiles is None else max_tiles
+        if max_tiles is None:
+            return
+        while len(self.tiles) > max_tiles:
+            idx, tile = self.tiles.popitem(last=False)
+            np.save(self._path(idx), tile)
+            self.evicted.add(idx)
+
+    def clear(self):
+        """
+            Removes all tiles, including the ones saved to disk
+        """
+        for idx in self.evicted:
+            self._path(idx).unlink()
+        self.tiles.clear()
+        self.evicted.clear()
+        self.backed.clear()
+        self._backing = None
+
+    # ------------------------------ read and write ------------------------------ #
+
+    def read(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+            Returns the value of each (x, y) cell
+        """
+        shape = np.shape(x)
+        values = np.full(int(np.prod(shape)), self.fill, dtype=self.dtype)
+        for idx, cells, flat in self._split(x, y):
+            tile = self.tile(idx)
+            if tile is not None:
+                values[cells] = tile.ravel()[flat]
+        return values.reshape(shape)
+
+    def write(self, x: np.ndarray, y: np.ndarray, values: np.ndarray):
+        """
+            Sets the value of each (x, y) cell (for repeated cells the last
+            value is kept)
+        """
+        values = np.broadcast_to(values, np.shape(x)).ravel()
+        for idx, cells, flat in self._split(x, y):
+            self.tile(idx, create=True).ravel()[flat] = values[cells]
+
+    def known(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the (x, y) coordinates (as an (N, 2) array) and the values
+            of all the cells that were written (whose value is not fill)
+        """
+        xy, values = [], []
+        for idx in list(self.indices):
+            tile = self.tile(idx)
+            known = self._known(tile)
+            ys, xs = np.nonzero(known)
+            size = self.tile_size
+            xy.append(
+                np.column_stack([xs + idx[0] * size, ys + idx[1] * size])
+            )
+            values.append(tile[known])
+
+        if not xy:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, self.dtype)
+        return np.vstack(xy), np.concatenate(values)
+
+    def _known(self, tile: np.ndarray) -> np.ndarray:
+        if isinstance(self.fill, float) and np.isnan(self.fill):
+            return ~np.isnan(tile)
+        return tile != self.fill
+
+    def to_array(self) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+            Returns the grid as a dense 2D array (indexed as [y, x]) cropped
+            to the cells that were written, and the (x, y) coordinates of the
+            array's first element.
+        """
+        indices = np.array(list(self.indices), dtype=np.int64).reshape(-1, 2)
+        if not len(indices):
+            return np.full((0, 0), self.fill, dtype=self.dtype), (0, 0)
+
+        size = self.tile_size
+        i0, j0 = indices.min(axis=0)
+        i1, j1 = indices.max(axis=0) + 1
+        array = np.full(
+            ((j1 - j0) * size, (i1 - i0) * size), self.fill, dtype=self.dtype
+        )
+        for i, j in indices.tolist():
+            array[
+                (j - j0) * size : (j - j0 + 1) * size,
+                (i - i0) * size : (i - i0 + 1) * size,
+            ] = self.tile((i, j))
+
+        rows, cols = np.nonzero(self._known(array))
+        if not len(rows):
+            return np.full((0, 0), self.fill, dtype=self.dtype), (0, 0)
+        array = array[rows.min() : rows.max() + 1, cols.min() : cols.max() + 1]
+        origin = (int(i0 * size + cols.min()), int(j0 * size + rows.min()))
+        return array, origin
@@ -0,0 +1,191 @@
+"""
+    Runs SLAM (map building and planning) in a background thread, so that
+    the agent's control loop never waits for it. The agent pushes each
+    step's odometry and scan to the worker, which builds the map and the
+    planner whenever asked to and publishes the result as an immutable
+    Snapshot. Reading the latest snapshot is a single attribute access, so
+    the agent doesn't need any lock.
+"""
+from dataclasses import dataclass, field
+from queue import SimpleQueue, Empty
+from threading import Event, Thread
+from time import perf_counter
+from typing import List, Optional, Tuple
+import numpy as np
+
+from slam._map import classify
+from slam.costmap import Costmap
+from slam.log import logger
+from slam.map import Map
+from slam.planner import Planner
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+        The state of the map at a given time step, never modified after it's
+        published: a new map build publishes a new snapshot.
+    """
+
+    step: int  # number of agent steps included in the map
+    trajectory: np.ndarray  # (step + 1) x 3 poses: x, y, theta (degrees)
+    cells: np.ndarray  # coordinates of the grid's cells, see Map.grid_xy
+    values: np.ndarray
+    confidence: np.ndarray
+    grid: np.ndarray  # see Map.grid_array
+    origin: Tuple[int, int]
+    planner: Planner
+    costmap: Costmap
+
+    # seconds between the newest step's observation and the snapshot's
+    # publication
+    latency: float = 0
+    published: float = field(default_factory=perf_counter)
+
+    @property
+    def pose(self) -> Tuple[float, float, float]:
+        x, y, theta = self.trajectory[-1]
+        return float(x), float(y), float(theta)
+
+
+class SlamWorker:
+    """
+        Owns the agent's Map while running: the map must not be used by other
+        threads until the worker is closed.
+    """
+
+    def __init__(self, map: Map, planner_rng: np.random.Generator):
+        self.map = map
+        self.planner_rng = planner_rng  # used by the published planners
+
+        self.snapshot: Optional[Snapshot] = None
+        self.latencies: List[float] = []  # for each step, in seconds
+        self.n_submitted = 0
+
+        self._steps: SimpleQueue = SimpleQueue()
+        self._requested = Event()
+        self._closing = Event()
+        self._error: Optional[BaseException] = None
+        self._thread = Thread(target=self._run, name="slam", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, speed: float, omega: float, distances: np.ndarray):
+        """
+            Queues a time step (see Map.add_step), stamped with the time at
+            which it was observed
+        """
+        self._steps.put((perf_counter(), speed, omega, np.array(distances)))
+        self.n_submitted += 1
+
+    def request(self):
+        """
+            Asks for a new map build with all the steps queued so far. Doesn't
+            wait for it: requests made during a build are served by a single
+            build right after it.
+        """
+        self.check()
+        self._requested.set()
+
+    def check(self):
+        """
+            Raises the error that stopped the worker, if any
+        """
+        if self._error is not None:
+            raise RuntimeError("SLAM worker failed") from self._error
+
+    def close(self, timeout: Optional[float] = None):
+        """
+            Builds the map with all the queued steps and stops the worker.
+            A snapshot is always published, even when the worker was never
+            started.
+        """
+        if self.running:
+            self._closing.set()
+            self._requested.set()
+            self._thread.join(timeout)
+        self.check()
+
+        # the worker's thread is done with the map: build it here
+        if self.snapshot is None and not self.running:
+            self._build()
+
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            logger.info(
+                f"SLAM worker: {len(latencies)} steps, latency "
+                f"mean {latencies.mean():.1f}ms, "
+                f"95th percentile {np.percentile(latencies, 95):.1f}ms, "
+                f"max {latencies.max():.1f}ms"
+            )
+
+    def _run(self):
+        try:
+            while True:
+                self._requested.wait()
+                self._requested.clear()
+                closing = self._closing.is_set()
+                self._build()
+                if closing:
+                    return
+        except BaseException as err:
+            self._error = err
+            logger.exception("SLAM worker failed")
+
+    def _build(self):
+        """
+            Adds the queued steps to the map, builds it and the planner and
+            publishes them as a new snapshot
+        """
+        observed: List[float] = []
+        while True:
+            try:
+                stamp, speed, omega, distances = self._steps.get_nowait()
+            except Empty:
+                break
+            observed.append(stamp)
+            self.map.add_step(speed, omega, distances)
+
+        if not observed and self.snapshot is not None:
+            return
+
+        self.map.build()
+        cells, values = self.map.grid_cells()
+        planner = Planner(rng=self.planner_rng)
+        planner.build(
+            cells, values, self.map.costmap, self.map.confidence_threshold
+        )
+
+        trajectory = self.map.agent_trajectory
+        grid, origin = self.map.grid_array()
+        published = perf_counter()
+        self.snapshot = Snapshot(
+            step=self.map.time,
+            trajectory=_frozen(
+                np.column_stack(
+                    [trajectory["x"], trajectory["y"], trajectory["theta"]]
+                )
+            ),
+            cells=_frozen(cells),
+            values=_frozen(values),
+            confidence=_frozen(
+                classify(values, self.map.confidence_threshold)
+            ),
+            grid=_frozen(grid),
+            origin=origin,
+            planner=planner,
+            costmap=self.map.costmap.copy(),
+            latency=published - observed[-1] if observed else 0,
+            published=published,
+        )
+        self.latencies.extend(published - stamp for stamp in observed)
@@ -0,0 +1,238 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+import numpy as np
+
+from slam.environment import Environment, Seed
+from slam.geometry import Point, Vector
+from slam.obstacle import Obstacle
+from slam.plot_utils import BACKGROUND_COLOR
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+# marks the seed sequences spawned for tiles, to keep them apart from the
+# ones spawned for the environment's and agents' random numbers generators
+_TILE_SEED_KEY: int = 2 ** 31
+
+
+def _zigzag(n: int) -> int:
+    """
+        Maps ints to non-negative ints (0, -1, 1, -2, 2... -> 0, 1, 2, 3, 4...)
+    """
+    return 2 * n if n >= 0 else -2 * n - 1
+
+
+class ChunkedWorld(Environment):
+    """
+        An unbounded world, procedurally generated one square tile at the time.
+
+        Each tile is split in cells x cells cells and each cell contains at most
+        one obstacle that fits entirely in it, so obstacles never overlap.
+        A tile's obstacles only depend on the world's seed and on the tile's
+        index, so tiles can be dropped when far from the agent and generated
+        again identical when the agent comes back. The tiles act as the spatial
+        index for the loaded obstacles.
+    """
+
+    def __init__(
+        self,
+        tile_size: float = 50,
+        cells: int = 3,
+        density: float = 0.5,
+        keep_distance: float = 100,
+        seed: Seed = None,
+    ):
+        self.tile_size = tile_size
+        self.cells = cells
+        self.density = density  # probability that a cell has an obstacle
+        self.keep_distance = keep_distance  # tiles further away are unloaded
+
+        # the world has no edges
+        self.width = np.inf
+        self.height = np.inf
+        self.walls: List[Obstacle] = []
+
+        self.seed_sequence = (
+            seed
+            if isinstance(seed, np.random.SeedSequence)
+            else np.random.SeedSequence(seed)
+        )
+        self.rng = self.spawn_rng()
+
+        self.tiles: Dict[Tuple[int, int], List[Obstacle]] = dict()
+        self.obstacles: List[Obstacle] = []
+        self.load_around(Point(0, 0), 0)
+
+    # ---------------------------------- tiles ----------------------------------- #
+
+    def tile_index(self, point: Union[Vector, Point]) -> Tuple[int, int]:
+        return (
+            int(np.floor(point.x / self.tile_size)),
+            int(np.floor(point.y / self.tile_size)),
+        )
+
+    def _tiles_around(
+        self, point: Union[Vector, Point], radius: float
+    ) -> Iterator[Tuple[int, int]]:
+        """
+            Iterates over the index of tiles overlapping a square of side
+            2 * radius centered on a point
+        """
+        i0, j0 = self.tile_index(Point(point.x - radius, point.y - radius))
+        i1, j1 = self.tile_index(Point(point.x + radius, point.y + radius))
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield i, j
+
+    def generate_tile(self, i: int, j: int) -> List[Obstacle]:
+        """
+            Generates the obstacles of a tile
+        """
+        rng = np.random.default_rng(
+            np.random.SeedSequence(
+                self.seed_sequence.entropy,
+                spawn_key=self.seed_sequence.spawn_key
+                + (_TILE_SEED_KEY, _zigzag(i), _zigzag(j)),
+            )
+        )
+
+        cell_size = self.tile_size / self.cells
+        margin = cell_size * 0.05
+        obstacles: List[Obstacle] = []
+        for ci in range(self.cells):
+            for cj in range(self.cells):
+                if rng.random() > self.density:
+                    continue
+
+                # size such that the obstacle fits in the cell at any angle
+                max_diagonal = cell_size - 2 * margin
+                width = rng.uniform(0.3, 0.9) * max_diagonal
+                height = rng.uniform(0.1, 0.4) * np.sqrt(
+                    max_diagonal ** 2 - width ** 2
+                )
+                angle = rng.uniform(0, 180)
+                radius = np.sqrt(width ** 2 + height ** 2) / 2
+
+                # place the obstacle's center so that it's within the cell
+                cx = (i * self.cells + ci) * cell_size + rng.uniform(
+                    margin + radius, cell_size - margin - radius
+                )
+                cy = (j * self.cells + cj) * cell_size + rng.uniform(
+                    margin + radius, cell_size - margin - radius
+                )
+                corner = Vector(cx, cy) - Vector(width / 2, height / 2).rotate(
+                    angle
+                )
+
+                obstacles.append(
+                    Obstacle(
+                        (corner.x, corner.y),
+                        angle,
+                        width,
+                        height,
+                        name=f"{i},{j}-{len(obstacles)}",
+                        txt_size=6,
+                    )
+                )
+        return obstacles
+
+    def load_around(self, point: Union[Vector, Point], radius: float):
+        """
+            Loads the tiles within a distance from a point and unloads those
+            further than keep_distance from it.
+        """
+        changed = False
+        for idx in self._tiles_around(point, radius):
+            if idx not in self.tiles:
+                self.tiles[idx] = self.generate_tile(*idx)
+                changed = True
+
+        # unload far tiles
+        keep = set(self._tiles_around(point, max(radius, self.keep_distance)))
+        for idx in list(self.tiles.keys()):
+            if idx not in keep:
+                del self.tiles[idx]
+                changed = True
+
+        if changed:
+            self.obstacles = [
+                obstacle
+                for tile_obstacles in self.tiles.values()
+                for obstacle in tile_obstacles
+            ]
+
+    # ------------------------------- environment -------------------------------- #
+
+    def obstacles_near(
+        self, point: Union[Vector, Point], radius: float
+    ) -> List[Obstacle]:
+        """
+            Returns the obstacles of the tiles within a distance from a point,
+            loading them if necessary.
+        """
+        self.load_around(point, radius)
+        return [
+            obstacle
+            for idx in self._tiles_around(point, radius)
+            for obstacle in self.tiles[idx]
+        ]
+
+    def out_of_bounds(self, point: Union[Vector, Point]) -> bool:
+        return False
+
+    def random_point(
+        self,
+        center: Optional[Point] = None,
+        radius: Optional[float] = None,
+        max_attempts: int = 10000,
+    ) -> Point:
+        """
+            Returns a random point that is not in an obstacle, within
+            a distance (default: one tile) from a center point
+        """
+        center = center or Point(self.tile_size / 2, self.tile_size / 2)
+        radius = radius or self.tile_size / 2
+        for attempt in range(max_attempts):
+            point = Point(
+                center.x + self.rng.uniform(-radius, radius),
+                center.y + self.rng.uniform(-radius, radius),
+            )
+            if not self.is_point_in_obstacle(point):
+                return point
+        raise ValueError(
+            f"Could not find a point outside of obstacles in {max_attempts} attempts"
+        )
+
+    def draw(self, ax: Optional["plt.Axes"] = None) -> "plt.Axes":
+        """
+            Draws the loaded tiles and their obstacles
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Rectangle
+
+        ax = ax or plt.subplots(figsize=(9, 9))[1]
+        ax.axis("off")
+
+        for (i, j) in self.tiles.keys():
+            ax.add_artist(
+                Rectangle(
+                    (i * self.tile_size, j * self.tile_size),
+                    self.tile_size,
+                    self.tile_size,
+                    facecolor=BACKGROUND_COLOR,
+                    edgecolor=[0.8, 0.8, 0.8],
+                    lw=1,
+                    zorder=-100,
+                )
+            )
+
+        for obstacle in self.obstacles:
+            obstacle.draw(ax)
+
+        tiles = np.array(list(self.tiles.keys()))
+        (x0, y0), (x1, y1) = (
+            tiles.min(axis=0) * self.tile_size,
+            (tiles.max(axis=0) + 1) * self.tile_size,
+        )
+        ax.set(xlim=(x0, x1), ylim=(y0, y1))
+        ax.set_aspect("equal")
+        return ax
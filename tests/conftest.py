@@ -0,0 +1,19 @@
+import pytest
+
+from slam import Agent, Environment
+
+N_STEPS: int = 300
+
+
+@pytest.fixture(scope="session")
+def recorded_steps() -> list:
+    """
+        The (speed, omega, lidar distances) of each step of a short run,
+        to build maps from the same steps
+    """
+    agent = Agent(Environment(seed=0), x=20, y=10)
+    steps = []
+    for _ in range(N_STEPS):
+        agent.update()
+        steps.append((*agent.odometry, agent.lidar.distances.copy()))
+    return steps
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from slam import Agent, Environment
+
+N_STEPS: int = 400
+
+
+def make_agent(**kwargs) -> Agent:
+    return Agent(Environment(seed=0), x=20, y=10, **kwargs)
+
+
+@pytest.mark.parametrize("odometry_noise", [(0, 0), (0.1, 2)])
+def test_run_matches_updating_each_step(odometry_noise):
+    stepped = make_agent(odometry_noise=odometry_noise)
+    for _ in range(N_STEPS):
+        stepped.update()
+    batched = make_agent(odometry_noise=odometry_noise)
+    batched.run(N_STEPS)
+
+    assert batched.n_time_steps == stepped.n_time_steps == N_STEPS
+    for name in ("x", "y"):
+        assert np.array_equal(
+            batched.trajectory[name], stepped.trajectory[name]
+        )
+        assert np.array_equal(
+            batched.map.agent_trajectory[name],
+            stepped.map.agent_trajectory[name],
+        )
+    assert batched.routine_name == stepped.routine_name
+    assert np.array_equal(
+        batched.map.map_gaussians.rows, stepped.map.map_gaussians.rows
+    )
+    assert batched.rng.bit_generator.state == stepped.rng.bit_generator.state
+
+
+def test_run_without_fast_forward(monkeypatch):
+    monkeypatch.setattr(Agent, "fast_forward", False)
+    agent = make_agent()
+    agent.run(50)
+    assert agent.n_time_steps == 50
+    assert len(agent.trajectory["x"]) == 51
+
+
+def test_close_before_the_first_build():
+    agent = make_agent(asynchronous=True)
+    agent.close()
+    assert agent.worker is None
+    agent.close()  # already closed
+
+
+def test_close_builds_all_steps():
+    agent = make_agent(asynchronous=True)
+    agent.run(60)
+    agent.close()
+    assert len(agent.map.agent_trajectory["x"]) == 61
+    assert len(agent.planner.coordinates)
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from slam.gaussians import DTYPE, GaussianStore, gaussian_keys
+
+
+def observations(rng: np.random.Generator, n: int, step: int = 0) -> tuple:
+    x, y = rng.uniform(0, 10, n), rng.uniform(0, 10, n)
+    mean = rng.choice([-1.0, 1.0], n)
+    std = np.ones(n)
+    distance, angle_delta = rng.uniform(0, 5, n), np.zeros(n)
+    steps = np.full(n, step)
+    return x, y, mean, std, distance, angle_delta, steps
+
+
+def test_merges_observations_of_the_same_cell():
+    store = GaussianStore()
+    store.add(
+        [0.1, 0.3, 5],
+        [0, 0.2, 5],
+        [1, 1, 1],
+        [1, 1, 1],
+        [1, 2, 3],
+        [0, 0, 0],
+        [0, 0, 0],
+    )
+
+    assert len(store) == 2
+    row = store.rows[store.rows["key"] == gaussian_keys(0, 0, 1)][0]
+    assert row["x"] == pytest.approx(0.2)
+    assert row["y"] == pytest.approx(0.1)
+    assert row["weight"] == 2
+    assert row["distance"] == 2  # of the last observation
+    assert row["order"] == 0
+
+
+def test_free_and_occupied_are_kept_apart():
+    store = GaussianStore()
+    store.add([0, 0], [0, 0], [1, -1], [1, 1], [1, 1], [0, 0], [0, 0])
+    assert len(store) == 2
+
+
+def test_adding_in_batches_matches_adding_at_once():
+    rng = np.random.default_rng(0)
+    batches = [observations(rng, 200, step) for step in range(5)]
+
+    at_once = GaussianStore()
+    at_once.add(*(np.concatenate(values) for values in zip(*batches)))
+    in_batches = GaussianStore()
+    for batch in batches:
+        in_batches.add(*batch)
+
+    assert np.array_equal(at_once.rows["key"], in_batches.rows["key"])
+    assert np.array_equal(at_once.rows["order"], in_batches.rows["order"])
+    for name in ("x", "y", "mean", "std", "weight", "seen"):
+        assert np.allclose(at_once.rows[name], in_batches.rows[name])
+    assert at_once.n_observed == in_batches.n_observed == 1000
+
+
+def test_added_again_with_their_order():
+    rng = np.random.default_rng(1)
+    batch = observations(rng, 100)
+    store = GaussianStore()
+    store.add(*batch)
+    expected = store.rows.copy()
+
+    # remove some cells and add their observations again
+    keys = np.unique(gaussian_keys(*batch[:3]))[::3]
+    store.remove_keys(keys)
+    again = np.isin(gaussian_keys(*batch[:3]), keys)
+    store.add(*(values[again] for values in batch), np.flatnonzero(again))
+
+    assert np.array_equal(store.rows["key"], expected["key"])
+    assert np.array_equal(store.rows["order"], expected["order"])
+    assert np.allclose(store.rows["x"], expected["x"])
+    assert store.n_observed == 100
+
+
+def test_evicts_beyond_max_gaussians():
+    store = GaussianStore(max_gaussians=3)
+    for step in range(5):
+        store.add([step * 2], [0], [1], [1], [1], [0], [step])
+    assert len(store) == 3
+    assert sorted(store.rows["seen"]) == [2, 3, 4]
+
+    # observed again: not the least recently seen anymore
+    store.add([4], [0], [1], [1], [1], [0], [5])
+    store.add([20], [0], [1], [1], [1], [0], [6])
+    assert sorted(store.rows["seen"]) == [4, 5, 6]
+
+
+def test_evicts_the_oldest_with_age_eviction():
+    store = GaussianStore(max_gaussians=2, eviction="age")
+    for step in range(3):
+        store.add([step * 2], [0], [1], [1], [1], [0], [step])
+    store.add([2], [0], [1], [1], [1], [0], [3])  # seen again, still old
+    store.add([10], [0], [1], [1], [1], [0], [4])
+    assert sorted(store.rows["x"]) == [4, 10]
+
+
+def test_capacity_from_max_bytes():
+    store = GaussianStore(max_bytes=10 * DTYPE.itemsize)
+    assert store.capacity == 10
+    store.add(*observations(np.random.default_rng(2), 500))
+    assert len(store) == 10
+    assert store.nbytes <= store.max_bytes
+
+    assert GaussianStore(max_gaussians=5, max_bytes=None).capacity == 5
+    assert GaussianStore(max_bytes=None).capacity is None
+
+
+def test_decay_and_max_age():
+    store = GaussianStore(decay=0.5, min_weight=0.2)
+    store.add([0], [0], [1], [1], [1], [0], [0])
+    store.add([5], [0], [1], [1], [1], [0], [2])
+    assert store.weights().tolist() == [0.25, 1]
+    store.add([10], [0], [1], [1], [1], [0], [3])
+    assert sorted(store.rows["x"]) == [5, 10]
+
+    store = GaussianStore(max_age=2)
+    for step in range(5):
+        store.add([step * 2], [0], [1], [1], [1], [0], [step])
+    assert sorted(store.rows["seen"]) == [2, 3, 4]
+
+
+def test_unknown_eviction():
+    with pytest.raises(ValueError):
+        GaussianStore(eviction="random")
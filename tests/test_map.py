@@ -0,0 +1,134 @@
+import numpy as np
+
+from slam import Agent, Environment
+from slam.gaussians import GaussianStore
+from slam.map import Map
+
+BUILD_EVERY: int = 25
+
+
+class FakePoseGraph:
+    """
+        Stands in for a PoseGraph: optimizing returns the given corrected
+        poses once a loop is pending
+    """
+
+    def __init__(self):
+        self.pending_loops = 0
+        self.correction = (np.zeros(0, dtype=int), np.zeros((0, 3)))
+
+    def add(self, *args):
+        pass
+
+    def optimize(self):
+        self.pending_loops = 0
+        return self.correction
+
+
+def make_agent() -> Agent:
+    # only its lidar and height are used by the maps built from steps
+    return Agent(Environment(seed=0), x=20, y=10)
+
+
+def build(_map: Map, steps: list, on_build=None) -> Map:
+    for n, (speed, omega, distances) in enumerate(steps, start=1):
+        _map.add_step(speed, omega, distances)
+        if n % BUILD_EVERY == 0:
+            if on_build is not None:
+                on_build(n)
+            _map.build()
+    return _map
+
+
+def assert_same_grid(a: Map, b: Map):
+    xy_a, values_a = a.grid_cells()
+    xy_b, values_b = b.grid_cells()
+    assert np.array_equal(xy_a, xy_b)
+    assert np.allclose(values_a, values_b)
+
+
+def test_incremental_grid_matches_a_full_splat(recorded_steps):
+    agent = make_agent()
+    incremental = build(Map(agent), recorded_steps)
+
+    # splat all the final gaussians in an empty grid at once
+    full = Map(agent)
+    full.map_gaussians = incremental.map_gaussians
+    full.get_grid_map(*full._changed_gaussians())
+
+    assert_same_grid(incremental, full)
+
+
+def test_loop_closure_matches_building_with_the_corrected_poses(
+    recorded_steps,
+):
+    agent = make_agent()
+    rng = np.random.default_rng(1)
+    trajectory = build(Map(agent), recorded_steps).agent_trajectory
+    poses = np.column_stack([trajectory[k] for k in ("x", "y", "theta")])
+
+    # correct the poses of some steps when building at step 200
+    pose_graph = FakePoseGraph()
+    corrected = np.arange(40, 180)
+    pose_graph_poses = poses[corrected + 1] + rng.normal(
+        0, [3, 3, 20], (len(corrected), 3)
+    )
+    pose_graph_poses[:, 2] %= 360
+
+    def close_loop(step: int):
+        if step == 200:
+            pose_graph.pending_loops = 1
+            pose_graph.correction = (corrected, pose_graph_poses)
+
+    closed = build(
+        Map(agent, pose_graph=pose_graph), recorded_steps, close_loop
+    )
+
+    # reference: every build uses the corrected poses from the start
+    class CorrectedMap(Map):
+        def get_agent_trajectory(self):
+            super().get_agent_trajectory()
+            n = len(self.agent_trajectory["x"])
+            for name in ("x", "y", "theta"):
+                self.agent_trajectory[name] = list(
+                    closed.agent_trajectory[name][:n]
+                )
+
+    reference = build(
+        CorrectedMap(agent, pose_graph=FakePoseGraph()), recorded_steps
+    )
+
+    a, b = closed.map_gaussians.rows, reference.map_gaussians.rows
+    assert np.array_equal(a["key"], b["key"])
+    assert np.array_equal(a["order"], b["order"])
+    for name in ("x", "y", "mean", "std", "weight", "seen", "owner"):
+        assert np.allclose(a[name], b[name])
+    assert_same_grid(closed, reference)
+
+
+def test_projected_steps_are_bounded(recorded_steps, monkeypatch):
+    monkeypatch.setattr(Map, "max_projected_steps", 60)
+    _map = build(Map(make_agent(), pose_graph=FakePoseGraph()), recorded_steps)
+    assert len(_map.projected_events) == len(_map.projected_order) == 60
+    assert min(_map.projected_events) == len(recorded_steps) - 60
+
+
+def test_bounded_store(recorded_steps):
+    store = GaussianStore(max_gaussians=500)
+    _map = build(Map(make_agent(), gaussians=store), recorded_steps)
+    assert len(_map.map_gaussians) == 500
+
+
+def test_save_load_round_trip(recorded_steps, tmp_path):
+    agent = make_agent()
+    half = len(recorded_steps) // 2
+    original = build(Map(agent), recorded_steps[:half])
+    original.save(tmp_path)
+
+    loaded = Map.load(tmp_path, agent)
+    assert_same_grid(original, loaded)
+
+    # building on top of the loaded map, as on top of the original one
+    build(original, recorded_steps[half:])
+    build(loaded, recorded_steps[half:])
+    assert_same_grid(original, loaded)
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from slam import Agent, Environment
+from slam.map import Map
+from slam.planner import Planner
+
+
+@pytest.fixture(scope="module")
+def planner(recorded_steps) -> Planner:
+    _map = Map(Agent(Environment(seed=0), x=20, y=10))
+    for step in recorded_steps:
+        _map.add_step(*step)
+    _map.build()
+
+    planner = Planner(np.random.default_rng(0))
+    planner.build(*_map.grid_cells())
+    return planner
+
+
+@pytest.fixture(scope="module")
+def reference(planner) -> nx.Graph:
+    """
+        The graph connecting every pair of nodes within distance_threshold,
+        weighted by their distance, as built before the CSR planner
+    """
+    coordinates = planner.coordinates
+    graph = nx.Graph()
+    graph.add_nodes_from(range(len(coordinates)))
+    for i, j in cKDTree(coordinates).query_pairs(planner.distance_threshold):
+        graph.add_edge(
+            i, j, weight=np.linalg.norm(coordinates[i] - coordinates[j])
+        )
+    return graph
+
+
+def at(planner: Planner, node: int) -> SimpleNamespace:
+    # an agent standing on a node
+    return SimpleNamespace(estimated_pose=(*planner.coordinates[node], 0))
+
+
+def test_same_edges(planner, reference):
+    edges = planner.edges_array()
+    assert len(edges) == reference.number_of_edges()
+    assert set(map(tuple, edges.tolist())) == {
+        tuple(sorted(edge)) for edge in reference.edges
+    }
+    assert np.allclose(
+        [planner.graph.edges[edge]["weight"] for edge in reference.edges],
+        [reference.edges[edge]["weight"] for edge in reference.edges],
+    )
+
+
+def test_same_components(planner, reference):
+    components = list(nx.connected_components(reference))
+    assert planner.n_components == len(components)
+    for component in components:
+        assert len(set(planner.components[list(component)])) == 1
+
+
+def test_same_shortest_paths(planner, reference):
+    for source in (0, len(planner.coordinates) // 2):
+        distances, _ = planner.shortest_paths(source)
+        expected = nx.single_source_dijkstra_path_length(reference, source)
+        assert np.isinf(distances).sum() == len(distances) - len(expected)
+        for node, distance in expected.items():
+            assert distances[node] == pytest.approx(distance)
+
+
+def test_plan_route(planner, reference):
+    rng = np.random.default_rng(1)
+    start = int(rng.integers(len(planner.coordinates)))
+    targets = [
+        node
+        for node in nx.node_connected_component(reference, start)
+        if node != start
+    ]
+    for target in rng.choice(targets, 5):
+        route = planner.plan_route(at(planner, start), planner.node(target))
+        path = [node["node_n"] for node in route]
+        assert path[0] == start and path[-1] == target
+        assert nx.path_weight(reference, path, "weight") == pytest.approx(
+            nx.dijkstra_path_length(reference, start, target)
+        )
+
+
+def test_no_route_between_components(planner):
+    if planner.n_components < 2:
+        pytest.skip("the graph is connected")
+    start = 0
+    target = int(
+        np.flatnonzero(planner.components != planner.components[0])[0]
+    )
+    assert not planner.reachable(at(planner, start), planner.node(target))
+    with pytest.raises(ValueError):
+        planner.plan_route(at(planner, start), planner.node(target))
+
+
+def test_save_load_round_trip(planner, tmp_path):
+    planner.save(tmp_path)
+    loaded = Planner.load(tmp_path, np.random.default_rng(0))
+    assert np.array_equal(loaded.coordinates, planner.coordinates)
+    assert (loaded.adjacency != planner.adjacency).nnz == 0
+    assert np.array_equal(loaded.components, planner.components)
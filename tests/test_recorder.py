@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from slam import Agent, Environment, Recorder, Replayer
+from slam.pose_graph import PoseGraph
+
+N_STEPS: int = 200
+
+
+def record(path, n_steps: int = N_STEPS, **kwargs) -> Agent:
+    with Recorder(path, chunk_size=64, **kwargs) as recorder:
+        agent = Agent(Environment(seed=0), x=20, y=10, recorder=recorder)
+        agent.run(n_steps)
+    return agent
+
+
+def test_replay_matches_the_run(tmp_path):
+    agent = record(tmp_path)
+    replayer = Replayer(tmp_path)
+
+    assert len(replayer) == N_STEPS
+    assert len(replayer.chunks) == 4
+    assert np.allclose(replayer.trajectory["x"], agent.trajectory["x"])
+    assert np.allclose(replayer.trajectory["y"], agent.trajectory["y"])
+    assert replayer[-1]["step"] == N_STEPS - 1
+
+    # the agent's map was last built at the last step
+    agent.map.build()
+    replayed = replayer.map_at(N_STEPS - 1)
+    assert np.allclose(
+        replayed.agent_trajectory["x"], agent.map.agent_trajectory["x"]
+    )
+    xy, values = replayed.grid_cells()
+    expected_xy, expected_values = agent.map.grid_cells()
+    assert np.array_equal(xy, expected_xy)
+    assert np.allclose(values, expected_values)
+
+
+def test_replay_up_to_a_step(tmp_path):
+    record(tmp_path)
+    replayer = Replayer(tmp_path)
+    replayed = replayer.map_at(99)
+    assert len(replayed.agent_trajectory["x"]) == 101
+
+    planner = replayer.planner_at(99, np.random.default_rng(0))
+    assert len(planner.coordinates)
+
+
+def test_flushes_after_flush_interval(tmp_path):
+    record(tmp_path, n_steps=10, flush_interval=0)
+    assert len(list(tmp_path.glob("chunk_*.npy"))) == 10
+    assert len(Replayer(tmp_path)) == 10
+
+
+def test_close_is_idempotent(tmp_path):
+    recorder = Recorder(tmp_path, chunk_size=64)
+    agent = Agent(Environment(seed=0), x=20, y=10, recorder=recorder)
+    agent.run(10)
+    recorder.close()
+    recorder.close()
+    assert len(Replayer(tmp_path)) == 10
+
+
+def test_cannot_record_twice_in_a_folder(tmp_path):
+    record(tmp_path, n_steps=5)
+    with pytest.raises(ValueError):
+        Recorder(tmp_path)
+
+
+def test_cannot_replay_with_a_pose_graph(tmp_path):
+    with Recorder(tmp_path) as recorder:
+        agent = Agent(
+            Environment(seed=0),
+            x=20,
+            y=10,
+            recorder=recorder,
+            pose_graph=PoseGraph(),
+        )
+        agent.run(5)
+    with pytest.raises(ValueError):
+        Replayer(tmp_path).map_at(4)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from slam.tiles import TiledGrid
+
+
+def random_cells(rng: np.random.Generator, n: int) -> tuple:
+    x = rng.integers(-100, 100, n)
+    y = rng.integers(-50, 150, n)
+    return x, y, rng.normal(0, 1, n)
+
+
+def dense(x: np.ndarray, y: np.ndarray, values: np.ndarray) -> dict:
+    # the last value written to each cell
+    return {(int(a), int(b)): v for a, b, v in zip(x, y, values)}
+
+
+@pytest.mark.parametrize("max_tiles", [None, 1, 3])
+def test_write_read_round_trip(tmp_path, max_tiles):
+    rng = np.random.default_rng(0)
+    x, y, values = random_cells(rng, 2000)
+    grid = TiledGrid(16, max_tiles=max_tiles, cache_dir=tmp_path)
+    grid.write(x, y, values)
+
+    expected = dense(x, y, values)
+    cells = np.array(list(expected))
+    assert np.array_equal(
+        grid.read(cells[:, 0], cells[:, 1]), list(expected.values())
+    )
+    assert np.isnan(grid.read([1000], [1000])).all()
+
+    xy, known = grid.known()
+    assert dict(zip(map(tuple, xy.tolist()), known)) == expected
+    if max_tiles is not None:
+        assert len(grid.tiles) <= max_tiles
+        assert grid.evicted
+
+
+def test_the_tile_being_used_is_never_evicted(tmp_path):
+    grid = TiledGrid(4, max_tiles=1, cache_dir=tmp_path)
+    grid.write([0, 10, 0], [0, 10, 1], [1.0, 2.0, 3.0])
+    assert grid.read([0, 10, 0], [0, 10, 1]).tolist() == [1, 2, 3]
+    assert len(grid.tiles) == 1
+    assert len(grid) == 2
+
+
+def test_to_array_and_from_array(tmp_path):
+    rng = np.random.default_rng(1)
+    x, y, values = random_cells(rng, 500)
+    grid = TiledGrid(16)
+    grid.write(x, y, values)
+
+    array, (x0, y0) = grid.to_array()
+    expected = dense(x, y, values)
+    for (cx, cy), value in expected.items():
+        assert array[cy - y0, cx - x0] == value
+    assert np.sum(~np.isnan(array)) == len(expected)
+
+    # a grid backed by the array: tiles are copied when first used
+    backed = TiledGrid.from_array(
+        array, (x0, y0), 16, max_tiles=2, cache_dir=tmp_path
+    )
+    assert not backed.tiles
+    cells = np.array(list(expected))
+    assert np.array_equal(
+        backed.read(cells[:, 0], cells[:, 1]), list(expected.values())
+    )
+    xy, known = backed.known()
+    assert dict(zip(map(tuple, xy.tolist()), known)) == expected
+
+
+def test_clear_removes_evicted_tiles(tmp_path):
+    grid = TiledGrid(4, max_tiles=1, cache_dir=tmp_path)
+    grid.write([0, 10, 20], [0, 0, 0], 1.0)
+    assert list(tmp_path.glob("*.npy"))
+    grid.clear()
+    assert not len(grid)
+    assert not list(tmp_path.glob("*.npy"))
+
+
+def test_max_tiles_must_be_positive():
+    with pytest.raises(ValueError):
+        TiledGrid(max_tiles=0)